@@ -0,0 +1,212 @@
+# Benchmarks of the simulator, over the utilization levels and topologies
+# that multiqueue.buildsimulator has presets for
+#
+#   python benchmark.py                  run every preset, and compare with
+#                                        the baselines in BASELINEFILE
+#   python benchmark.py util90 twoqueue  run just these presets
+#   python benchmark.py record [...]     run, and store the results as the
+#                                        new baselines
+#
+# Every preset is a fixed sweep with a fixed master seed, run in a process
+# of its own (so that its peak memory is its own). For each one we report:
+#   eventspersec: events handled per second of wall time
+#   wallperrun:   wall time per run, in seconds
+#   peakrss:      peak resident memory of the process, in kilobytes
+#   calendarmean, calendarmax: packets in flight (i.e. on the event calendar)
+# timed without instrumentation, then counted in a second, instrumented
+# pass. A preset is flagged SLOWER if its eventspersec (or wallperrun) is
+# more than TOLERANCE worse than its baseline. Speed baselines only mean
+# something on the machine that recorded them.
+#
+# The outputs are checked as well: the mean output dispersion at each input
+# dispersion, the fraction of first probes finding the queue empty, and the
+# true utilization of each queue must agree with the baselines to within
+# ZLIMIT standard errors. The check is statistical rather than exact, so
+# that it still holds if the engine draws its random numbers differently
+
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import instrument
+import multiqueue
+import onlinestats
+import sampling
+
+
+BASELINEFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks.json')
+
+SEED = 20051           # Master seed of every preset's sweep
+NUMRUNS = 2000         # Runs per preset
+DISPERSIONS = [0.0, 0.0012, 0.005, 0.02]  # Input dispersions, in turn
+TOLERANCE = 0.15       # Slowdown tolerated before a preset is flagged
+ZLIMIT = 4.0           # Standard errors an output may differ by
+
+
+C = 10000000.0/8.0     # Capacity of the queues, in bytes per second
+
+
+# The cross-traffic rates of the utilization presets of buildsimulator
+
+UTILRATES = [(10, 285.0627), (30, 855.1881), (50, 1425.314),
+             (70, 1995.439), (90, 2565.564), (99, 2822.121)]
+
+
+# A single queue at the given cross-traffic rate, its components drawing
+# from random streams of their own if rngstreams is set
+
+def singlequeue(rate, rngstreams=0):
+    def build():
+        return multiqueue.Simulator(
+            [multiqueue.Queue(0, C)],
+            [multiqueue.PacketGenerator(0, (sampling.INTERNETMIX,()), (random.expovariate,(rate,)), ('QUEUE', 0))],
+            [multiqueue.ProbeGenerator(0, (multiqueue.determ,(1500.0,)), ('QUEUE', 0))],
+            rngstreams=rngstreams)
+    return build
+
+
+# Two queues joined by a wire, each with its own cross traffic at 0.30
+# utilization
+
+def twoqueue():
+    return multiqueue.Simulator(
+        [multiqueue.Queue(0, C, ('WIRE', 0)), multiqueue.Queue(1, C)],
+        [multiqueue.PacketGenerator(0, (sampling.INTERNETMIX,()), (random.expovariate,(855.1881,)), ('QUEUE', 0)),
+         multiqueue.PacketGenerator(1, (sampling.INTERNETMIX,()), (random.expovariate,(855.1881,)), ('QUEUE', 1))],
+        [multiqueue.ProbeGenerator(0, (multiqueue.determ,(1500.0,)), ('QUEUE', 0))],
+        [multiqueue.Wire(0, 0.005, ('QUEUE', 1))])
+
+
+# The probes alone
+
+def noct():
+    return multiqueue.Simulator(
+        [multiqueue.Queue(0, C)], [],
+        [multiqueue.ProbeGenerator(0, (multiqueue.determ,(1500.0,)), ('QUEUE', 0))])
+
+
+# The presets, as (name, builder, whether to use the fast path)
+
+PRESETS = [('util%02d' % util, singlequeue(rate), 0) for util, rate in UTILRATES]
+PRESETS += [('util90-fast', singlequeue(2565.564), 1),
+            ('util90-streams', singlequeue(2565.564, 1), 0),
+            ('twoqueue', twoqueue, 0),
+            ('noct', noct, 0)]
+
+
+# Sweep a simulator over the preset's runs, returning the profiler (if
+# profiled) and the output statistics
+
+def sweep(sim, fastpath, profiled):
+    if profiled:
+        sim.profiler = instrument.Profiler()
+    iterlist = [DISPERSIONS[i % len(DISPERSIONS)] for i in range(0,NUMRUNS)]
+
+    outdisp = {}
+    qempty = onlinestats.Moments()
+    util = [onlinestats.Moments() for queue in sim.queues]
+    for res in multiqueue.runsweep(sim, iterlist, SEED, fastpath=fastpath):
+        key = repr(res.dispersion)
+        if key not in outdisp: outdisp[key] = onlinestats.Moments()
+        outdisp[key].add(res.pktleave[1] - res.pktleave[0])
+        qempty.add(res.pktqempty[0][1][1])
+        for i in range(0,len(util)):
+            util[i].add(res.trueUtilization[i])
+
+    stats = {}
+    for key, m in outdisp.items():
+        stats['outdisp ' + key] = m
+    stats['qempty'] = qempty
+    for i in range(0,len(util)):
+        stats['util %d' % i] = util[i]
+    stats = dict([(name, [m.mean, m.stddev()/m.count**0.5]) for name, m in stats.items()])
+    return sim.profiler, stats
+
+
+# Benchmark one preset in this process, returning its measurements
+
+def runpreset(name):
+    for pname, build, fastpath in PRESETS:
+        if pname == name: break
+    else:
+        raise ValueError('no preset called %s' % name)
+
+    start = time.time()
+    sweep(build(), fastpath, 0)
+    wall = time.time() - start
+
+    prof, stats = sweep(build(), fastpath, 1)
+    summary = prof.summary()
+    return {'eventspersec': summary['events']/wall,
+            'wallperrun': wall/NUMRUNS,
+            'peakrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'calendarmean': summary['calendarmean'],
+            'calendarmax': summary['calendarmax'],
+            'events': summary['events'],
+            'stats': stats}
+
+
+# Compare a preset's measurements with its baseline, returning a list of
+# problems (empty if there are none)
+
+def compare(meas, base):
+    problems = []
+    if meas['events'] and meas['eventspersec'] < base['eventspersec']*(1 - TOLERANCE):
+        problems.append('SLOWER: %.0f events/s, baseline %.0f' % (meas['eventspersec'], base['eventspersec']))
+    elif meas['wallperrun'] > base['wallperrun']*(1 + TOLERANCE):
+        problems.append('SLOWER: %.3g s/run, baseline %.3g' % (meas['wallperrun'], base['wallperrun']))
+    for name, (mean, se) in base['stats'].items():
+        if name not in meas['stats']:
+            problems.append('MISSING: %s' % name)
+            continue
+        newmean, newse = meas['stats'][name]
+        if abs(newmean - mean) > ZLIMIT*(se*se + newse*newse)**0.5 + 1e-12:
+            problems.append('CHANGED: %s = %.6g, baseline %.6g' % (name, newmean, mean))
+    return problems
+
+
+def main(args):
+    if args[:1] == ['--one']:
+        print json.dumps(runpreset(args[1]))
+        return 0
+
+    record = args[:1] == ['record']
+    if record: args = args[1:]
+    names = args or [name for name, build, fastpath in PRESETS]
+
+    try:
+        baselines = json.load(open(BASELINEFILE))
+    except IOError:
+        baselines = {}
+
+    failed = 0
+    print "%-12s %12s %11s %9s %9s %9s" % ('preset', 'events/s', 's/run', 'peak KB', 'inflight', 'max')
+    for name in names:
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--one', name],
+                                 stdout=subprocess.PIPE)
+        meas = json.loads(child.communicate()[0])
+        print "%-12s %12.0f %11.3g %9d %9.2f %9d" % (name, meas['eventspersec'], meas['wallperrun'],
+                                                     meas['peakrss'], meas['calendarmean'], meas['calendarmax'])
+        if record:
+            baselines[name] = meas
+        elif name in baselines:
+            for problem in compare(meas, baselines[name]):
+                print "    " + problem
+                failed = 1
+        else:
+            print "    (no baseline)"
+
+    if record:
+        f = open(BASELINEFILE, 'w')
+        json.dump(baselines, f, indent=1, sort_keys=True)
+        f.write('\n')
+        f.close()
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
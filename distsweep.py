@@ -0,0 +1,341 @@
+# Sweeps spread over worker processes on any number of machines
+#
+# A Coordinator listens on a TCP address for workers. Each worker builds the
+# same topology as the coordinator (from the same config file, or from
+# multiqueue.buildsimulator) and connects, and the sweeps of the coordinator
+# (see multiqueue.runsweep, given coordinator=...) are then handed out to
+# the workers a group of runs at a time: a group is the runs with numbers
+# first to first+n-1, all seeded from the master seed by run number, so
+# the results are those of the same sweep run in one process. The workers
+# send back the RunResults of every group (and the profiler counters, if
+# profiling), and runsweep yields them in order.
+#
+# The messages are Python objects, pickled over multiprocessing.connection,
+# which checks that both ends know the authkey before anything is
+# unpickled. A worker introduces itself with ('hello', key), key being the
+# hash of its topology; a worker whose topology differs from the
+# coordinator's is sent ('refused', reason). Otherwise it is sent
+# ('run', sweep, job, first, dispersions, replications, masterseed,
+# checkpointspacing, fastpath, profile) for each group, answering with
+# ('done', sweep, job, results, counters), until it is sent ('stop',).
+# Trace files count as part of the topology by path, size and modification
+# time, so workers elsewhere should read them from a shared filesystem.
+#
+# Workers ask for a group whenever they are idle, so faster machines simply
+# take more of them. Once there are no groups left to hand out, an idle
+# worker is given a copy of a group still being run elsewhere (that with the
+# fewest copies, up to MAXCOPIES), so that a slow or stuck worker cannot
+# hold up the end of the sweep; whichever copy finishes first counts. The
+# groups of a worker whose connection is lost are handed out again.
+#
+#   python distsweep.py host:port [config.json]
+#
+# runs a worker for the coordinator at host:port, with the topology and
+# authkey of the config file (or of the script settings of multiqueue.py)
+
+import hashlib
+import json
+import multiprocessing
+import multiprocessing.connection
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+import multiqueue
+import resultcache
+
+
+# Number of runs handed to a worker at a time, if runsweep is given no
+# chunksize
+
+CHUNKRUNS = 100
+
+# Most copies of a group that are run at once
+
+MAXCOPIES = 2
+
+
+# Turn "host:port" into an address
+
+def parseaddress(address):
+    host, sep, port = address.rpartition(':')
+    if not sep or not port.isdigit():
+        raise ValueError('the address %r is not of the form host:port' % address)
+    return (host, int(port))
+
+
+# The hash of the topology of sim, which the coordinator and its workers
+# must agree on
+
+def topologykey(sim):
+    return hashlib.sha1(json.dumps(resultcache.describe(sim), sort_keys=True)).hexdigest()
+
+
+# Run as a worker of the coordinator at address (a (host, port) pair), with
+# the simulator sim, until the coordinator stops it or goes away
+
+def work(address, authkey, sim):
+    conn = connect(address, authkey)
+    prof = None
+    try:
+        conn.send(('hello', topologykey(sim)))
+        while 1:
+            msg = conn.recv()
+            if msg[0] == 'refused':
+                print >>sys.stderr, "WORKER refused by the coordinator: %s" % msg[1]
+                return 1
+            if msg[0] != 'run':
+                return 0
+            (sweep, job, first, dispersions, replications, masterseed,
+             checkpointspacing, fastpath, profile) = msg[1:]
+            counters = None
+            if profile:
+                if sim.profiler is None:
+                    import instrument
+                    sim.profiler = instrument.Profiler()
+                prof = sim.profiler
+                prof.clear()
+                prof.interval = 0
+            results = multiqueue.rungroup(sim, first, dispersions, masterseed,
+                                          checkpointspacing, fastpath, replications)
+            if profile:
+                counters = prof.counters()
+            conn.send(('done', sweep, job, results, counters))
+    except (EOFError, IOError, socket.error):
+        # The coordinator has gone away
+        return 0
+    finally:
+        conn.close()
+
+
+# Connect to the coordinator, retrying for a while in case it is still
+# starting up
+
+def connect(address, authkey, tries=30):
+    for i in range(0,tries):
+        try:
+            return multiprocessing.connection.Client(address, authkey=str(authkey))
+        except socket.error:
+            if i == tries-1:
+                raise
+            time.sleep(1.0)
+
+
+# Hands out the sweeps of sim to the workers that connect to address (a
+# (host, port) pair; port 0 picks a free port, and self.address is the one
+# listened on). numworkers workers are forked on this machine, sharing sim;
+# others can connect from anywhere with the same authkey
+
+class Coordinator(object):
+
+    def __init__(self, sim, address, authkey, numworkers=0):
+        if not authkey:
+            raise ValueError('a coordinator needs an authkey')
+        authkey = str(authkey)
+        self.sim = sim
+        self.authkey = authkey
+        self.key = topologykey(sim)
+        self.listener = multiprocessing.connection.Listener(address, authkey=authkey)
+        self.address = self.listener.address
+
+        self._cond = threading.Condition()
+        self._closed = 0
+        self._sweep = 0         # number of the current sweep
+        self._jobs = []         # the groups of the current sweep, as
+                                # (first, dispersions, replications)
+        self._settings = None   # its masterseed, checkpointspacing, fastpath
+                                # and whether to profile
+        self._pending = deque() # jobs not yet handed out
+        self._running = {}      # copies running of each unfinished job
+                                # that has been handed out
+        self._results = {}      # finished jobs not yet yielded
+        self._threads = {}      # the thread talking to each worker, by its
+                                # connection
+
+        # The local workers are forked before any threads are started
+        self._local = []
+        for i in range(0,numworkers):
+            proc = multiprocessing.Process(target=work, args=(self.address, authkey, sim))
+            proc.daemon = True
+            proc.start()
+            self._local.append(proc)
+
+        print >>sys.stderr, "COORDINATOR listening on %s:%d" % self.address
+        self._acceptor = threading.Thread(target=self._accept)
+        self._acceptor.daemon = True
+        self._acceptor.start()
+
+    def _accept(self):
+        while 1:
+            try:
+                conn = self.listener.accept()
+            except (IOError, EOFError, socket.error, multiprocessing.AuthenticationError):
+                # A connection that failed to authenticate
+                conn = None
+            self._cond.acquire()
+            try:
+                if self._closed:
+                    if conn is not None: conn.close()
+                    return
+                if conn is not None:
+                    thread = threading.Thread(target=self._serve, args=(conn,))
+                    thread.daemon = True
+                    self._threads[conn] = thread
+                    thread.start()
+            finally:
+                self._cond.release()
+
+    # Talk to one worker, handing it jobs until the coordinator is closed
+    def _serve(self, conn):
+        job = None
+        try:
+            msg = conn.recv()
+            if msg[0] != 'hello' or msg[1] != self.key:
+                conn.send(('refused', 'its topology differs from that of the coordinator'))
+                return
+            while 1:
+                job = self._nextjob()
+                if job is None:
+                    conn.send(('stop',))
+                    return
+                sweep, i, (first, dispersions, replications), settings = job
+                conn.send(('run', sweep, i, first, dispersions, replications) + settings)
+                msg = conn.recv()
+                self._finish(sweep, i, msg[3], msg[4])
+                job = None
+        except (EOFError, IOError, socket.error):
+            if job is not None:
+                self._lost(job[0], job[1])
+        finally:
+            self._cond.acquire()
+            del self._threads[conn]
+            self._cond.release()
+            conn.close()
+
+    # The next job to hand a worker, as (sweep, job number, group,
+    # settings), waiting until there is one; None once closed
+    def _nextjob(self):
+        self._cond.acquire()
+        try:
+            while not self._closed:
+                if self._pending:
+                    i = self._pending.popleft()
+                else:
+                    i = None
+                    for j in self._running:
+                        if self._running[j] < MAXCOPIES and (i is None or self._running[j] < self._running[i]):
+                            i = j
+                    if i is None:
+                        self._cond.wait(1.0)
+                        continue
+                self._running[i] = self._running.get(i, 0) + 1
+                return self._sweep, i, self._jobs[i], self._settings
+            return None
+        finally:
+            self._cond.release()
+
+    # A worker has finished job i of the given sweep
+    def _finish(self, sweep, i, results, counters):
+        self._cond.acquire()
+        try:
+            if sweep == self._sweep and i in self._running:
+                del self._running[i]
+                self._results[i] = (results, counters)
+                self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    # A worker running job i of the given sweep has been lost
+    def _lost(self, sweep, i):
+        self._cond.acquire()
+        try:
+            if sweep == self._sweep and i in self._running:
+                self._running[i] -= 1
+                if self._running[i] == 0:
+                    del self._running[i]
+                    self._pending.appendleft(i)
+                self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    # Run the groups of a sweep, given as (first, dispersions, replications)
+    # as in runsweep, yielding (results, counters) for each in turn
+    def run(self, groups, masterseed, checkpointspacing, fastpath):
+        self._cond.acquire()
+        try:
+            self._sweep += 1
+            self._jobs = list(groups)
+            self._settings = (masterseed, checkpointspacing, fastpath,
+                              self.sim.profiler is not None)
+            self._pending = deque(range(0,len(self._jobs)))
+            self._running = {}
+            self._results = {}
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+        try:
+            for i in range(0,len(self._jobs)):
+                self._cond.acquire()
+                try:
+                    while i not in self._results:
+                        self._cond.wait(1.0)
+                    done = self._results.pop(i)
+                finally:
+                    self._cond.release()
+                yield done
+        finally:
+            self._cond.acquire()
+            self._pending = deque()
+            self._running = {}
+            self._results = {}
+            self._cond.release()
+
+    # Stop the workers and stop listening. Idle workers are sent ('stop',);
+    # the connections of those still running a job (a copy of one that
+    # finished elsewhere) are shut down, which stops them too
+    def close(self):
+        self._cond.acquire()
+        self._closed = 1
+        self._cond.notifyAll()
+        self._cond.release()
+
+        # Wake the acceptor with a connection of our own
+        try:
+            socket.create_connection(self.address).close()
+        except socket.error:
+            pass
+        self._acceptor.join()
+        self.listener.close()
+
+        self._cond.acquire()
+        threads = self._threads.items()
+        self._cond.release()
+        for conn, thread in threads:
+            thread.join(1.0)
+            if thread.isAlive():
+                try:
+                    socket.fromfd(conn.fileno(), socket.AF_INET, socket.SOCK_STREAM).shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+                thread.join()
+        for proc in self._local:
+            proc.join()
+
+
+def main(args):
+    if len(args) not in (1, 2):
+        print >>sys.stderr, "usage: python distsweep.py host:port [config.json]"
+        return 1
+    if len(args) == 2:
+        import simconfig
+        sim, settings = simconfig.load(args[1])
+    else:
+        sim, settings = multiqueue.buildsimulator(), multiqueue.scriptsettings()
+    return work(parseaddress(args[0]), settings['authkey'], sim)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,131 @@
+# Instrumentation of the event loop, to see where the time of a sweep goes.
+#
+# A Profiler is attached to a simulator with sim.profiler = Profiler(); the
+# event loop then counts its events, samples the size of the event calendar
+# and times the three phases of every event:
+#   generate: creating the next cross-traffic packets
+#   select:   taking the next event off the calendar
+#   move:     handling the packet's departure and arrival
+# Each run (or fast-path batch) is timed too. With no profiler attached
+# (the default), all the event loop does is test that sim.profiler is None
+# a few times per event.
+# Progress is reported every "interval" seconds, and summary() gives the
+# totals as a dictionary, ready to be written out as JSON
+
+import json
+import sys
+import time
+
+import onlinestats
+
+
+# The phases of an event, in the order of Profiler.phasetimes
+
+PHASES = ('generate', 'select', 'move')
+
+
+class Profiler(object):
+
+    # interval: seconds between progress reports (0 for none)
+    # out: where the reports go (stderr by default)
+    def __init__(self, interval=0.0, out=None):
+        self.interval = interval
+        self.out = out or sys.stderr
+        self.timer = time.time
+        self.clear()
+        self.started = self.timer()
+        self.lastreport = self.started
+
+    # Zero all the counters (e.g. in a worker process, before each group)
+    def clear(self):
+        self.runs = 0
+        self.events = 0
+        self.eventtypes = {}            # events by the type of component
+                                        # the packet was leaving
+        self.ctpackets = 0              # cross-traffic packets created
+        self.heapsum = 0                # calendar sizes, summed over events
+        self.heapmax = 0
+        self.phasetimes = [0.0]*len(PHASES)
+        self.runtimes = onlinestats.Moments()
+        self.runstart = None
+        self.lastevents = 0             # events at the last report
+
+    # Bracket a run, or a batch of numruns runs solved at once
+    def startrun(self):
+        self.runstart = self.timer()
+
+    def endrun(self, numruns=1):
+        now = self.timer()
+        if self.runstart is not None:
+            elapsed = now - self.runstart
+            for i in range(0,numruns):
+                self.runtimes.add(elapsed/numruns)
+            self.runstart = None
+        self.runs += numruns
+        if self.interval > 0 and now - self.lastreport >= self.interval:
+            self.report(now)
+
+    # Write a progress line: runs and events so far, and the events per
+    # second since the last report and overall
+    def report(self, now=None):
+        if now is None: now = self.timer()
+        wall = max(now - self.started, 1e-9)
+        recent = (self.events - self.lastevents)/max(now - self.lastreport, 1e-9)
+        heapmean = self.heapsum/float(max(self.events, 1))
+        self.out.write("PROFILE %.1fs: %d runs, %d events, %.0f events/s (%.0f now), calendar %.1f avg %d max\n"
+                       % (wall, self.runs, self.events, self.events/wall, recent, heapmean, self.heapmax))
+        self.lastreport = now
+        self.lastevents = self.events
+
+    # The counters, as a dictionary that can be pickled (e.g. to send back
+    # from a worker process) and given to merge()
+    def counters(self):
+        return {'runs': self.runs, 'events': self.events,
+                'eventtypes': dict(self.eventtypes),
+                'ctpackets': self.ctpackets, 'heapsum': self.heapsum,
+                'heapmax': self.heapmax, 'phasetimes': self.phasetimes[:],
+                'runtimes': self.runtimes}
+
+    # Add the counters of another profiler (see counters()) to these
+    def merge(self, counters):
+        self.runs += counters['runs']
+        self.events += counters['events']
+        for kind, count in counters['eventtypes'].items():
+            self.eventtypes[kind] = self.eventtypes.get(kind, 0) + count
+        self.ctpackets += counters['ctpackets']
+        self.heapsum += counters['heapsum']
+        self.heapmax = max(self.heapmax, counters['heapmax'])
+        for i in range(0,len(PHASES)):
+            self.phasetimes[i] += counters['phasetimes'][i]
+        self.runtimes.merge(counters['runtimes'])
+        now = self.timer()
+        if self.interval > 0 and now - self.lastreport >= self.interval:
+            self.report(now)
+
+    # The totals, as a dictionary
+    def summary(self):
+        wall = max(self.timer() - self.started, 1e-9)
+        looptime = sum(self.phasetimes)
+        rt = self.runtimes
+        return {'wall': wall,
+                'runs': self.runs,
+                'runspersec': self.runs/wall,
+                'events': self.events,
+                'eventspersec': self.events/wall,
+                'eventsperrun': self.events/float(max(self.runs, 1)),
+                'eventtypes': self.eventtypes,
+                'ctpackets': self.ctpackets,
+                'calendarmean': self.heapsum/float(max(self.events, 1)),
+                'calendarmax': self.heapmax,
+                'phasetimes': dict(zip(PHASES, self.phasetimes)),
+                'phasefractions': dict([(PHASES[i], self.phasetimes[i]/max(looptime, 1e-9))
+                                        for i in range(0,len(PHASES))]),
+                'runtime': {'mean': rt.mean, 'sd': rt.stddev(),
+                            'min': rt.min, 'max': rt.max}}
+
+    # Write the summary to the file "path" as JSON
+    def writesummary(self, path):
+        f = open(path, 'w')
+        json.dump(self.summary(), f, indent=1, sort_keys=True)
+        f.write('\n')
+        f.close()
@@ -0,0 +1,278 @@
+# Vectorized fast path for the topology most sweeps use: a single FIFO
+# queue, fed by cross-traffic generators and one probe generator, with
+# nothing after it.
+#
+# Such a queue can be solved exactly with Lindley's recursion. With A the
+# arrival times in FIFO order, S the transmission times and D the departure
+# times,
+#   D[n] = max(A[n], D[n-1]) + S[n]
+# which unrolls to
+#   D = C + cummax(A - C + S)
+# C being the cumulative sum of S. A whole batch of runs can then be solved
+# with a handful of NumPy operations on (runs x packets) arrays, rather than
+# one event at a time. The results match the event loop's statistically,
+# but not run for run, since the random numbers are drawn by NumPy.
+#
+# NumPy is optional: without it, supports() is always false and sweeps use
+# the event loop
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import random
+
+import multiqueue
+import sampling
+
+
+# Upper bound on the number of (run, packet) cells solved at once. Large
+# dispersions need long cross-traffic sequences, so the batch is cut into
+# fewer runs at a time to keep memory bounded
+
+MAXCELLS = 4000000
+
+# Number of draws used to estimate the mean of an interarrival PDF, when
+# sizing the chunks of a batch
+
+MEANDRAWS = 10000
+
+
+# Turn a (function, args) PDF into a function drawing an array of the given
+# shape from a NumPy RandomState. Returns None for PDFs it doesn't know
+
+def sampler(pdf):
+    func, args = pdf
+    if func is multiqueue.determ:
+        val = float(args[0])
+        return lambda rs, shape: numpy.full(shape, val)
+    if func is multiqueue.internetmix:
+        return sampling.INTERNETMIX.sample
+    if isinstance(func, sampling.BlockSampler) and not args:
+        return func.sample
+    if isinstance(getattr(func, '__self__', None), random.Random):
+        if func.__name__ == 'expovariate':
+            scale = 1.0/args[0]
+            return lambda rs, shape: rs.exponential(scale, shape)
+        if func.__name__ == 'uniform':
+            a, b = args
+            return lambda rs, shape: rs.uniform(a, b, shape)
+    return None
+
+
+# Whether runbatch can stand in for the event loop of sim: one queue with
+# no output destination, every generator feeding it, one probe generator,
+# only known PDFs, and no delay recording, queue statistics, random streams
+# of the components (runbatch draws everything from NumPy itself), debug
+# output, tracer or ENDTIME
+
+def supports(sim):
+    if numpy is None:
+        return False
+    if sim.recdelays or sim.queuestats or sim.rngstreams or sim.endtime != -1:
+        return False
+    if sim.tracer is not None:
+        return False
+    if len(sim.queues) != 1 or len(sim.probegens) != 1:
+        return False
+    queue = sim.queues[0]
+    if queue.outputdest != -1 or queue.debug:
+        return False
+    for gen in sim.pktgens + sim.probegens:
+        if gen.outputdest != ('QUEUE', queue.index) or gen.debug:
+            return False
+        if sampler(gen.sizepdf) is None:
+            return False
+        if gen.arrivpdf is not None and sampler(gen.arrivpdf) is None:
+            return False
+    return sim.probegens[0].numpkts > 0
+
+
+# Simulate one run per entry of dispersions, as sim.run would, and return
+# their RunResults. The seed (any non-negative integer) seeds NumPy's
+# generator; without one, it is seeded from the random module.
+# The runs are solved in chunks of runs of about the same length, from the
+# shortest (in the time the probes take to arrive) to the longest, so that
+# short runs are not padded out to the length of long ones; each chunk is
+# sized from an estimate of the packets its runs need (see columns), to
+# keep it under MAXCELLS cells
+
+def runbatch(sim, dispersions, seed=None):
+    if seed is None:
+        seed = random.getrandbits(64)
+    rs = numpy.random.RandomState([seed & 0xffffffff, (seed >> 32) & 0xffffffff])
+
+    rates = [1.0/meangap(sampler(gen.arrivpdf)) for gen in sim.pktgens]
+    horizons = [probehorizon(sim, d) for d in dispersions]
+    order = sorted(range(0,len(dispersions)), key=horizons.__getitem__)
+
+    results = [None]*len(dispersions)
+    start = 0
+    while start < len(order):
+        # The runs are in order of horizon, so the last of a chunk needs
+        # the most columns
+        rows = 1
+        while (start + rows < len(order) and
+               (rows+1)*columns(sim, rates, horizons[order[start+rows]]) <= MAXCELLS):
+            rows += 1
+        chunk = order[start:start+rows]
+        solved = []
+        _solve(sim, rs, [dispersions[i] for i in chunk], solved, rates)
+        for i, res in zip(chunk, solved):
+            results[i] = res
+        start += rows
+    return results
+
+
+# The mean of the values drawn by a sampler, estimated from MEANDRAWS draws
+# of a generator of its own (so that the draws of the runs are left alone)
+
+def meangap(samp):
+    return max(float(samp(numpy.random.RandomState(0), (MEANDRAWS,)).mean()), 1e-300)
+
+
+# The time by which the probes of a run at the given dispersion have all
+# arrived (on average, if the probe generator has an arrivpdf of its own)
+
+def probehorizon(sim, dispersion):
+    probegen = sim.probegens[0]
+    if probegen.arrivpdf is None:
+        return sim.offsettime + float(sum(probegen.schedule(dispersion)))
+    return sim.offsettime + probegen.numpkts*meangap(sampler(probegen.arrivpdf))
+
+
+# An upper estimate of the number of packets a run with the given horizon
+# has to simulate: the probes, and the cross traffic of every generator (of
+# the given arrival rates, in packets per second) up to the horizon, with
+# some slack for the spread between runs
+
+def columns(sim, rates, horizon):
+    cols = sim.probegens[0].numpkts
+    for rate in rates:
+        cols += arrivalcolumns(rate*horizon)
+    return cols
+
+
+# The number of arrival times to draw for each run, to cover the given
+# expected number of arrivals in all but the rarest runs
+
+def arrivalcolumns(expected):
+    return int(expected + 6*expected**0.5) + 64
+
+
+# Draw the arrival times of a generator for a number of runs, until every
+# run has an arrival past horizon. Returns the (runs x packets) array. The
+# generator makes "rate" packets per second, from which the number drawn at
+# first is estimated
+
+def _arrivals(rs, samp, rows, horizon, rate):
+    cols = arrivalcolumns(rate*horizon)
+    arr = numpy.cumsum(samp(rs, (rows, cols)), axis=1)
+    while arr[:, -1].min() <= horizon:
+        more = numpy.cumsum(samp(rs, (rows, max(64, cols/8))), axis=1) + arr[:, -1:]
+        arr = numpy.hstack((arr, more))
+
+    # Drop the columns that are past the horizon in every run
+    last = numpy.searchsorted(arr.min(axis=0), horizon, side='right')
+    return arr[:, :last+1]
+
+
+# Solve the runs for the given dispersions, appending their RunResults to
+# results, the cross-traffic generators making the given rates of packets
+# per second. Returns the number of packets per run that had to be
+# simulated
+
+def _solve(sim, rs, dispersions, results, rates):
+    queue = sim.queues[0]
+    probegen = sim.probegens[0]
+    rows = len(dispersions)
+    numpkts = probegen.numpkts
+    rowidx = numpy.arange(rows)[:, None]
+
+    # Probe arrival times, built up the same way as the event loop does
+    # (offset, then one interarrival time after another)
+    gaps = numpy.empty((rows, numpkts+1))
+    gaps[:, 0] = sim.offsettime
+    if probegen.arrivpdf is None:
+        gaps[:, 1:] = numpy.array([probegen.schedule(d) for d in dispersions], dtype=float)
+    else:
+        gaps[:, 1:] = sampler(probegen.arrivpdf)(rs, (rows, numpkts))
+    probearriv = numpy.cumsum(gaps, axis=1)[:, 1:]
+    horizon = probearriv[:, -1].max()
+
+    # Put the probes first, so that a stable sort leaves them ahead of
+    # cross traffic arriving at the same time, as their lower serial
+    # numbers do in the event loop
+    times = [probearriv]
+    sizes = [sampler(probegen.sizepdf)(rs, (rows, numpkts))]
+    probetime = sizes[0].sum(axis=1)/queue.procrate
+    for gen, rate in zip(sim.pktgens, rates):
+        arr = _arrivals(rs, sampler(gen.arrivpdf), rows, horizon, rate)
+        times.append(arr)
+        sizes.append(sampler(gen.sizepdf)(rs, arr.shape))
+    isprobe = numpy.zeros(sum([t.shape[1] for t in times]), dtype=bool)
+    isprobe[:numpkts] = True
+
+    order = numpy.argsort(numpy.hstack(times), axis=1, kind='mergesort')
+    arriv = numpy.hstack(times)[rowidx, order]
+    trans = numpy.hstack(sizes)[rowidx, order]/queue.procrate
+    probe = isprobe[order]
+    cols = arriv.shape[1]
+
+    # Lindley's recursion
+    cum = numpy.cumsum(trans, axis=1)
+    depart = cum + numpy.maximum.accumulate(arriv - cum + trans, axis=1)
+
+    # The departure before each arrival (0 for the first), and whether the
+    # packet found the queue empty. On a tie, the departure comes first
+    # unless it is cross traffic and the arrival a probe, following the
+    # serial numbers of the event loop
+    prevdepart = numpy.hstack((numpy.zeros((rows, 1)), depart[:, :-1]))
+    prevprobe = numpy.hstack((numpy.ones((rows, 1), dtype=bool), probe[:, :-1]))
+    empty = (prevdepart < arriv) | ((prevdepart == arriv) & (prevprobe | ~probe))
+
+    # Where each probe ended up in FIFO order
+    pos = numpy.empty_like(order)
+    pos[rowidx, order] = numpy.arange(cols)
+    pos = pos[:, :numpkts]
+    probedepart = depart[rowidx, pos]
+
+    # The run ends when the last probe leaves. The queue is busy from then
+    # back to that probe's arrival, so only the idle time before needs
+    # adding up
+    end = probedepart[:, -1]
+    idle = numpy.where(arriv <= end[:, None],
+                       numpy.maximum(arriv - prevdepart, 0.0), 0.0).sum(axis=1)
+    busy = end - idle
+
+    # A probe sees a gap if the queue emptied between the previous probe's
+    # arrival (or the start) and its own
+    emptycount = numpy.hstack((numpy.zeros((rows, 1), dtype=int),
+                               numpy.cumsum(empty, axis=1)))
+    gapfrom = numpy.hstack((numpy.ones((rows, 1), dtype=int), pos[:, :-1]+1))
+    gap = emptycount[rowidx, pos+1] - emptycount[rowidx, gapfrom] > 0
+    qempty = empty[rowidx, pos]
+    qprobe = numpy.hstack((numpy.ones((rows, 1), dtype=bool),
+                           probedepart[:, :-1] <= probearriv[:, 1:]))
+
+    enterlist = probearriv.tolist()
+    leavelist = probedepart.tolist()
+    qemptylist = qempty.tolist()
+    qprobelist = qprobe.tolist()
+    gaplist = gap.tolist()
+    for i in range(0,rows):
+        res = multiqueue.RunResult(dispersions[i])
+        res.trains = [numpkts]
+        res.pktenter = enterlist[i]
+        res.pktleave = leavelist[i]
+        for k in range(0,numpkts):
+            res.pktqempty.append([multiqueue.PROBE, (queue.index, int(qemptylist[i][k]))])
+            res.pktqprobe.append([multiqueue.PROBE, (queue.index, int(qprobelist[i][k]))])
+            res.pktqgap.append([multiqueue.PROBE, int(gaplist[i][k])])
+        res.trueUtilization = [float(busy[i]/end[i])]
+        res.adjustedUtilization = [float((busy[i]-probetime[i])/end[i])]
+        res.timeclock = float(end[i])
+        results.append(res)
+
+    return cols
@@ -17,8 +17,35 @@
 # packet generator record = { queue that it injects into, PDF of size, PDF
 #of interarrival time }
 
+# The simulator can be run as a script (see the bottom of this file), or
+# imported and driven through the Simulator class:
+#
+#   sim = Simulator([Queue(0, 10000000.0/8.0)],
+#                   [PacketGenerator(0, (internetmix,()),
+#                                    (random.expovariate,((855.1881),)),
+#                                    ('QUEUE', 0))],
+#                   [ProbeGenerator(0, (determ,(1500.0,)), ('QUEUE', 0))])
+#   result = sim.run(0.0012, seed=1)
+#
+# The topology is built once; every call to run() resets the components and
+# simulates a single probe run from an empty system.
+# Topologies can also be described in config files (see simconfig.py and
+# the configs directory), any number of which the script sweeps in turn:
+#
+#   python multiqueue.py configs/single-queue.json configs/two-queue.json
+
+import hashlib
+import heapq
+import itertools
+import multiprocessing
 import random
+import shutil
 import sys
+import tempfile
+
+import onlinestats
+import sampling
+import streams
 
 # This provides a deterministic "delta" PDF, for which P[x=val] = 1
 def determ(val):
@@ -35,150 +62,1909 @@ def internetmix():
     if(ds<=1.00): return 1500.0
 
 
+# Throw away the values a PDF has drawn in advance, if it is one that does
+# (see sampling.py). Used whenever the random module is seeded or restored,
+# so that what a run draws depends only on the random module
+
+def resetpdf(pdf):
+    if pdf is not None and isinstance(pdf[0], sampling.BlockSampler):
+        pdf[0].reset()
+
+
+# The PDF "pdf", drawing from rng (a streams.Stream, or the random module).
+# Samplers get a copy of their own bound to rng, so that generators sharing
+# one (such as sampling.INTERNETMIX) don't share its buffer. With a stream,
+# the distributions of the random module become those of rng, and
+# internetmix becomes sampling.INTERNETMIX (the same sizes from the same
+# uniforms). Other PDFs are left as they are
+
+def bindpdf(pdf, rng):
+    if pdf is None:
+        return pdf
+    func, args = pdf
+    if func is internetmix and rng is not random:
+        func = sampling.INTERNETMIX
+    if isinstance(func, sampling.BlockSampler):
+        return (func.bind(rng), args)
+    if rng is random:
+        return pdf
+    name = getattr(func, '__name__', None)
+    if name is not None and getattr(random, name, None) == func:
+        return (getattr(rng, name), args)
+    return pdf
+
+
 # Some labels, used in packet data structures
 
 PROBE = 'PROBE'
 NONPROBE = 'NONPROBE'
 
+# Codes for where a packet is, i.e. the type of the component it is at, as
+# used in the routing table compiled by Simulator.compile
+
+INQUEUE, INWIRE, INPKTGEN, INPROBEGEN = range(0,4)
+TYPECODES = {'QUEUE': INQUEUE, 'WIRE': INWIRE, 'PKTGEN': INPKTGEN,
+             'PROBEGEN': INPROBEGEN}
+
+
+# GENERAL parameters, shared by all components:
+# 'type': what type the component is (QUEUE, PKTGEN, PROBEGEN or WIRE)
+# 'index': a numerical value used to distinguish components of the same
+#          type. It must match the component's position in its list
+# 'debug': if set to 1, debug info related to the component will be
+#          displayed
+# 'outputdest': a two-tuple containing the type and number of the
+#               component that a packet should head to next after
+#               finishing at the current component. An outputdest of
+#               -1 indicates that a packet has reached the end
+# 'rng': not user-defined. Where the component's random numbers come from:
+#        the random module, or with Simulator.rngstreams a streams.Stream
+#        of its own. Set by setrng(), which also binds the component's PDFs
+#        to it (as _sizepdf_ and _arrivpdf_, which is what is drawn from)
+
+# QUEUE parameters:
+# 'procrate': the rate, in bytes per second, that the queue services
+#             a packet
+# 'dropprob': the probability that a nonprobe packet leaving the queue is
+#             dropped instead of moving on to the outputdest
+# '_emptytime_': not a user-defined parameter (hence the underscores).
+#                Its purpose is to record the time at which the queue
+#                will become empty. It is used to calculate the total
+#                waiting time of new packets
+# '_busytime_', '_busysince_': also not user-defined. The time the queue
+#                has been busy so far in the current measurement, and the
+#                time its current busy period began (if it holds packets)
+# '_lengtharea_', '_workarea_', '_lastchange_', '_lastarrival_': with
+#                Simulator.queuestats, the integrals over time of the number
+#                of packets in the queue and of its unfinished work (in
+#                seconds of service), and the times they were last brought
+#                up to date
+# '_arrivals_', '_departures_', '_departedbytes_', '_drops_', '_maxlength_':
+#                with queuestats, the packets that have arrived at the queue,
+#                left it (and their bytes) and been dropped on leaving it,
+#                and the most packets it has held
+# 'delaystats': with queuestats, if it is not None, an object (such as an
+#               onlinestats.Summary) whose add method is given the delay of
+#               every packet arriving at the queue, from its arrival until it
+#               leaves the queue
+
+class Queue(object):
+
+    type = 'QUEUE'
+
+    def __init__(self, index, procrate, outputdest=-1, dropprob=0.0, debug=0):
+        if not procrate > 0:
+            raise ValueError('the procrate of a queue must be positive, not %r' % (procrate,))
+        if not 0 <= dropprob <= 1:
+            raise ValueError('the dropprob of a queue must be between 0 and 1, not %r' % (dropprob,))
+        self.index = index
+        self.procrate = procrate
+        self.outputdest = outputdest
+        self.dropprob = dropprob
+        self.debug = debug
+        self.delaystats = None
+        self.setrng(random)
+        self.reset()
+
+    def setrng(self, rng):
+        self.rng = rng
+
+    # Clear the state left behind by a previous run
+    def reset(self):
+        self._emptytime_ = 0
+        self._numinqueue_ = 0
+        self._numprobes_ = 0
+        self._gapoccurred_ = 0
+        self.startmeasure(0.0)
+
+    # Start measuring the busy time (from busytime on) and, with queuestats,
+    # the queue length and unfinished work of the queue at time "now"
+    def startmeasure(self, now, busytime=0.0):
+        self._busytime_ = busytime
+        self._busysince_ = now
+        self._lengtharea_ = 0.0
+        self._workarea_ = 0.0
+        self._lastchange_ = now
+        self._lastarrival_ = now
+        self._arrivals_ = 0
+        self._departures_ = 0
+        self._departedbytes_ = 0.0
+        self._drops_ = 0
+        self._maxlength_ = self._numinqueue_
+
+    # The busy time measured up to time "now", counting the busy period in
+    # progress (if any) up to then
+    def busytime(self, now):
+        if self._numinqueue_ > 0:
+            return self._busytime_ + (now - self._busysince_)
+        return self._busytime_
+
+    # Bring the queue length and unfinished work integrals up to time "now".
+    # The unfinished work falls at rate 1 from each arrival until the queue
+    # empties, so it only has to be brought up to date at arrivals
+    def addlength(self, now):
+        self._lengtharea_ += self._numinqueue_*(now - self._lastchange_)
+        self._lastchange_ = now
+
+    def addwork(self, now):
+        last = self._lastarrival_
+        if self._emptytime_ > last:
+            top = min(self._emptytime_, now)
+            self._workarea_ += ((self._emptytime_ - last) + (self._emptytime_ - top))*(top - last)/2.0
+        self._lastarrival_ = now
+
+    # Save and restore the run state, for checkpoints
+    def getstate(self):
+        return (self._emptytime_, self._numinqueue_, self._numprobes_,
+                self._gapoccurred_)
+
+    def setstate(self, state):
+        (self._emptytime_, self._numinqueue_, self._numprobes_,
+         self._gapoccurred_) = state
+
+
+# PKTGEN parameters
+# sizepdf: A two-tuple, consisting of an RNG function and its parameters,
+#          used to determine the size of generated packets (in bytes)
+# arrivpdf: A two-type, like sizepdf, used to determine the interarrival
+#           times of generated packets to the outputdest
+# _emitted_: Not meant for users to set. Set to 1 if a CT packet has been
+#            created but not yet injected into the system. This prevents
+#            the creation of huge numbers of CT packets which have to wait
+#            around a long time before injection
+
+class PacketGenerator(object):
+
+    type = 'PKTGEN'
+
+    def __init__(self, index, sizepdf, arrivpdf, outputdest, debug=0):
+        self.index = index
+        self.sizepdf = sizepdf
+        self.arrivpdf = arrivpdf
+        self.outputdest = outputdest
+        self.debug = debug
+        self.setrng(random)
+        self.reset()
+
+    def setrng(self, rng):
+        self.rng = rng
+        self._sizepdf_ = bindpdf(self.sizepdf, rng)
+        self._arrivpdf_ = bindpdf(self.arrivpdf, rng)
+
+    def reset(self):
+        self._emitted_ = 0
+        resetpdf(self._sizepdf_)
+        resetpdf(self._arrivpdf_)
+
+    def getstate(self):
+        return self._emitted_
+
+    def setstate(self, state):
+        self._emitted_ = state
+        resetpdf(self._sizepdf_)
+        resetpdf(self._arrivpdf_)
+
+
+# PROBEGEN parameters
+# sizepdf: A two-tuple, consisting of an RNG function and its parameters,
+#          used to determine the size of generated packets (in bytes)
+# arrivpdf: A two-type, like sizepdf, used to determine the interarrival
+#           times of generated packets to the outputdest. If it is None,
+#           the probe packets are spaced according to the dispersion given
+#           to Simulator.run (see gaps and chirp)
+# numpkts: Total number of packets that will be emitted by the probe
+#          generator (the length of the train)
+# gaps: the spacing of the train, as a list of numpkts-1 gaps, each a
+#       multiple of the dispersion. By default every gap is the dispersion
+# chirp: instead of gaps, the spread factor of a chirp: each gap is the
+#        previous one divided by chirp, starting from the dispersion, so
+#        that one train sweeps a whole range of input dispersions
+# The first packet enters the system the dispersion after offsettime
+
+class ProbeGenerator(object):
+
+    type = 'PROBEGEN'
+
+    def __init__(self, index, sizepdf, outputdest, numpkts=2, arrivpdf=None,
+                 debug=0, gaps=None, chirp=None):
+        self.index = index
+        self.sizepdf = sizepdf
+        self.outputdest = outputdest
+        self.numpkts = numpkts
+        self.arrivpdf = arrivpdf
+        self.debug = debug
+        if gaps is not None and chirp is not None:
+            raise ValueError('a probe train has either gaps or a chirp, not both')
+        if gaps is not None:
+            if len(gaps) != numpkts - 1:
+                raise ValueError('a train of %d packets has %d gaps, not %d' % (numpkts, numpkts - 1, len(gaps)))
+            self.gaps = [float(gap) for gap in gaps]
+        elif chirp is not None:
+            self.gaps = [chirp**-k for k in range(0,numpkts-1)]
+        else:
+            self.gaps = [1.0]*(numpkts-1)
+        self.chirp = chirp
+        self.setrng(random)
+
+    # The times between the packets of the train, for the given dispersion:
+    # the time from offsettime to the first packet, then the numpkts-1 gaps
+    def schedule(self, dispersion):
+        return [dispersion*1.0] + [dispersion*gap for gap in self.gaps]
+
+    def setrng(self, rng):
+        self.rng = rng
+        self._sizepdf_ = bindpdf(self.sizepdf, rng)
+        self._arrivpdf_ = bindpdf(self.arrivpdf, rng)
+
+    def reset(self):
+        resetpdf(self._sizepdf_)
+        resetpdf(self._arrivpdf_)
+
+    def getstate(self):
+        return None
+
+    def setstate(self, state):
+        self.reset()
+
+
+# WIRE parameters
+# propdelay: fixed delay of every packet travelling through the wire
+#            (in other words, the propagation delay)
+
+class Wire(object):
+
+    type = 'WIRE'
+
+    def __init__(self, index, propdelay, outputdest, debug=0):
+        if not propdelay >= 0:
+            raise ValueError('the propdelay of a wire cannot be negative (%r)' % (propdelay,))
+        self.index = index
+        self.propdelay = propdelay
+        self.outputdest = outputdest
+        self.debug = debug
+        self.setrng(random)
+
+    def setrng(self, rng):
+        self.rng = rng
+
+    def reset(self):
+        pass
+
+    def getstate(self):
+        return None
+
+    def setstate(self, state):
+        pass
+
+
+# A packet floating around in the system
+# type: PROBE or NONPROBE
+# location: the ID of the component the packet is at (see
+#           Simulator.compile)
+# size: the size of the packet, in bytes
+# serial: a number unique to every packet of a run
+# wtime: the time at which the packet leaves its current location
+# delays, qempty, qprobe, qgap: per-queue records, each headed by the packet
+#         type. The queue records are only kept for probe packets, and the
+#         delays only if recdelays is set; otherwise they are None, so that
+#         cross-traffic packets don't allocate lists nobody reads
+
+class Packet(object):
+
+    __slots__ = ('type', 'location', 'size', 'serial', 'wtime', 'delays',
+                 'qempty', 'qprobe', 'qgap')
+
+    def __init__(self, type, location, size, serial, wtime, recdelays=0):
+        self.type = type
+        self.location = location
+        self.size = size
+        self.serial = serial
+        self.wtime = wtime
+        if recdelays == 1:
+            self.delays = [(type)]
+        else:
+            self.delays = None
+        if type == PROBE:
+            self.qempty = [(type)]
+            self.qprobe = [(type)]
+            self.qgap = [(type)]
+        else:
+            self.qempty = None
+            self.qprobe = None
+            self.qgap = None
+
+    # A copy of the packet that shares none of its records with the original
+    def copy(self):
+        pkt = Packet.__new__(Packet)
+        pkt.type = self.type
+        pkt.location = self.location
+        pkt.size = self.size
+        pkt.serial = self.serial
+        pkt.wtime = self.wtime
+        if self.delays is None:
+            pkt.delays = None
+        else:
+            pkt.delays = self.delays[:1] + [list(d) for d in self.delays[1:]]
+        if self.qempty is None:
+            pkt.qempty = None
+            pkt.qprobe = None
+            pkt.qgap = None
+        else:
+            pkt.qempty = self.qempty[:]
+            pkt.qprobe = self.qprobe[:]
+            pkt.qgap = self.qgap[:]
+        return pkt
+
+
+# The outcome of a single simulation run. The probe records have one entry
+# per probe packet, in the order of the probe generators and then of the
+# packets of each train (None for a probe that had not left when the run
+# ended)
+# trains: the number of probe packets of each probe generator
+# pktenter, pktleave: the times the probe packets entered and left the system
+# pktqempty: for each probe packet, whether it found each queue empty
+# pktqprobe: same, but whether it found each queue without probe packets
+# pktqgap: same, but whether each queue had become empty since the last probe
+# delays: the delay records of every packet that left the system (only
+#         filled in if recdelays is set)
+# trueUtilization, adjustedUtilization: per-queue utilization of the run,
+#         with and without the probe packets
+# meanQueueLength, meanBacklog: per-queue time averages over the run of the
+#         number of packets in the queue and of its unfinished work, in
+#         bytes (only filled in if queuestats is set)
+# timeclock: the time at which the run ended
+
+class RunResult(object):
+
+    def __init__(self, dispersion):
+        self.dispersion = dispersion
+        self.trains = []
+        self.pktenter = []
+        self.pktleave = []
+        self.pktqempty = []
+        self.pktqprobe = []
+        self.pktqgap = []
+        self.delays = []
+        self.trueUtilization = []
+        self.adjustedUtilization = []
+        self.meanQueueLength = []
+        self.meanBacklog = []
+        self.timeclock = 0.0
+
+
+# The measurements of one window of a long run (see Simulator.windows), each
+# a list with an entry per queue:
+# start, end: the span of the window
+# arrivals, departures, drops: the packets that arrived at the queue, left
+#         it, and were dropped as they left it
+# throughput: the bytes leaving the queue per second (dropped ones included,
+#         since the queue served them)
+# utilization: the fraction of the window the queue was busy
+# meanQueueLength, maxQueueLength: the time-averaged and largest number of
+#         packets in the queue
+# meanBacklog: the time-averaged unfinished work of the queue, in bytes
+# delays: an onlinestats.Summary of the delays at the queue of the packets
+#         that arrived at it in the window
+
+class WindowResult(object):
+
+    def __init__(self, sim, start, end):
+        self.start = start
+        self.end = end
+        span = max(end - start, 1e-300)
+        queues = sim.queues
+        for queue in queues:
+            queue.addlength(end)
+            queue.addwork(end)
+        self.arrivals = [queue._arrivals_ for queue in queues]
+        self.departures = [queue._departures_ for queue in queues]
+        self.drops = [queue._drops_ for queue in queues]
+        self.throughput = [queue._departedbytes_/span for queue in queues]
+        self.utilization = [queue.busytime(end)/span for queue in queues]
+        self.meanQueueLength = [queue._lengtharea_/span for queue in queues]
+        self.maxQueueLength = [queue._maxlength_ for queue in queues]
+        self.meanBacklog = [queue._workarea_*queue.procrate/span for queue in queues]
+        self.delays = [queue.delaystats for queue in queues]
+
+
+# A snapshot of the whole system (clock, packets, component states and the
+# state of the random numbers), taken part way through a cross-traffic-only
+# trajectory by Simulator.checkpoints. Any number of runs can be forked from
+# the same checkpoint. segmentstart is the time of the previous checkpoint
+# (0 for the first one) and busytime the time each queue was busy since then
+
+class Checkpoint(object):
+
+    def __init__(self, sim, timeclock, packets, pktserial, segmentstart,
+                 busytime):
+        self.timeclock = timeclock
+        self.segmentstart = segmentstart
+        self.busytime = busytime
+        self.packets = [(w, s, pkt.copy()) for (w, s, pkt) in packets]
+        self.pktserial = pktserial
+        self.states = [comp.getstate() for comp in sim.components()]
+        self.rngstate = sim.rngstate()
+
+    # Put the components of sim into the checkpointed state. Returns the
+    # clock, a fresh copy of the event heap, and the next packet serial
+    def restore(self, sim):
+        for comp, state in zip(sim.components(), self.states):
+            comp.setstate(state)
+        packets = [(w, s, pkt.copy()) for (w, s, pkt) in self.packets]
+        return self.timeclock, packets, self.pktserial
+
+
+# The simulation engine. The components are given as lists, and each
+# component's index must be its position in the list of its type. Their
+# outputdest links are compiled into a routing table when the simulator is
+# created; if the components are changed afterwards, call compile() again
+#
+# recdelays: set to 1 if we want delays recorded
+# queuestats: set to 1 to measure the time-averaged queue length and
+#             backlog of each queue (see RunResult)
+# rngstreams: set to 1 to give every component a random stream of its own
+#             (see streams.py and seed()), rather than drawing from the
+#             random module
+# endtime: set to -1 to terminate the simulation if there are no probe
+#          packets being sent. If you would rather have the simulation run
+#          for a period of time, whether probe packets are there or not, set
+#          this to the time (in seconds)
+# offsettime: used to provide a delay before the probe packets are
+#             injected. It gives a chance for the simulation to get into
+#             steady-state
+# profiler: an instrument.Profiler to count and time the events of the
+#           runs, or None
+# Setting sim.tracer to a tracer.Tracer records the events of the runs in
+# its ring (see tracer.py)
+
+class Simulator(object):
+
+    def __init__(self, queues, pktgens, probegens=[], wires=[], recdelays=0,
+                 endtime=-1, offsettime=0.10, profiler=None, queuestats=0,
+                 rngstreams=0):
+        self.queues = list(queues)
+        self.pktgens = list(pktgens)
+        self.probegens = list(probegens)
+        self.wires = list(wires)
+        self.recdelays = recdelays
+        self.queuestats = queuestats
+        self.rngstreams = rngstreams
+        self.endtime = endtime
+        self.offsettime = offsettime
+        self.profiler = profiler
+        self.tracer = None
+        self.compile()
+
+    # All the components, in a fixed order
+    def components(self):
+        return self.queues + self.pktgens + self.probegens + self.wires
+
+    # Compile the outputdest links into the routing table used by the event
+    # loop. Every component gets an integer ID, its position in
+    # components(), and a packet's location is the ID of the component it
+    # is at, so that moving a packet on is a matter of indexing lists:
+    # _kinds[id]: the type code of the component (INQUEUE, ...)
+    # _indexes[id]: its index among the components of its type
+    # _nexthop[id]: the ID its outputdest leads to, or -1 if it is a queue
+    #               whose packets leave the system
+    # _pktgenids, _probegenids: the IDs of the generators, by index
+    # _probepaths: the indexes of the queues on the path of each probe
+    #              generator's packets
+    # Every component is also given its source of random numbers (see
+    # rngstreams), a new, unseeded stream if it has one of its own
+    # Raises ValueError if the components are misnumbered, or if a packet
+    # could reach a link that leads to anything but an existing queue or
+    # wire (links of components no packet reaches are left alone, such as
+    # a wire to a queue that has been left out)
+    def compile(self):
+        comps = self.components()
+        ids = {}
+        for kind in (self.queues, self.pktgens, self.probegens, self.wires):
+            for i in range(0,len(kind)):
+                if kind[i].index != i:
+                    raise ValueError('%s %d is at position %d of its list' % (kind[i].type, kind[i].index, i))
+        for i in range(0,len(comps)):
+            ids[(comps[i].type, comps[i].index)] = i
+
+        self._kinds = [TYPECODES[comp.type] for comp in comps]
+        self._indexes = [comp.index for comp in comps]
+        self._types = [comp.type for comp in comps]
+        self._nexthop = []
+        for comp in comps:
+            dest = comp.outputdest
+            if dest == -1 and comp.type == 'QUEUE':
+                self._nexthop.append(-1)
+            elif dest != -1 and tuple(dest)[:1] in (('QUEUE',), ('WIRE',)) and tuple(dest) in ids:
+                self._nexthop.append(ids[tuple(dest)])
+            else:
+                self._nexthop.append(None)
+        first = len(self.queues)
+        self._pktgenids = range(first, first+len(self.pktgens))
+        first += len(self.pktgens)
+        self._probegenids = range(first, first+len(self.probegens))
+
+        # Follow the path of the packets of every generator. The queues on
+        # the path of each probe generator (_probepaths) tell which queues
+        # its probes add to the load of. A path that comes back to a
+        # component would keep its packets in the system for ever
+        paths = []
+        for id in self._pktgenids + self._probegenids:
+            gen = comps[id]
+            seen = {}
+            path = []
+            while id != -1:
+                if id in seen:
+                    raise ValueError('the path of %s %d loops back to %s %d' % (gen.type, gen.index, comps[id].type, comps[id].index))
+                seen[id] = 1
+                if self._nexthop[id] is None:
+                    comp = comps[id]
+                    raise ValueError('%s %d leads to %r, which is not a queue or wire of the simulator' % (comp.type, comp.index, comp.outputdest))
+                if self._kinds[id] == INQUEUE: path.append(self._indexes[id])
+                id = self._nexthop[id]
+            paths.append(path)
+        self._probepaths = paths[len(self.pktgens):]
+
+        for comp in comps:
+            if self.rngstreams:
+                comp.setrng(streams.Stream())
+            else:
+                comp.setrng(random)
+
+    # Put every component back into the state it has before a run starts
+    def reset(self):
+        for comp in self.components():
+            comp.reset()
+
+    # Seed the random numbers of a run. The random module is seeded with
+    # seed, and with rngstreams, so is the stream of every component, with
+    # runseed(seed, ID). If commonseed is given, the streams of the cross
+    # traffic (those of the packet generators, and of the queues, for their
+    # drop decisions) are seeded from it instead, so that all runs given
+    # the same commonseed see the same cross traffic, whatever their probes
+    # do (common random numbers)
+    def seed(self, seed, commonseed=None):
+        random.seed(seed)
+        if not self.rngstreams:
+            if commonseed is not None:
+                raise ValueError('common random numbers need rngstreams')
+            return
+        comps = self.components()
+        numcommon = len(self.queues) + len(self.pktgens)
+        for id in range(0,len(comps)):
+            if commonseed is not None and id < numcommon:
+                comps[id].rng.seed(runseed(commonseed, id))
+            else:
+                comps[id].rng.seed(runseed(seed, id))
+
+    # Save and restore the state of the random numbers: that of the random
+    # module and, with rngstreams, of every component's stream
+    def rngstate(self):
+        if not self.rngstreams:
+            return random.getstate()
+        return (random.getstate(), [comp.rng.getstate() for comp in self.components()])
+
+    def setrngstate(self, state):
+        if not self.rngstreams:
+            random.setstate(state)
+            return
+        random.setstate(state[0])
+        for comp, compstate in zip(self.components(), state[1]):
+            comp.rng.setstate(compstate)
+
+    # Start measuring every queue at time "now", from the given busy times
+    # (zero by default). Queues that already hold packets (i.e. when
+    # starting from a checkpoint) are busy from now on
+    def _startmeasure(self, now, busytime=None):
+        for i in range(0,len(self.queues)):
+            if busytime is None:
+                self.queues[i].startmeasure(now)
+            else:
+                self.queues[i].startmeasure(now, busytime[i])
+
+    # Simulate one long trajectory with cross traffic only, starting from an
+    # empty system, and yield a Checkpoint of it every "spacing" seconds
+    # (the first after offsettime, to let it get into steady-state). Probe
+    # runs are forked from the checkpoints with run(dispersion,
+    # checkpoint=...), which saves simulating the warm-up for every run.
+    # The spacing should be well above the length of a typical busy period,
+    # so that runs forked from consecutive checkpoints are decorrelated.
+    # The trajectory goes on for as long as checkpoints are asked for; runs
+    # forked in between don't disturb it
+    def checkpoints(self, spacing, seed=None):
+        if seed is not None:
+            self.seed(seed)
+        self.reset()
+
+        TIMECLOCK = 0.0
+        packets = []
+        pktserial = 0
+        stoptime = self.offsettime
+
+        while 1:
+            # Only the state matters, so records of the trajectory itself
+            # are thrown away at every checkpoint
+            result = RunResult('CHECKPOINT')
+            self._startmeasure(TIMECLOCK)
+            if self.tracer is not None: self.tracer.startrun()
+
+            segmentstart = TIMECLOCK
+            TIMECLOCK, pktserial = self._eventloop(result, packets, TIMECLOCK, pktserial, 0, stoptime, stoptime)
+            TIMECLOCK = stoptime
+
+            busytime = [queue.busytime(TIMECLOCK) for queue in self.queues]
+
+            checkpoint = Checkpoint(self, TIMECLOCK, packets, pktserial, segmentstart, busytime)
+            yield checkpoint
+
+            # Runs forked in the meantime have changed the components and
+            # the random numbers, so put them back before carrying on
+            for comp, state in zip(self.components(), checkpoint.states):
+                comp.setstate(state)
+            self.setrngstate(checkpoint.rngstate)
+
+            stoptime += spacing
+
+    # Simulate one long run with cross traffic only, starting from an empty
+    # system and lasting "duration" seconds, and yield a WindowResult for
+    # every "window" seconds of it (the last one may be shorter), as each
+    # window ends. Only the state of the system is carried from one window
+    # to the next, so the memory used does not grow with the duration. The
+    # queues are measured as with queuestats, the delays at each going into
+    # an onlinestats.Summary of the given quantiles; no delay records are
+    # kept
+    def windows(self, duration, window, seed=None, quantiles=(0.5, 0.9, 0.99)):
+        if seed is not None:
+            self.seed(seed)
+        self.reset()
+
+        TIMECLOCK = 0.0
+        packets = []
+        pktserial = 0
+        start = 0.0
+
+        recdelays, queuestats = self.recdelays, self.queuestats
+        self.recdelays, self.queuestats = 0, 1
+        if self.tracer is not None: self.tracer.startrun()
+        try:
+            while start < duration:
+                stoptime = min(start + window, duration)
+                self._startmeasure(start)
+                for queue in self.queues:
+                    queue.delaystats = onlinestats.Summary(quantiles)
+
+                if self.profiler is not None: self.profiler.startrun()
+                result = RunResult('WINDOW')
+                TIMECLOCK, pktserial = self._eventloop(result, packets, TIMECLOCK, pktserial, 0, stoptime, stoptime)
+                if self.profiler is not None: self.profiler.endrun()
+
+                yield WindowResult(self, start, stoptime)
+                start = stoptime
+        finally:
+            self.recdelays, self.queuestats = recdelays, queuestats
+            for queue in self.queues:
+                queue.delaystats = None
+
+    # Simulate a single run, in which the probe generators space their
+    # packets by "dispersion" seconds (unless they have their own arrivpdf).
+    # If a seed is given, the random numbers are seeded with it first (and
+    # with commonseed, if given: see seed()), so that the run can be
+    # reproduced.
+    # The run normally starts from an empty system, and the probes are
+    # injected after offsettime. If a Checkpoint is given instead, the run is
+    # forked from it: the system starts in the checkpointed state, the
+    # probes are injected straight away, and (unless a seed is given) the
+    # random numbers carry on from where the checkpointed trajectory was
+    def run(self, dispersion, seed=None, checkpoint=None, commonseed=None):
+        if self.profiler is not None: self.profiler.startrun()
+        if self.tracer is not None: self.tracer.startrun(dispersion)
+        if seed is not None:
+            self.seed(seed, commonseed)
+        elif checkpoint is not None:
+            self.setrngstate(checkpoint.rngstate)
+
+        queues = self.queues
+        probegens = self.probegens
+        recdelays = self.recdelays
+
+        result = RunResult(dispersion)
+
+        if checkpoint is None:
+            self.reset()
+
+            # Global clock used to assign times to simulation events
+            TIMECLOCK = 0.0
+
+            packets = []        # The event calendar: a heap of all packets
+                                # currently floating around in the system,
+                                # keyed on (wtime, serial). Ordering on the
+                                # serial as well as the finishing time means
+                                # that packets which finish at the same time
+                                # are handled in the order they were created
+
+            pktserial = 0       # Used to assign unique number to every packet
+
+            OFFSETTIME = self.offsettime
+        else:
+            TIMECLOCK, packets, pktserial = checkpoint.restore(self)
+            OFFSETTIME = 0.0
+
+        ENDTIME = self.endtime
+        if ENDTIME > -1: ENDTIME += TIMECLOCK
+
+        pendingprobes = 0       # Number of probe packets that have not yet
+                                # left the system
+
+        # A run forked from a checkpoint is measured from the start of the
+        # trajectory segment leading up to the checkpoint, as a fresh run
+        # is measured from the start of its warm-up. Otherwise the
+        # utilization would only cover the probes' own stay in the system.
+        # The queue length and backlog are measured over the run itself
+
+        if checkpoint is None:
+            STARTTIME = 0.0
+            self._startmeasure(TIMECLOCK)
+        else:
+            STARTTIME = checkpoint.segmentstart
+            self._startmeasure(TIMECLOCK, checkpoint.busytime)
+        RUNSTART = TIMECLOCK
+
+        # Create all probe packets and set their arrival times into the
+        # system. The probes get consecutive serial numbers from probebase
+        # on, which are used to file their records in order. The bytes they
+        # bring to each queue on their path are added up, to take them out
+        # of the adjusted utilization
+        probebase = pktserial
+        probebytes = [0.0]*len(queues)
+        for i in range(0,len(probegens)):
+
+            arrivpdf = probegens[i]._arrivpdf_
+            if arrivpdf is None:
+                schedule = probegens[i].schedule(dispersion)
+
+            TMPCLOCK = TIMECLOCK + OFFSETTIME
+            for j in range(0,probegens[i].numpkts):
+                pendingprobes += 1
+                if arrivpdf is None:
+                    TMPCLOCK = TMPCLOCK + schedule[j]
+                else:
+                    TMPCLOCK = TMPCLOCK + apply(apply,arrivpdf)
+                newpkt = Packet(PROBE, self._probegenids[i], apply(apply,probegens[i]._sizepdf_), pktserial, TMPCLOCK, recdelays)
+                heapq.heappush(packets, (newpkt.wtime, newpkt.serial, newpkt))
+                pktserial = pktserial + 1
+                for queueidx in self._probepaths[i]:
+                    probebytes[queueidx] += newpkt.size
+                if(probegens[i].debug): print "(ITER "+`dispersion`+") PROBE SOURCE "+`i`+" EMITTED PACKET "+`pktserial-1`
+
+        result.trains = [probegen.numpkts for probegen in probegens]
+        for records in (result.pktenter, result.pktleave, result.pktqempty,
+                        result.pktqprobe, result.pktqgap):
+            records.extend([None]*pendingprobes)
 
-iterations = 500       # Number of dispersion values to run the sim at
-iterstep = 5           # Step size of dispersion values 
+        TIMECLOCK, pktserial = self._eventloop(result, packets, TIMECLOCK, pktserial, pendingprobes, ENDTIME, probebase=probebase)
+
+        # AT THIS POINT, A SINGLE SIMULATION RUN HAS ENDED
+
+        numqueues = len(queues)
+        trueUtilization = [0.0]*numqueues
+        adjustedUtilization = [0.0]*numqueues
 
-pktenter = []          # Used to log the times the packets of trains enter
-pktleave = []          # Same, but for when they leave
+        # The total length of the simulation is the time from its start
+        # to the time at which it was stopped
 
-pktqempty = []         # Used to record if probe packets find an empty queue
-pktqprobe = []         # Used to record if probe packets find a queue with no
-                       #  probes in it
-pktqgap = []           # Used to record if a queue became empty
+        totalrun = TIMECLOCK - STARTTIME
+
+        # The total time that each queue i was utilized, counting a busy
+        # period still in progress up to the end of the simulation (since
+        # the simulation is now over)
+
+        utilizedrun = [queue.busytime(TIMECLOCK) for queue in queues]
+
+        # Calculate both true utilization (which includes the probe packets)
+        # and the "adjusted" utilization (which doesn't include the probe
+        # packets---i.e., in theory it would be the utilization if the probe
+        # packets weren't there). These values are calculated for a
+        # particular run, the probes' service time being that of the bytes
+        # of the probes passing through each queue. A run forked from a
+        # checkpoint has a probe-free measurement to hand, the trajectory
+        # segment before the checkpoint, which is used for the adjusted
+        # utilization instead: in such a short run, subtracting the probes'
+        # service time is biased
+
+        for i in range(0,numqueues):
+            trueUtilization[i] = (utilizedrun[i]/totalrun)
+            if checkpoint is None:
+                probetime = probebytes[i]/queues[i].procrate
+                adjustedUtilization[i] = ((utilizedrun[i]-probetime)/totalrun)
+            else:
+                adjustedUtilization[i] = checkpoint.busytime[i]/(checkpoint.timeclock - checkpoint.segmentstart)
+
+        result.trueUtilization = trueUtilization
+        result.adjustedUtilization = adjustedUtilization
+        result.timeclock = TIMECLOCK
+
+        # The time-averaged queue length and backlog (the unfinished work,
+        # in bytes) of each queue over the run
+        if self.queuestats:
+            runlength = max(TIMECLOCK - RUNSTART, 1e-300)
+            for queue in queues:
+                queue.addlength(TIMECLOCK)
+                queue.addwork(TIMECLOCK)
+                result.meanQueueLength.append(queue._lengtharea_/runlength)
+                result.meanBacklog.append(queue._workarea_*queue.procrate/runlength)
+
+        # Flush stdout, so that all pending debug messages will be printed
+        sys.stdout.flush()
+
+        if self.profiler is not None: self.profiler.endrun()
+        return result
+
+    # Run the event loop, starting at time TIMECLOCK with the packets in the
+    # heap "packets", until the probes have left or the time passes endtime
+    # (as for Simulator.endtime). If stoptime is given, the loop instead
+    # stops just before the first event later than stoptime, leaving the
+    # system in its state at that time. Probe records and delays are added
+    # to result, and the busy time (and queuestats) to the queues; the
+    # records of the probe with serial number n go in entry n-probebase of
+    # the (already allocated) probe lists. Returns the final clock and the
+    # next free packet serial.
+    # Every event is handed to the handler of the component the packet is
+    # leaving (see _handlers), which moves it on
+    def _eventloop(self, result, packets, TIMECLOCK, pktserial, pendingprobes, endtime, stoptime=None, probebase=0):
+        ENDTIME = endtime
+        firstserial = pktserial
+        serials = itertools.count(pktserial)
+        pending = [pendingprobes]   # Number of probe packets that have not
+                                    # yet left the system, kept in a list
+                                    # so that the handlers can count it down
+        handlers, emitters = self._handlers(result, packets, serials, pending, probebase)
+        heappop = heapq.heappop
+
+        # If profiling, the time since tmark is added to the phase that has
+        # just finished at each step of the loop. Creating cross-traffic
+        # packets happens as part of moving the packets that leave the
+        # generators, and is timed by the generators' handlers themselves
+        prof = self.profiler
+        if prof is not None:
+            timer = prof.timer
+            phasetimes = prof.phasetimes
+            eventtypes = prof.eventtypes
+            types = self._types
+            tmark = timer()
+
+        # Create the first packet of every packet generator that hasn't one
+        # waiting to be emitted (i.e. at the start of a run). From then on,
+        # a generator creates its next packet as soon as the last one leaves
+        # it: we wait until the previous one is injected rather than
+        # creating a packet at every event, which ensures that packets have
+        # the correct interpacket spacing
+        pktgens = self.pktgens
+        for i in range(0,len(pktgens)):
+            if(pktgens[i]._emitted_ == 0):
+                emitters[i](TIMECLOCK)
+                pktgens[i]._emitted_ = 1
+
+        while 1:   # event loop for a given simulation
+
+            # Find packet with the lowest wtime (finishing time). It sits at
+            # the top of the heap; ties on wtime go to the packet with the
+            # lowest serial number
+            # If there are no packets left, we've reached the end
+            if not packets or packets[0][0] >= 999999999: break
+            mintime = packets[0][0]
+
+            # When building a checkpoint, stop once the next event is past
+            # the checkpoint time
+            if (stoptime is not None and mintime > stoptime): break
+
+            # If we are running the sim by watching the probe packets, stop
+            # the sim once the packets have left
+            if (ENDTIME == -1 and pending[0] == 0): break
+            # Otherwise, stop the sim once time runs out
+            if (ENDTIME > -1 and TIMECLOCK > ENDTIME): break
+
+            # Set clock to the finishing time of the selected packet
+            TIMECLOCK = mintime
+
+            minpkt = heappop(packets)[2]
+
+            if prof is not None:
+                now = timer()
+                phasetimes[1] += now - tmark
+                tmark = now
+                prof.events += 1
+                size = len(packets) + 1     # with the packet just taken
+                prof.heapsum += size
+                if size > prof.heapmax: prof.heapmax = size
+                kind = types[minpkt.location]
+                eventtypes[kind] = eventtypes.get(kind, 0) + 1
+
+            # Move the packet on from the component it is at
+            handlers[minpkt.location](minpkt, TIMECLOCK)
+
+            if prof is not None:
+                now = timer()
+                phasetimes[2] += now - tmark
+                tmark = now
+
+        pktserial = serials.next()
+        if prof is not None:
+            phasetimes[1] += timer() - tmark
+            prof.ctpackets += pktserial - firstserial
+
+        return TIMECLOCK, pktserial
+
+    # The handlers of the events of a call of _eventloop, by component ID:
+    # handlers[id](pkt, now) moves packet pkt on from component id, once it
+    # is done there at time "now", and emitters[i](now) creates the next
+    # packet of packet generator i. The handlers share the heap, the packet
+    # serials, the count of pending probes and the records of result with
+    # the loop.
+    # Each handler is built for its component and for the settings of the
+    # simulator, and calls the handler of the packet's arrival at its next
+    # component directly, so that moving a packet on takes no dispatch on
+    # the types of the components. Queues get lean handlers, unless their
+    # debug, recdelays, queuestats or dropprob (for queues that lead on to
+    # another component) call for the full ones; the handler of a wire is
+    # just the arrival at its outputdest. Components no packet reaches get
+    # no handler.
+    # If there is a tracer, the arrivals at and departures from the
+    # components it traces are wrapped to record them
+    def _handlers(self, result, packets, serials, pending, probebase):
+        comps = self.components()
+        kinds = self._kinds
+        nexthop = self._nexthop
+        dispersion = result.dispersion
+        tracer = self.tracer
+        traced = [tracer is not None and tracer.traces(comp.type, comp.index) for comp in comps]
+
+        arrivals = [None]*len(comps)
+        for id in range(0,len(comps)):
+            if kinds[id] == INQUEUE:
+                arrivals[id] = self._queuearrival(id, packets, dispersion)
+                if traced[id]: arrivals[id] = tracer.arrival(id, arrivals[id], comps[id])
+            elif kinds[id] == INWIRE:
+                arrivals[id] = self._wirearrival(id, packets)
+                if traced[id]: arrivals[id] = tracer.arrival(id, arrivals[id])
+
+        handlers = [None]*len(comps)
+        emitters = []
+        for id in range(0,len(comps)):
+            if nexthop[id] is None:
+                continue
+            if nexthop[id] == -1:
+                arrive = None
+            else:
+                arrive = arrivals[nexthop[id]]
+            if kinds[id] == INQUEUE:
+                handlers[id] = self._queuedeparture(id, arrive, result, pending, probebase, dispersion)
+            elif kinds[id] == INWIRE:
+                handlers[id] = arrive
+            elif kinds[id] == INPKTGEN:
+                emit, handlers[id] = self._pktgenhandlers(id, arrive, packets, serials, dispersion)
+                emitters.append(emit)
+            else:
+                handlers[id] = self._probegenhandler(id, arrive, result, probebase)
+            if traced[id]:
+                if kinds[id] == INQUEUE:
+                    handlers[id] = tracer.departure(id, handlers[id], comps[id], arrive is None,
+                                                    arrive is not None and comps[id].dropprob > 0)
+                else:
+                    handlers[id] = tracer.departure(id, handlers[id])
+        return handlers, emitters
+
+    # The handler of the arrival of a packet at queue "id" (its component
+    # ID), which records, for probe packets, whether the queue had become
+    # empty since the last probe, was empty or held no probes, starts a busy
+    # period if the queue was empty, and puts the packet back on the heap to
+    # finish once the queue has served everything before it and the packet
+    # itself. The full handler also keeps the queuestats, records the delay
+    # and prints the debug info
+    def _queuearrival(self, id, packets, dispersion):
+        queue = self.queues[self._indexes[id]]
+        queueidx = queue.index
+        procrate = queue.procrate
+        recdelays = self.recdelays
+        queuestats = self.queuestats
+        heappush = heapq.heappush
+
+        def probearrival(pkt):
+            pkt.qgap.append(queue._gapoccurred_)
+
+            if(queue._numinqueue_==0):
+                pkt.qempty.append((queueidx,1))
+            else:
+                pkt.qempty.append((queueidx,0))
+
+            if(queue._numprobes_==0):
+                pkt.qprobe.append((queueidx,1))
+            else:
+                pkt.qprobe.append((queueidx,0))
+
+            queue._numprobes_ += 1
+            queue._gapoccurred_ = 0
+
+        def arrive(pkt, now):
+            if pkt.type == PROBE: probearrival(pkt)
+            numinqueue = queue._numinqueue_
+            if numinqueue == 0: queue._busysince_ = now
+            queue._numinqueue_ = numinqueue + 1
+
+            # The queue empties once it has served what it held before (or
+            # now, if it had become empty) and then the new packet
+            emptytime = queue._emptytime_
+            if emptytime < now: emptytime = now
+            emptytime += pkt.size/procrate
+            queue._emptytime_ = emptytime
+            pkt.wtime = emptytime
+            pkt.location = id
+            heappush(packets, (emptytime, pkt.serial, pkt))
+
+        def arrivefull(pkt, now):
+            if pkt.type == PROBE: probearrival(pkt)
+
+            # If there are no packets in a queue, record the time (useful
+            # so we can calculate the utilization)
+            if(queue._numinqueue_==0): queue._busysince_ = now
+            if queuestats:
+                queue.addlength(now)
+                queue.addwork(now)
+                queue._arrivals_ += 1
+            queue._numinqueue_ += 1
+
+            # Add new list and record time of entry to queue
+            if(recdelays==1):
+                pkt.delays.append([(queueidx,),now])
+
+            if(queue.debug): print "(ITER "+`dispersion`+") TIME "+`now`+": ("+pkt.type+") Packet "+`pkt.serial`+" entering queue "+`queueidx`
+
+            # Calculate transmission time of the packet (based on its
+            # size and the transmission rate of the queue server)
+            transtime = pkt.size/procrate
+
+            # If the queue had become empty before our arrival, set the
+            # empty time to the current time (since the queue is empty
+            # now, too
+
+            if(queue._emptytime_ < now):
+                queue._emptytime_ = now
+
+            # Add the transmission time of the newly-arrived packet to
+            # the empty-time (after the old empty time, the queue won't
+            # be empty, but will have one remaining packet: the new
+            # packet. By adding the transmission time of the new packet,
+            # we get an accurate empty time)
+
+            queue._emptytime_ += transtime
+
+            # Set finishing time of packet to the current empty-time of
+            # the queue
+            pkt.wtime = queue._emptytime_
+
+            if queuestats:
+                if queue._numinqueue_ > queue._maxlength_: queue._maxlength_ = queue._numinqueue_
+                if queue.delaystats is not None: queue.delaystats.add(pkt.wtime - now)
+
+            pkt.location = id
+            heappush(packets, (pkt.wtime, pkt.serial, pkt))
+
+        if queuestats or recdelays == 1 or queue.debug:
+            return arrivefull
+        return arrive
+
+    # The handler of a packet leaving queue "id", which hands it on to
+    # "arrive", the arrival at the queue's outputdest, or if that is None,
+    # lets it leave the system (recording when it left, if it is a probe).
+    # The full handler also drops nonprobe packets with probability dropprob
+    # (if they don't leave the system), keeps the queuestats, records the
+    # delay and prints the debug info
+    def _queuedeparture(self, id, arrive, result, pending, probebase, dispersion):
+        queue = self.queues[self._indexes[id]]
+        dropprob = queue.dropprob
+        recdelays = self.recdelays
+        queuestats = self.queuestats
+        pktlcur = result.pktleave
+        pktqey = result.pktqempty
+        pktqprb = result.pktqprobe
+        pktqg = result.pktqgap
+        alldelays = result.delays
+
+        def probeleft(pkt, now):
+            pending[0] -= 1
+            probenum = pkt.serial - probebase
+            pktlcur[probenum] = now
+            pktqey[probenum] = pkt.qempty
+            pktqprb[probenum] = pkt.qprobe
+            pktqg[probenum] = pkt.qgap
+
+        def depart(pkt, now):
+            numinqueue = queue._numinqueue_ - 1
+            queue._numinqueue_ = numinqueue
+            if numinqueue == 0:
+                queue._busytime_ += now - queue._busysince_
+                queue._gapoccurred_ = 1
+            if pkt.type == PROBE:
+                queue._numprobes_ -= 1
+                if arrive is None: probeleft(pkt, now)
+            if arrive is not None: arrive(pkt, now)
+
+        def departfull(pkt, now):
+            if queuestats:
+                queue.addlength(now)
+                queue._departures_ += 1
+                queue._departedbytes_ += pkt.size
+            queue._numinqueue_ -= 1
+            if(pkt.type == PROBE): queue._numprobes_ -= 1
+            if(queue._numinqueue_==0):
+                queue._busytime_ += now - queue._busysince_
+                queue._gapoccurred_ = 1
+            if recdelays == 1:
+                pkt.delays[-1][1] = now - pkt.delays[-1][1]
+
+            if arrive is None:
+                if(queue.debug): print "(ITER "+`dispersion`+") TIME "+`now`+" ("+pkt.type+") Packet "+`pkt.serial`+" left"
+                if(pkt.type == PROBE): probeleft(pkt, now)
+                if recdelays == 1: alldelays.append(pkt.delays)
+            elif(pkt.type == NONPROBE and dropprob > 0 and queue.rng.random() < dropprob):
+                # The packet is dropped: like a packet leaving the system,
+                # it is simply not put back on the heap
+                if queuestats: queue._drops_ += 1
+            else:
+                arrive(pkt, now)
+
+        if queuestats or recdelays == 1 or queue.debug or (arrive is not None and dropprob > 0):
+            return departfull
+        return depart
+
+    # The handler of the arrival of a packet at wire "id", which puts it
+    # back on the heap to finish after the propagation delay
+    def _wirearrival(self, id, packets):
+        propdelay = self.wires[self._indexes[id]].propdelay
+        heappush = heapq.heappush
+
+        def arrive(pkt, now):
+            pkt.wtime = now + propdelay
+            pkt.location = id
+            heappush(packets, (pkt.wtime, pkt.serial, pkt))
+
+        return arrive
+
+    # The handlers of packet generator "id": emit(now) creates its next
+    # packet, to leave the generator after the next interarrival time, and
+    # depart(pkt, now) injects a packet into the generator's outputdest (by
+    # way of "arrive") and then creates the next one. The full emitter
+    # prints the debug info and, if profiling, times the creation of the
+    # packet as the generate phase (taking it out of the move phase it
+    # happens in)
+    def _pktgenhandlers(self, id, arrive, packets, serials, dispersion):
+        i = self._indexes[id]
+        gen = self.pktgens[i]
+        sizefunc, sizeargs = gen._sizepdf_
+        arrivfunc, arrivargs = gen._arrivpdf_
+        recdelays = self.recdelays
+        prof = self.profiler
+        nextserial = serials.next
+        heappush = heapq.heappush
+
+        def emit(now):
+            newpkt = Packet(NONPROBE, id, sizefunc(*sizeargs), nextserial(), now+arrivfunc(*arrivargs), recdelays)
+            heappush(packets, (newpkt.wtime, newpkt.serial, newpkt))
+
+        def emitfull(now):
+            if prof is not None: start = prof.timer()
+            newpkt = Packet(NONPROBE, id, sizefunc(*sizeargs), nextserial(), now+arrivfunc(*arrivargs), recdelays)
+            heappush(packets, (newpkt.wtime, newpkt.serial, newpkt))
+            if(gen.debug): print "(ITER "+`dispersion`+") CT SOURCE "+`i`+" EMITTED PACKET "+`newpkt.serial`+" AT TIME "+`newpkt.wtime`
+            if prof is not None:
+                elapsed = prof.timer() - start
+                prof.phasetimes[0] += elapsed
+                prof.phasetimes[2] -= elapsed
+
+        if gen.debug or prof is not None:
+            emit = emitfull
+
+        def depart(pkt, now):
+            arrive(pkt, now)
+            emit(now)
+
+        return emit, depart
+
+    # The handler of a probe packet leaving probe generator "id", which
+    # records the time it entered the system and injects it into the
+    # generator's outputdest
+    def _probegenhandler(self, id, arrive, result, probebase):
+        pktecur = result.pktenter
+
+        def depart(pkt, now):
+            pktecur[pkt.serial - probebase] = now
+            arrive(pkt, now)
+
+        return depart
+
+# Derive the seed of run number "runnum" of a sweep from the master seed.
+# Every run gets its own stream, no matter which process ends up running it
+
+def runseed(masterseed, runnum):
+    return int(hashlib.sha1('%d:%d' % (masterseed, runnum)).hexdigest()[:16], 16)
+
+
+# Derive the seed of the cross traffic of replication number "replication"
+# of a sweep with common random numbers, which all the runs of that
+# replication share, whatever their dispersion
+
+def commonseed(masterseed, replication):
+    return int(hashlib.sha1('%d:common:%d' % (masterseed, replication)).hexdigest()[:16], 16)
+
+
+# Run one group of consecutive runs of a sweep, the first of which is run
+# number "first", and return their RunResults.
+# If checkpointspacing is set, the runs are forked from the checkpoints of a
+# single trajectory, one checkpoint per run. The trajectory gets a seed of
+# its own, derived from the master seed and the group, so it differs from
+# group to group.
+# If fastpath is set, the whole group is instead solved at once by
+# lindley.runbatch, seeded from the master seed and the group. Only do so
+# if lindley.supports(sim).
+# If replications is given (with a master seed, and a simulator with
+# rngstreams), it holds the replication number of each run, and the cross
+# traffic of each run is seeded with the commonseed of its replication
+
+def rungroup(sim, first, dispersions, masterseed=None, checkpointspacing=None,
+             fastpath=0, replications=None):
+    if fastpath:
+        import lindley
+        if sim.profiler is not None: sim.profiler.startrun()
+        if masterseed is None:
+            results = lindley.runbatch(sim, dispersions)
+        else:
+            results = lindley.runbatch(sim, dispersions, runseed(masterseed, first))
+        if sim.profiler is not None: sim.profiler.endrun(len(results))
+        return results
+
+    results = []
+    if checkpointspacing is not None:
+        if masterseed is None:
+            trajectory = sim.checkpoints(checkpointspacing)
+        else:
+            trajectory = sim.checkpoints(checkpointspacing, runseed(masterseed, -1-first))
+    common = None
+    for i in range(0,len(dispersions)):
+        if masterseed is None:
+            seed = None
+        else:
+            seed = runseed(masterseed, first+i)
+        if replications is not None:
+            common = commonseed(masterseed, replications[i])
+        if checkpointspacing is None:
+            results.append(sim.run(dispersions[i], seed, commonseed=common))
+        else:
+            results.append(sim.run(dispersions[i], seed, trajectory.next(), common))
+    return results
+
+
+# The settings used by the worker processes of runsweep. The workers are
+# forked from the parent, so they inherit the simulator rather than having it
+# pickled (the PDFs of the components hold bound methods, which can't be
+# pickled). If the simulator has a profiler, a worker sends back the
+# counters of each group along with its results, for the parent's profiler
+# to add up
+
+_poolargs = None
+
+def _runjob(job):
+    first, dispersions, replications = job
+    sim, masterseed, checkpointspacing, fastpath = _poolargs
+    prof = sim.profiler
+    if prof is not None:
+        prof.clear()
+        prof.interval = 0
+    results = rungroup(sim, first, dispersions, masterseed, checkpointspacing,
+                       fastpath, replications)
+    if prof is not None:
+        return results, prof.counters()
+    return results, None
+
+
+# Run the simulator once for every dispersion in iterlist, yielding the
+# RunResults in the same order as iterlist.
+# If masterseed is given, run number i is seeded with runseed(masterseed, i),
+# so the results do not depend on how many workers are used. If numworkers
+# is more than 1, the runs are handed out in chunks of chunksize to a pool
+# of that many processes. A parallel sweep without a master seed gets a
+# random one, since otherwise every worker would start from the same state.
+# If commonrandom is set (which needs a simulator with rngstreams), the
+# sweep uses common random numbers: the k-th run at each dispersion of
+# iterlist is replication k, and all the runs of a replication see the same
+# cross traffic, so that the differences between dispersions are measured
+# with far fewer runs. replications, if given, holds the replication
+# number of every run of iterlist instead. Such a sweep gets a random
+# master seed too, if it has none.
+# If checkpointspacing is set, the runs are forked from checkpoints instead
+# of each simulating its own warm-up (see Simulator.checkpoints). Every
+# forkruns consecutive runs share one trajectory; the groups, rather than
+# chunksize, are then what is handed out to the workers.
+# If fastpath is set and the topology is a single FIFO queue that lindley.py
+# can solve, groups of fastbatch runs are solved at once with NumPy instead
+# (in which case checkpointspacing has no effect).
+# If start is given, the runs before run number start are left out (e.g.
+# because they are already stored from an interrupted sweep). The groups are
+# still counted from the first run, so the runs that are made give the same
+# results as they would in the whole sweep.
+# The runs are numbered (for seeding) from runbase on, so that several
+# sweeps with the same master seed can be kept apart.
+# If coordinator is given (a distsweep.Coordinator), the groups are handed
+# out to its workers instead of a pool, chunksize runs at a time (by
+# default distsweep.CHUNKRUNS), and numworkers is not used. Such a sweep
+# gets a random master seed too, if it has none
+
+def runsweep(sim, iterlist, masterseed=None, numworkers=1, chunksize=None,
+             checkpointspacing=None, forkruns=1000, fastpath=0,
+             fastbatch=1000, start=0, runbase=0, commonrandom=0,
+             replications=None, coordinator=None):
+    global _poolargs
+
+    if commonrandom and not sim.rngstreams:
+        raise ValueError('common random numbers need a simulator with rngstreams')
+    if (numworkers > 1 or commonrandom or coordinator is not None) and masterseed is None:
+        masterseed = random.SystemRandom().getrandbits(64)
+
+    if commonrandom and replications is None:
+        replications = []
+        counts = {}
+        for dispersion in iterlist:
+            replications.append(counts.get(dispersion, 0))
+            counts[dispersion] = replications[-1] + 1
+    elif not commonrandom:
+        replications = None
+
+    if fastpath:
+        import lindley
+        fastpath = lindley.supports(sim)
+
+    if fastpath:
+        groupsize = fastbatch
+    elif checkpointspacing is not None:
+        groupsize = forkruns
+    elif coordinator is not None:
+        import distsweep
+        groupsize = chunksize or distsweep.CHUNKRUNS
+    elif numworkers <= 1:
+        groupsize = 1
+    elif chunksize is None:
+        groupsize = max(1, len(iterlist)/(numworkers*16))
+    else:
+        groupsize = chunksize
+
+    # The group holding run number start is run whole, and the runs of it
+    # before start thrown away
+    groupstart = start - start % groupsize
+    groups = ((runbase+first, iterlist[first:first+groupsize],
+               replications and replications[first:first+groupsize])
+              for first in range(groupstart,len(iterlist),groupsize))
+    skip = start - groupstart
+
+    if coordinator is not None:
+        for results, counters in coordinator.run(groups, masterseed, checkpointspacing, fastpath):
+            if counters is not None:
+                sim.profiler.merge(counters)
+            for res in results[skip:]:
+                yield res
+            skip = 0
+        return
+
+    if numworkers <= 1:
+        for first, dispersions, reps in groups:
+            results = rungroup(sim, first, dispersions, masterseed, checkpointspacing, fastpath, reps)
+            for res in results[skip:]:
+                yield res
+            skip = 0
+        return
+
+    _poolargs = (sim, masterseed, checkpointspacing, fastpath)
+    pool = multiprocessing.Pool(numworkers)
+    try:
+        for results, counters in pool.imap(_runjob, groups):
+            if counters is not None:
+                sim.profiler.merge(counters)
+            for res in results[skip:]:
+                yield res
+            skip = 0
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        _poolargs = None
+
+
+# Run the simulator at each of the given dispersions in turn, as runsweep
+# would, but making only as many runs at each as it takes to pin down the
+# mean output dispersion. The runs are made in batches of batch runs
+# (through runsweep, which the other keyword arguments are passed on to).
+# After each batch the confidence interval on the mean output dispersion of
+# every gap of every probe train is checked; once each is within ciwidth of
+# its mean either side (ciwidth being a fraction of the mean) and, if
+# utilwidth is given, the interval on the true utilization of every queue is
+# within utilwidth either side, the sweep moves on to the next dispersion.
+# It also moves on after maxrepeats runs. The intervals are at the given
+# level, by the normal approximation, and take the runs to be independent
+# (which runs forked from one trajectory are not quite).
+# The RunResults are yielded as they finish. As each dispersion is done,
+# (dispersion, runs, disphalfwidth, utilhalfwidth) is appended to counts,
+# the half-widths being the widest of the intervals (that of the output
+# dispersion relative to its mean); a half-width is None if there were too
+# few runs to tell.
+# Run j at the i-th dispersion is run number i*maxrepeats+j, so with a
+# master seed the results do not depend on the number of workers. With
+# commonrandom, run j at every dispersion is replication j. The
+# results an interrupted sweep with the same settings has already made can
+# be given as stored, in the order they were made: they count towards their
+# dispersions (without being yielded again) and the sweep carries on after
+# them
+
+def adaptivesweep(sim, dispersions, ciwidth, utilwidth=None, level=0.95,
+                  batch=1000, maxrepeats=40000, counts=None, stored=(),
+                  **kwargs):
+    stored = iter(stored)
+
+    # Every batch is a sweep of its own, so with common random numbers the
+    # master seed has to be drawn here, for them all to share it
+    if kwargs.get('commonrandom') and kwargs.get('masterseed') is None:
+        kwargs['masterseed'] = random.SystemRandom().getrandbits(64)
+    for i in range(0,len(dispersions)):
+        dispersion = dispersions[i]
+        dispstats = {}
+        utilstats = [onlinestats.Moments() for queue in sim.queues]
+
+        def add(res):
+            first = 0
+            for train in range(0,len(res.trains)):
+                for gap in range(1,res.trains[train]):
+                    k = first + gap
+                    if res.pktleave[k] is None or res.pktleave[k-1] is None:
+                        continue
+                    if (train, gap) not in dispstats:
+                        dispstats[(train, gap)] = onlinestats.Moments()
+                    dispstats[(train, gap)].add(res.pktleave[k] - res.pktleave[k-1])
+                first += res.trains[train]
+            for q in range(0,len(utilstats)):
+                utilstats[q].add(res.trueUtilization[q])
+
+        done = 0
+        while done < maxrepeats:
+            numruns = min(batch, maxrepeats - done)
+            made = 0
+            for res in itertools.islice(stored, numruns):
+                add(res)
+                made += 1
+            if made < numruns:
+                for res in runsweep(sim, [dispersion]*numruns, start=made,
+                                    runbase=i*maxrepeats+done,
+                                    replications=range(done, done+numruns),
+                                    **kwargs):
+                    add(res)
+                    yield res
+            done += numruns
+
+            # The widest intervals so far (None while any interval is
+            # still unknown)
+            disphw = None
+            for m in dispstats.values():
+                hw = m.halfwidth(level)
+                if hw is None:
+                    disphw = None
+                    break
+                if m.mean > 0: hw = hw/m.mean
+                if disphw is None or hw > disphw: disphw = hw
+            utilhw = None
+            for m in utilstats:
+                hw = m.halfwidth(level)
+                if hw is None:
+                    utilhw = None
+                    break
+                if utilhw is None or hw > utilhw: utilhw = hw
+            if (disphw is not None and disphw <= ciwidth and
+                (utilwidth is None or (utilhw is not None and utilhw <= utilwidth))):
+                break
+
+        if counts is not None:
+            counts.append((dispersion, done, disphw, utilhw))
+
+
+# Print the results of a sweep as its runs finish, rather than holding them
+# all until the end. Results are given to add() in the order they were run,
+# and finish() prints the totals once the sweep is over.
+# Packet times are printed in one of two styles:
+# If outputstyle is set to 1, print out packet times in
+# (entering time, leaving time) format, one line per probe packet
+# If outputstyle is set otherwise, print out packet times in
+# (initial dispersion, final dispersion) format: one line per probe train,
+# giving the input and output dispersion of each of its gaps in turn, then
+# whether each packet found the first queue without probes, then whether
+# the first queue emptied before each packet after the first
+# If recdelays is set, the delays of every nonprobe packet are printed too,
+# after the totals, unless listdelays is 0. They are spooled to a temporary
+# file in the meantime. Their mean and count go to err either way
+
+class ResultPrinter(object):
+
+    def __init__(self, outputstyle=0, recdelays=0, out=None, err=None,
+                 listdelays=1):
+        self.outputstyle = outputstyle
+        self.recdelays = recdelays
+        self.listdelays = listdelays
+        self.out = out or sys.stdout
+        self.err = err or sys.stderr
+        self.numutils = 0
+        self.trueUtilAvg = []
+        self.adjUtilAvg = []
+        self.lengthAvg = []
+        self.backlogAvg = []
+        self.timeclock = 0.0
+        self.numdelays = 0
+        self.sumdelays = 0
+        if recdelays == 1 and listdelays:
+            self.spool = tempfile.TemporaryFile()
+
+    def add(self, res):
+        out = self.out
+        pktenter = res.pktenter
+        pktleave = res.pktleave
+        if(self.outputstyle==1):
+            for k in range(0,len(pktenter)):
+                print >>out, pktenter[k],pktleave[k]
+        elif(self.outputstyle==0):
+            first = 0
+            for numpkts in res.trains or [len(pktenter)]:
+                train = range(first, first+numpkts)
+                first += numpkts
+                gaps = ["%0.10f %0.10f" % ((pktenter[k] - pktenter[k-1]), (pktleave[k] - pktleave[k-1])) for k in train[1:]]
+                qprobe = [`res.pktqprobe[k][1][1]` for k in train]
+                qgap = ["-"+`res.pktqgap[k][1]` for k in train[1:]]
+                print >>out, " ".join(gaps) + "   " + "   ".join(qprobe) + "  " + " ".join(qgap)
+
+        # Keep running sums of the utilizations, to average over all runs
+
+        if(self.numutils == 0):
+            self.trueUtilAvg = res.trueUtilization[:]
+            self.adjUtilAvg = res.adjustedUtilization[:]
+            self.lengthAvg = res.meanQueueLength[:]
+            self.backlogAvg = res.meanBacklog[:]
+        else:
+            for i in range(0,len(res.trueUtilization)):
+                self.trueUtilAvg[i] += res.trueUtilization[i]
+                self.adjUtilAvg[i] += res.adjustedUtilization[i]
+            for i in range(0,len(res.meanQueueLength)):
+                self.lengthAvg[i] += res.meanQueueLength[i]
+                self.backlogAvg[i] += res.meanBacklog[i]
+        self.numutils += 1
+        self.timeclock = res.timeclock
+
+        if self.recdelays == 1:
+            for i in res.delays:
+                if(i[0] == NONPROBE):
+                    subarr = i[1:]
+                    for j in subarr:
+                        self.numdelays = self.numdelays + 1
+                        if self.listdelays: self.spool.write(str(j[1])+"\n") # j[0][0], j[1]
+                        self.sumdelays = self.sumdelays + j[1]
+
+    def finish(self):
+        out = self.out
+
+        # Calculate average of utilizations over all runs
+
+        numutils = self.numutils
+        trueUtilAvg = self.trueUtilAvg
+        adjUtilAvg = self.adjUtilAvg
+        for i in range(0,len(trueUtilAvg)):
+            trueUtilAvg[i] = trueUtilAvg[i]/numutils
+            adjUtilAvg[i] = adjUtilAvg[i]/numutils
+
+        print >>out, "TRUE UTILIZATION (incl. probe packets): ",trueUtilAvg
+        print >>out, "ADJUSTED UTILIZATION: ",adjUtilAvg
+        if self.lengthAvg:
+            print >>out, "MEAN QUEUE LENGTH: ",[length/numutils for length in self.lengthAvg]
+            print >>out, "MEAN BACKLOG (bytes): ",[backlog/numutils for backlog in self.backlogAvg]
+        print >>out, "TIMECLOCK: ",self.timeclock
+
+        # If the user wanted all delays to be recorded (by setting recdelays
+        # to 1) display them
+
+        if self.recdelays == 1:
+            if self.listdelays:
+                self.spool.seek(0)
+                shutil.copyfileobj(self.spool, out)
+                self.spool.close()
+
+            self.err.write("((("+`self.sumdelays/(self.numdelays*1.0)`+")))\n")
+            self.err.write("Total number of packets: "+`self.numdelays`)
+
+
+# Running statistics of a sweep, kept without storing the observations (see
+# onlinestats.py):
+# dispstats: the output dispersion of each gap of the probe trains, per
+#            (input dispersion, train, gap)
+# ingapstats: the same, for the input dispersion of each gap (which differs
+#            from the input dispersion of the run for chirps)
+# Gaps whose probes had not both left by the end of the run are left out
+# delaystats: the delays of the nonprobe packets (if recorded), per queue,
+#            over all runs
+# rundelaystats: the same, per (input dispersion, queue)
+# quantiles gives the quantiles to estimate; delayhist and disphist, if
+# given as (low, high, numbins), add histograms of the delays and output
+# dispersions
+
+class SweepStats(object):
+
+    def __init__(self, quantiles=(0.5, 0.9, 0.99), delayhist=None,
+                 disphist=None):
+        self.dispstats = onlinestats.StatTable(quantiles, disphist)
+        self.ingapstats = onlinestats.StatTable(())
+        self.delaystats = onlinestats.StatTable(quantiles, delayhist)
+        self.rundelaystats = onlinestats.StatTable(quantiles, delayhist)
+
+    def add(self, res):
+        pktenter = res.pktenter
+        pktleave = res.pktleave
+        first = 0
+        for train in range(0,len(res.trains)):
+            for gap in range(1,res.trains[train]):
+                k = first + gap
+                if pktleave[k] is None or pktleave[k-1] is None:
+                    continue
+                key = (res.dispersion, train, gap)
+                self.dispstats.add(key, pktleave[k] - pktleave[k-1])
+                self.ingapstats.add(key, pktenter[k] - pktenter[k-1])
+            first += res.trains[train]
+
+        delaystats = self.delaystats
+        rundelaystats = self.rundelaystats
+        dispersion = res.dispersion
+        for i in res.delays:
+            if(i[0] == NONPROBE):
+                for j in i[1:]:
+                    delaystats.add(j[0][0], j[1])
+                    rundelaystats.add((dispersion, j[0][0]), j[1])
+
+    # Write the statistics to out, one line per key, each followed by its
+    # histogram if there is one
+    def report(self, out):
+        for key in self.dispstats.keys():
+            print >>out, "INPUT DISPERSION dispersion %s train %s gap %s" % key, "mean=%.10g" % self.ingapstats[key].moments.mean
+        for title, table, keyfmt in (("OUTPUT DISPERSION", self.dispstats, "dispersion %s train %s gap %s"),
+                                     ("DELAY", self.delaystats, "queue %s"),
+                                     ("DELAY", self.rundelaystats, "dispersion %s queue %s")):
+            for key in table.keys():
+                summary = table[key]
+                print >>out, title, keyfmt % key, summary.report()
+                if summary.hist is not None:
+                    print >>out, "HISTOGRAM", title, keyfmt % key, summary.histreport()
+
+
+# Write the WindowResults of a long run to out (stdout by default) as they
+# come: a header line naming the columns, then a line per window and queue.
+# The delay columns are the mean, maximum and quantiles of the delays, nan
+# if no packets arrived. Every window is flushed as soon as it is written,
+# so that the file can be followed as the run goes
+
+def writewindows(windows, out=None):
+    out = out or sys.stdout
+    header = 0
+    for win in windows:
+        if not header:
+            columns = ["start", "end", "queue", "arrivals", "departures",
+                       "drops", "throughput", "utilization", "meanlength",
+                       "maxlength", "meanbacklog", "delaymean", "delaymax"]
+            if win.delays:
+                columns += ["delayp%g" % (est.p*100) for est in win.delays[0].quantiles]
+            print >>out, "# " + " ".join(columns)
+            header = 1
+        for i in range(0,len(win.arrivals)):
+            delays = win.delays[i]
+            if delays.moments.count == 0:
+                delaycols = [float('nan')]*(2 + len(delays.quantiles))
+            else:
+                delaycols = [delays.moments.mean, delays.moments.max] + [est.value() for est in delays.quantiles]
+            print >>out, "%.10g %.10g %d %d %d %d" % (win.start, win.end, i, win.arrivals[i], win.departures[i], win.drops[i]),
+            print >>out, " ".join(["%.10g" % x for x in [win.throughput[i], win.utilization[i], win.meanQueueLength[i]]]),
+            print >>out, win.maxQueueLength[i],
+            print >>out, " ".join(["%.10g" % x for x in [win.meanBacklog[i]] + delaycols])
+        out.flush()
+
+
+# Print the results of a whole sweep, given as a list of RunResults in the
+# order they were run (see ResultPrinter)
+
+def printresults(results, outputstyle=0, recdelays=0):
+    printer = ResultPrinter(outputstyle, recdelays)
+    for res in results:
+        printer.add(res)
+    printer.finish()
+
+
+# SCRIPT SETTINGS, used when the simulator is run from the command line
+
+iterations = 500       # Number of dispersion values to run the sim at
+iterstep = 5           # Step size of dispersion values
+dispersions = None     # If set, the list of dispersion values to run the
+                       # sim at instead, e.g. [0.0032] to probe at a single
+                       # dispersion, or the first gaps of a set of chirps
 
 outputstyle = 0       # Outputstyle = 1 means that the simulator will output
                        # (input-time,output-time) pairs, as opposed to the
                        # usual (input-dispersion,output-dispersion)
 
-alldelays = []         # used to record delays that every packet sees
 recdelays = 0          # set to 1 if we want delays recorded
+queuestats = 0         # set to 1 to measure the mean queue lengths and
+                       # backlogs as well
+listdelays = 1         # With recdelays, set to 0 to leave out the listing
+                       # of every delay (statsfile summarizes them instead)
 numrepeats = 40000     # Number of pairs sent for each dispersion value
+ciwidth = None         # If set, the number of runs at each dispersion is
+                       # adaptive instead: runs are made until the confidence
+                       # interval on the mean output dispersion is within
+                       # this fraction of the mean either side (e.g. 0.01),
+                       # up to numrepeats runs (see adaptivesweep)
+ciutilwidth = None     # With ciwidth, also make runs until the interval on
+                       # the true utilization of each queue is this wide
+                       # either side (e.g. 0.005)
+cilevel = 0.95         # Confidence level of the intervals
+cibatch = 1000         # Runs made between checks of the intervals
+
+numworkers = 1         # Number of processes to spread the runs over
+coordinator = None     # If set, a "host:port" address to hand the runs out
+                       # from, to workers started there with distsweep.py
+                       # (on this machine or others); numworkers of them are
+                       # started on this machine (none if 0)
+authkey = None         # With coordinator, the secret the coordinator and its
+                       # workers share
+distchunk = 100        # With coordinator, the number of runs handed to a
+                       # worker at a time
+masterseed = None      # If set, every run is seeded from this, which makes
+                       # the output the same for any number of workers
+rngstreams = 0         # set to 1 to give every component its own random
+                       # stream, drawn in blocks (see streams.py)
+commonrandom = 0       # With rngstreams, set to 1 to give the k-th run at
+                       # every dispersion the same cross traffic (common
+                       # random numbers), which pins down the differences
+                       # between dispersions in far fewer runs
+
+checkpointspacing = None  # If set, the probe runs are forked from
+                       # checkpoints of a long cross-traffic trajectory taken
+                       # this many seconds apart, rather than each warming
+                       # up from an empty system for OFFSETTIME. Keep it well
+                       # above the length of a busy period
+forkruns = 1000        # Number of runs forked from one trajectory
+
+usefastpath = 1        # If set, and the topology is a single FIFO queue with
+                       # nothing after it, NumPy (if available) solves the
+                       # runs in batches with Lindley's recursion rather than
+                       # simulating them event by event
+fastbatch = 1000       # Number of runs solved in one batch
+
+resultdir = None       # If set, the results are also stored in this
+                       # directory as the runs finish (see resultstore.py);
+                       # an interrupted sweep then carries on from the last
+                       # stored chunk when restarted with the same settings
+chunkruns = 10000      # Number of runs stored at a time
+cachedir = None        # If set, the runs at each dispersion value are also
+                       # cached in this directory (see resultcache.py), and
+                       # sweeping again with the same topology, masterseed
+                       # and numrepeats only makes the runs of dispersions
+                       # missing from it. The runs are then seeded, and
+                       # printed, a dispersion at a time. Needs a masterseed
+cachesize = 2**30      # Size the cache is kept under, in bytes, by evicting
+                       # the least recently used dispersions
+
+statsfile = None       # If set, running statistics of the output dispersions
+                       # (and, with recdelays, of the delays) are written to
+                       # this file at the end (see SweepStats)
+statquantiles = (0.5, 0.9, 0.99, 0.999)  # Quantiles they estimate
+delayhist = None       # (low, high, numbins) of the delay histograms, in
+                       # seconds, or None for no histograms
+disphist = None        # The same, for the output dispersions
+
+profile = 0            # If set, count and time the events of the sweep (see
+                       # instrument.py), reporting progress to stderr
+profileinterval = 10.0 # Seconds between progress reports (0 for none)
+profilefile = None     # If set, the totals are written to this file as JSON;
+                       # otherwise the last progress line goes to stderr
+
+tracefile = None       # If set, the events of the runs are recorded in this
+                       # file, a ring of the last tracerecords of them (see
+                       # tracer.py); the runs must all be made in this
+                       # process (numworkers = 1, no coordinator)
+tracerecords = 1000000 # Number of events the trace file holds
+tracecomponents = None # If set, a list of the components to trace, as
+                       # (type, index) pairs like an outputdest
+tracetypes = None      # If set, a list of the packet types to trace
+                       # (PROBE, NONPROBE)
+
+outputfile = None      # If set, the results go to this file, not stdout
+
+longrun = None         # If set, there is no sweep: instead one run of cross
+                       # traffic alone is simulated for this many seconds,
+                       # and the queues measured in windows (throughput,
+                       # drops, utilization, queue length, backlog and delay
+                       # quantiles), which go to outputfile as they end
+window = 1.0           # Length of those windows, in seconds
+
+# Set ENDTIME to -1  to terminate the simulation if there are no probe
+# packets being sent. If you would rather have the simulation run for a
+# period of time, whether probe packets are there or not, set this to the
+# time (in seconds)
+
+ENDTIME = -1 # 1000000.0
+
+# OFFSETTIME is used to provide a delay before the probe packets
+# are injected. It gives a chance for the simulation to get into
+# steady-state
+
+OFFSETTIME = 0.10
+
+
+# The names of the script settings above that a config file can also set,
+# in its "sweep" section (see simconfig.py)
+
+SETTINGS = ('iterations', 'iterstep', 'dispersions', 'numrepeats',
+            'ciwidth', 'ciutilwidth', 'cilevel', 'cibatch', 'outputstyle',
+            'listdelays', 'numworkers', 'coordinator', 'authkey', 'distchunk',
+            'masterseed', 'commonrandom', 'checkpointspacing', 'forkruns',
+            'usefastpath', 'fastbatch', 'resultdir', 'chunkruns', 'cachedir',
+            'cachesize', 'statsfile', 'statquantiles', 'delayhist',
+            'disphist', 'profile', 'profileinterval', 'profilefile',
+            'tracefile', 'tracerecords', 'tracecomponents', 'tracetypes',
+            'outputfile', 'longrun', 'window')
+
+# The current values of the script settings, as a dictionary
+
+def scriptsettings():
+    return dict([(name, globals()[name]) for name in SETTINGS])
+
+
+# Build the topology used by the script. Edit this to change the topology or
+# the load
+
+def buildsimulator():
+
+    queues = [Queue(0, (10000000.0/8.0), outputdest=-1, # ('QUEUE', 1)
+                    dropprob=0.0, debug=0), # 1
+              Queue(1, 5.0, outputdest=-1, dropprob=0.0, debug=0)] # 1
 
-numutils = 0
-
-trueUtilAvg = []
-adjUtilAvg = []
-trueUtilization = []
-adjustedUtilization = []
-
-# Used to construct a list of dispersions to iterate over
-iterlist = range(0,iterations,iterstep)
-
-#iterlist = []
-
-
-# Users can select one for statement or the other, depending on whether
-# they want to do a multiple-dispersion "chirp" or a single-dispersion probe
-
-#for i in [0.0032]:                     # Probing at a single dispersion
-for i in range(0,iterations,iterstep):  # Probing at multiple dispersions
-    for j in range(0,numrepeats):
-        iterlist.append(i)
-
-# Iterate over all runs
-for iter in iterlist:
-
-    # Used to record entering and leaving times of packets for this iteration
-    # run alone
-    pktecur = []
-    pktlcur = []
-    pktqey = []
-    pktqprb = []
-    pktqg = []
-   
-
-    # Global clock used to assign times to simulation events
-    TIMECLOCK = 0.0
-
-    # Set ENDTIME to -1  to terminate the simulation if there are no probe
-    # packets being sent. If you would rather have the simulation run for a
-    # period of time, whether probe packets are there or not, set this to the
-    # time (in seconds0
-
-    ENDTIME = -1 # 1000000.0
-
-    # GENERAL parameters:
-    # 'type': what type the component is (QUEUE, PKTGEN, PROBEGEN or WIRE)
-    # 'index': a numerical value used to distinguish components of the same
-    #          type
-    # 'debug': if set to 1, debug info related to the component will be
-    #          displayed
-    # 'outputdest': a two-tuple containing the type and number of the 
-    #               component that a packet should head to next after
-    #               finishing at the current component. An outputdest of
-    #               -1 indicates that a packet has reached the end
-
-
-    # QUEUE parameters:
-    # 'procrate': the rate, in bytes per second, that the queue services
-    #             a packet
-    # '_emptytime_': not a user-defined parameter (hence the underscores).
-    #                Its purpose is to record the time at which the queue
-    #                will become empty. It is used to calculate the total
-    #                waiting time of new packets
-
-    queues = [{}, {}, {}, {}]
-    queues[0]['type'] = 'QUEUE'
-    queues[0]['index'] = 0
-    queues[0]['_emptytime_'] = 0
-    queues[0]['_numinqueue_'] = 0
-    queues[0]['_numprobes_'] = 0
-    queues[0]['_gapoccurred_'] = 0
-    queues[0]['procrate'] = (10000000.0/8.0)
-    queues[0]['debug'] = 0 # 1
-    queues[0]['outputdest'] = -1 # ('QUEUE', 1) 
-    queues[0]['dropprob'] = 0.0
-    
-    queues[1]['type'] = 'QUEUE'
-    queues[1]['index'] = 1
-    queues[1]['_emptytime_'] = 0
-    queues[1]['_numinqueue_'] = 0
-    queues[1]['_numprobes_'] = 0
-    queues[1]['_gapoccurred_'] = 0
-    queues[1]['procrate'] = 5.0
-    queues[1]['debug'] = 0 # 1
-    queues[1]['outputdest'] = -1 
-    queues[1]['dropprob'] = 0.0
-   
-    
     #queues = [queues[0], queues[1]]
     queues = [queues[0]]
 
-    # PKTGEN parameters
-    # sizepdf: A two-tuple, consisting of an RNG function and its parameters,
-    #          used to determine the size of generated packets (in bytes)
-    # arrivpdf: A two-type, like sizepdf, used to determine the interarrival
-    #           times of generated packets to the outputdest
-    # _emitted_: Not meant for users to set. Set to 1 if a CT packet has been
-    #            created but not yet injected into the system. This prevents
-    #            the creation of huge numbers of CT packets which have to wait
-    #            around a long time before injection
-
-    pktgens = [{}, {}, {}, {}, {}, {}, {}, {}, {}, {}]
-    
-    pktgens[0]['type'] = 'PKTGEN'
-    pktgens[0]['index'] = 0
-    
-   
-    # Select a size PDF for the packet generator
-    pktgens[0]['sizepdf'] = (internetmix,()) 
-    #pktgens[0]['sizepdf'] = (determ,(1000.0,))
-    #pktgens[0]['sizepdf'] = (random.expovariate,(1/30.0,)) 
-
+    # Select a size PDF for the packet generator. Drawing in blocks pays
+    # off in long runs; runs of a few hundred packets, such as those of
+    # small dispersions, are quicker drawing one size at a time
+    sizepdf = (internetmix,())
+    #sizepdf = (sampling.INTERNETMIX,())      # internetmix, drawn in blocks
+    #sizepdf = (sampling.AliasTable.fromfile('sizes.hist'),())
+    #sizepdf = (determ,(1000.0,))
+    #sizepdf = (random.expovariate,(1/30.0,))
 
+    #arrivpdf = (random.expovariate,((1/20.0),)) # (random.expovariate,((1/20.0),)) # (determ,(100.0,))
+    #arrivpdf = (random.expovariate,((1/438.5),)) # (random.expovariate,((1/20.0),)) # (determ,(100.0,))
 
-    #pktgens[0]['arrivpdf'] = (random.expovariate,((1/20.0),)) # (random.expovariate,((1/20.0),)) # (determ,(100.0,))
-    #pktgens[0]['arrivpdf'] = (random.expovariate,((1/438.5),)) # (random.expovariate,((1/20.0),)) # (determ,(100.0,))
-    #pktgens[0]['arrivpdf'] = (random.expovariate,((1/438.5),)) # (random.expovariate,((1/20.0),)) # (determ,(100.0,))
-
-
-   
     # These values are calculated as follows:
     # Utilization = L*8*X/C
     # Where 8*L is the average size of the cross-traffic distribution, in
@@ -187,377 +1973,261 @@ for iter in iterlist:
     # Where C is the capacity of the queue
     # i.e. 438.5*8*855.1881/10000000 = 0.30
 
-    #pktgens[0]['arrivpdf'] = (random.expovariate,((2822.121),)) # 0.99 util
-    #pktgens[0]['arrivpdf'] = (random.expovariate,((2565.564),)) # 0.90 util
-    #pktgens[0]['arrivpdf'] = (random.expovariate,((2137.970),)) # 0.75 util
-    #pktgens[0]['arrivpdf'] = (random.expovariate,((1995.439),)) # 0.70 util
-    #pktgens[0]['arrivpdf'] = (random.expovariate,((1425.314),)) # 0.50 util
-    pktgens[0]['arrivpdf'] = (random.expovariate,((855.1881),)) # 0.30 util
-    #pktgens[0]['arrivpdf'] = (random.expovariate,((712.657),)) # 0.25 util
-    #pktgens[0]['arrivpdf'] = (random.expovariate,((285.0627),)) # 0.10 util
+    #arrivpdf = (random.expovariate,((2822.121),)) # 0.99 util
+    #arrivpdf = (random.expovariate,((2565.564),)) # 0.90 util
+    #arrivpdf = (random.expovariate,((2137.970),)) # 0.75 util
+    #arrivpdf = (random.expovariate,((1995.439),)) # 0.70 util
+    #arrivpdf = (random.expovariate,((1425.314),)) # 0.50 util
+    arrivpdf = (random.expovariate,((855.1881),)) # 0.30 util
+    #arrivpdf = (random.expovariate,((712.657),)) # 0.25 util
+    #arrivpdf = (random.expovariate,((285.0627),)) # 0.10 util
 
-    pktgens[0]['outputdest'] = ('QUEUE', 0) # ('QUEUE', 0)
-    pktgens[0]['debug'] = 0 # 1
-    pktgens[0]['_emitted_'] = 0
+    pktgens = [PacketGenerator(0, sizepdf, arrivpdf, ('QUEUE', 0), debug=0)] # 1
 
+    # Another packet generator, with the same settings as the first except
+    # for the parts altered here
+    pktgens.append(PacketGenerator(1, (random.expovariate,(1/10.0,)), # 20
+                                   (random.expovariate,((1/20.0),)), # (determ,(100.0,))
+                                   ('QUEUE', 1), debug=0))
 
-   
-    # Another packet generator. We copy all the information from the first,
-    # and then alter some parts to suit us
-    pktgens[1] = pktgens[0].copy()
-    pktgens[1]['index'] = 1
-    pktgens[1]['outputdest'] = ('QUEUE', 1)
-    pktgens[1]['sizepdf'] = (random.expovariate,(1/10.0,)) # 20
-    pktgens[1]['arrivpdf'] = (random.expovariate,((1/20.0),)) # (determ,(100.0,))
-
-    # Cut down pktgens to the appropriate site (however many packet generators
-    # we want to use)
+    # Cut down pktgens to the appropriate site (however many packet
+    # generators we want to use)
 
     #pktgens = []                                       # no CT
     pktgens = [pktgens[0]]
 
-
-
-    # PROBEGEN parameters
-    # sizepdf: A two-tuple, consisting of an RNG function and its parameters,
-    #          used to determine the size of generated packets (in bytes)
-    # arrivpdf: A two-type, like sizepdf, used to determine the interarrival
-    #           times of generated packets to the outputdest
-    # numpkts: Total number of packets that will be emitted by the probe
-    #          generator
-    probegens = [{}]
-    
-    probegens[0]['type'] = 'PROBEGEN'
-    probegens[0]['index'] = 0
-    probegens[0]['outputdest'] = ('QUEUE', 0)
-    probegens[0]['numpkts'] = 2                # two probe packets
-    probegens[0]['sizepdf'] = (determ,(1500.0,)) # (determ,(1000.0,))
-
-    probegens[0]['debug'] = 0 # 1
-
     # We vary the probe packet interarrival time (in essence, the input
-    # dispersion) in accordance with the contents of iterlist
-    probegens[0]['arrivpdf'] = (determ,(iter*1.0,)) 
-    
-    #probegens = []       # NO PROBE GENERATORS
-
-    # WIRE parameters
-    # propdelay: fixed delay of every packet travelling through the wire
-    #            (in other words, the propagation delay)
-    wires = [{}]
-    wires[0]['type'] = 'WIRE'
-    wires[0]['index'] = 0
-    wires[0]['propdelay'] = 0.5
-    wires[0]['debug'] = 0
-    wires[0]['outputdest'] = ('QUEUE', 1)
-   
-
-    packets = []            # An array of all packets currently floating
-                            # around in the system
-
-    pktserial = 0           # Used to assign unique number to every packet
-    
-    pendingprobes = 0       # Number of probe packets that have not yet left
-                            # the system
-  
-
-    # This variable "queueutilized" should be given at least as many elements
-    # as there are queues. This should probably be rewritten to run "len" on
-    # queues and use the resulting length to set queueutilized
-    #queueutilized = [[], [], [], []]
-    queueutilized = [[], []]
-
-    # Create all probe packets and set their arrival times into the
-    # system
-    for i in range(0,len(probegens)):
-
-        # OFFSETTIME is used to provide a delay before the probe packets
-        # are injected. It gives a chance for the simulation to get into
-        # steady-state
-
-        OFFSETTIME = 0.10
-        TMPCLOCK = TIMECLOCK + OFFSETTIME
-        while(probegens[i]['numpkts'] > 0):
-            pendingprobes += 1
-            TMPCLOCK = TMPCLOCK + apply(apply,probegens[i]['arrivpdf'])
-            packets.append({'type': 'PROBE', 'location' : ('PROBEGEN',probegens[i]['index']), 'size': apply(apply,probegens[i]['sizepdf']), 'serial': pktserial, 'wtime': TMPCLOCK, 'delays': [('PROBE')], 'qempty': [('PROBE')], 'qprobe': [('PROBE')], 'qgap': [('PROBE')]})
-            probegens[i]['numpkts'] -= 1
-            pktserial = pktserial + 1
-            if(probegens[i]['debug']): print "(ITER "+`iter`+") PROBE SOURCE "+`i`+" EMITTED PACKET "+`pktserial-1`
-
-
-    while 1:   # event loop for a given simulation
-
-        # Create new packets for all packet generators whose old packets have
-        # already entered the system
-        for i in range(0,len(pktgens)):
-            # If there isn't a cross-traffic packet waiting to be emitted,
-            # create one (we do this to ensure that a new cross-traffic packet
-            # isn't created with each iteration of the event loop---rather, we
-            # wait until the previous one is injected. This ensures that
-            # packets have the correct interpacket spacing
-            if(pktgens[i]['_emitted_'] == 0):
-                packets.append({'type': 'NONPROBE', 'location' : (pktgens[i]['type'],pktgens[i]['index']), 'size': apply(apply,pktgens[i]['sizepdf']), 'serial': pktserial, 'wtime': TIMECLOCK+apply(apply,pktgens[i]['arrivpdf']), 'delays': [('NONPROBE')], 'qempty': [('NONPROBE')], 'qprobe': [('NONPROBE')], 'qgap': [('NONPROBE')]})
-                pktgens[i]['_emitted_'] = 1
-                pktserial = pktserial + 1
-                if(pktgens[i]['debug']): print "(ITER "+`iter`+") CT SOURCE "+`i`+" EMITTED PACKET "+`pktserial-1`+" AT TIME "+`packets[-1]['wtime']`
-   
-
-       
-        # Find packet with the lowest wtime (finishing time)
-        mintime = 999999999
-        minidx = -1
-        
-        for i in range(0,len(packets)):
-            if(packets[i]['wtime'] < mintime):
-                mintime = packets[i]['wtime']
-                minidx = i
-   
-        # If there are no packets left, we've reached the end
-        if minidx == -1: break
-
-        # If we are running the sim by watching the probe packets, stop the
-        # sim once the packets have left
-        if (ENDTIME == -1 and pendingprobes == 0): break
-        # Otherwise, stop the sim once time runs out
-        if (ENDTIME > -1 and TIMECLOCK > ENDTIME): break
-
-        # Set clock to the finishing time of the selected packet
-        TIMECLOCK = mintime
-    
-        minpkt = packets[minidx]
-    
-        # Perform action based on current location of selected packet
-        queueidx = minpkt['location'][1]
-
-        # If the packet is located in a queue, move it to the next location
-        # If there is no next location, remove it from the list of packets
-        # If the packet was a probe packet, record the time of leaving, and
-        # subtract 1 from the number of pending probes
-        if(minpkt['location'][0] == 'QUEUE'):
-             queues[queueidx]['_numinqueue_'] -= 1
-             if(minpkt['type'] == 'PROBE'): queues[queueidx]['_numprobes_'] -= 1
-             if(queues[queueidx]['_numinqueue_']==0): 
-                 queueutilized[queueidx][-1].append(TIMECLOCK)
-                 queues[queueidx]['_gapoccurred_'] = 1
-             if recdelays == 1: 
-                 packets[minidx]['delays'][-1][1] = TIMECLOCK - packets[minidx]['delays'][-1][1]
-
-             if(queues[queueidx]['outputdest'] == -1):
-                 if(queues[queueidx]['debug']): print "(ITER "+`iter`+") TIME "+`TIMECLOCK`+" ("+minpkt['type']+") Packet "+`minpkt['serial']`+" left"
-                 if(minpkt['type'] == 'PROBE'): 
-                     pendingprobes -= 1
-                     pktlcur.append(TIMECLOCK)
-                     pktqey.append(packets[minidx]['qempty'])
-                     pktqprb.append(packets[minidx]['qprobe'])
-                     pktqg.append(packets[minidx]['qgap'])
-                 if recdelays == 1: alldelays.append(packets[minidx]['delays'])
-
-                 packets.remove(packets[minidx])
-                 continue
-             else:
-                 if(minpkt['type'] == 'NONPROBE' and random.uniform(0,1) < queues[queueidx]['dropprob']):
-                     packets.remove(packets[minidx])
-                 else:
-                     packets[minidx]['location'] = queues[queueidx]['outputdest']
-        elif(minpkt['location'][0] == 'WIRE'):
-             # Move the packet to the location that the wire is connecting to
-             packets[minidx]['location'] = wires[queueidx]['outputdest']
-        elif(minpkt['location'][0] == 'PKTGEN'):
-
-             # Since the packet is being emitted from the PKTGEN, set its
-             # emitted value to zero
-             pktgens[minpkt['location'][1]]['_emitted_'] = 0
-
-             # Inject the packet into whatever the packet generator is
-             # connected to. Set _emitted_ to 0, meaning that the generator
-             # can create a new packet
-             packets[minidx]['location'] = pktgens[queueidx]['outputdest']
-        elif(minpkt['location'][0] == 'PROBEGEN'):
-             # Inject a probe packet into the system. Record time of entry.
-             packets[minidx]['location'] = probegens[queueidx]['outputdest']
-             pktecur.append(TIMECLOCK)
-      
-
-        # Perform action based on new location of selected packet
-        if(packets[minidx]['location'][0] == 'QUEUE'):
-             queueidx = packets[minidx]['location'][1]
-
-             packets[minidx]['qgap'].append(queues[queueidx]['_gapoccurred_'])
-
-             # Here we record all the times that the queue became empty 
-
-             if(queues[queueidx]['_numinqueue_']==0): 
-                 packets[minidx]['qempty'].append((queueidx,1))
-             else:
-                 packets[minidx]['qempty'].append((queueidx,0))
-
-             if(queues[queueidx]['_numprobes_']==0): 
-                 packets[minidx]['qprobe'].append((queueidx,1))
-             else:
-                 packets[minidx]['qprobe'].append((queueidx,0))
-
-             # If there are no packets in a queue, record the time (useful so
-             # we can calculate the utilization)
-             if(queues[queueidx]['_numinqueue_']==0): queueutilized[queueidx].append([TIMECLOCK])
-             queues[queueidx]['_numinqueue_'] += 1
-             if(minpkt['type'] == 'PROBE'): 
-                 queues[queueidx]['_numprobes_'] += 1
-                 queues[queueidx]['_gapoccurred_'] = 0
-
-             # Add new list and record time of entry to queue
-             if(recdelays==1): 
-                 packets[minidx]['delays'].append([(queueidx,),TIMECLOCK])
-
-             if(queues[queueidx]['debug']): print "(ITER "+`iter`+") TIME "+`TIMECLOCK`+": ("+packets[minidx]['type']+") Packet "+`packets[minidx]['serial']`+" entering queue "+`queueidx`
-
-             # Calculate transmission time of the packet (based on its size
-             # and the transmission rate of the queue server)
-             transtime = packets[minidx]['size']/queues[queueidx]['procrate']
-
-             # If the queue had become empty before our arrival, set the
-             # empty time to the current time (since the queue is empty now, too
-
-             if(queues[queueidx]['_emptytime_'] < TIMECLOCK):
-                 queues[queueidx]['_emptytime_'] = TIMECLOCK
-
-             # Add the transmission time of the newly-arrived packet to the
-             # empty-time (after the old empty time, the queue won't be empty,
-             # but will have one remaining packet: the new packet. By adding
-             # the transmission time of the new packet, we get an accurate
-             # empty time)
-
-             queues[queueidx]['_emptytime_'] += transtime
-
-             # Set finishing time of packet to the current empty-time of the
-             # queue
-             packets[minidx]['wtime'] = queues[queueidx]['_emptytime_']
-           
-        elif(minpkt['location'][0] == 'WIRE'):
-             # If the packet is now in a wire, set its finishing time to the
-             # current time, plus the propagation delay
-             wireidx = minpkt['location'][1]
-             packets[minidx]['wtime'] = TIMECLOCK + wires[wireidx]['propdelay']
-
-
-    # AT THIS POINT, A SINGLE SIMULATION RUN HAS ENDED
-
-    numqueues = len(queues)
-    utilizedrun = [0.0]*numqueues
-    trueUtilization = [0.0]*numqueues
-    adjustedUtilization = [0.0]*numqueues
-
-
-
-    # If we recorded a start time for the queue being utilized and not the end
-    # time, set the end time to the end of the simulation (since the simulation
-    # is now over)
-
-    for i in range(0,numqueues):
-        if(len(queueutilized[i]) > 0 and len(queueutilized[i][-1]) < 2): queueutilized[i][-1].append(TIMECLOCK)
+    # dispersion) in accordance with the contents of iterlist, so the probe
+    # generator is given no arrivpdf of its own
+    probegens = [ProbeGenerator(0, (determ,(1500.0,)), # (determ,(1000.0,))
+                                ('QUEUE', 0), numpkts=2, debug=0)] # 1
 
+    #probegens = []       # NO PROBE GENERATORS
 
-    # The total length of the simulation is equal to the time at which the
-    # simulation was stopped (since the simulation always starts at time 0)
-
-    totalrun = TIMECLOCK
-
-    # Calculate the total time that each queue i was utilized
-
-    for i in range(0,numqueues):
-        for j in queueutilized[i]:
-            utilizedrun[i] += (j[1] - j[0])
-
-    # Calculate both true utilization (which includes the probe packets)
-    # and the "adjusted" utilization (which doesn't include the probe
-    # packets---i.e., in theory it would be the utilization if the probe
-    # packets weren't there). These values are calculated for a particular
-    # run
-
-    for i in range(0,numqueues):
-        trueUtilization[i] = (utilizedrun[i]/totalrun)
-        probetime = 2*probegens[0]['sizepdf'][1][0]/queues[i]['procrate']
-        adjustedUtilization[i] = ((utilizedrun[i]-probetime)/totalrun)
-
-    # Store the utilizations in corresponding "average" values---these will
-    # be used to calculate a utilization average over all runs
-
-    if(numutils == 0):
-        trueUtilAvg = trueUtilization[:]
-        adjUtilAvg = adjustedUtilization[:]
-        numutils = 1
+    wires = [Wire(0, 0.5, ('QUEUE', 1), debug=0)]
+
+    return Simulator(queues, pktgens, probegens, wires, recdelays=recdelays,
+                     endtime=ENDTIME, offsettime=OFFSETTIME,
+                     queuestats=queuestats, rngstreams=rngstreams)
+
+
+# The dispersion values to run the sim at, from the given settings (by
+# default the script settings)
+
+def dispersionvalues(settings=None):
+
+    if settings is None: settings = scriptsettings()
+
+    # Users can give the dispersion values themselves (a single one, or
+    # the first gaps of chirps), or have a range of them
+    if settings['dispersions'] is not None:
+        return list(settings['dispersions'])
+    return range(0,settings['iterations'],settings['iterstep'])
+
+
+# Used to construct a list of dispersions to iterate over, from the given
+# settings (by default the script settings)
+
+def builditerlist(settings=None):
+
+    if settings is None: settings = scriptsettings()
+    numrepeats = settings['numrepeats']
+
+    values = dispersionvalues(settings)
+    iterlist = values[:]
+
+    for i in values:
+        for j in range(0,numrepeats):
+            iterlist.append(i)
+
+    return iterlist
+
+
+# Raise ValueError if the settings can't be used together, or with sim.
+# A run stopped by ENDTIME can leave probes that never left the system,
+# which have no place in a result store (or cache)
+
+def checksettings(sim, settings):
+    if settings['cachedir'] is not None:
+        if settings['ciwidth'] is not None:
+            raise ValueError('an adaptive sweep (ciwidth) cannot use cachedir')
+        if settings['masterseed'] is None:
+            raise ValueError('cachedir needs a masterseed')
+    for key in ('resultdir', 'cachedir'):
+        if settings[key] is not None and sim.endtime != -1:
+            raise ValueError('%s cannot be used with an endtime' % key)
+
+
+# Sweep sim over the dispersions of iterlist, with the given settings (a
+# dictionary of the script settings named in SETTINGS), printing the
+# results as the script does. If ciwidth is set, the sweep is adaptive
+# instead, over the dispersion values of the settings (iterlist is then not
+# used), and the number of runs made at each is reported on stderr and in
+# the statsfile. If cachedir is set, the runs are taken from the cache, or
+# made and added to it, a dispersion at a time (see resultcache.py). If
+# coordinator is set, the runs are handed out to workers (see distsweep.py)
+
+def runscript(sim, iterlist, settings):
+    checksettings(sim, settings)
+    if settings['profile']:
+        import instrument
+        sim.profiler = instrument.Profiler(settings['profileinterval'])
+    starttrace(sim, settings)
+
+    # The local workers of a coordinator are forked before anything is
+    # written
+    coordinator = None
+    if settings['coordinator'] is not None:
+        import distsweep
+        coordinator = distsweep.Coordinator(sim, distsweep.parseaddress(settings['coordinator']),
+                                            settings['authkey'], settings['numworkers'])
+
+    out = None
+    if settings['outputfile'] is not None:
+        out = open(settings['outputfile'], 'w')
+    printer = ResultPrinter(settings['outputstyle'], sim.recdelays, out,
+                            listdelays=settings['listdelays'])
+    stats = None
+    if settings['statsfile'] is not None:
+        stats = SweepStats(settings['statquantiles'], settings['delayhist'],
+                           settings['disphist'])
+
+    # If the results are being stored, pick up after the runs already in the
+    # store (printing those first)
+    resultdir = settings['resultdir']
+    writer = None
+    start = 0
+    if resultdir is not None:
+        import resultstore
+        writer = resultstore.ResultWriter(resultdir, settings['chunkruns'])
+        for res in resultstore.readresults(resultdir, sim.recdelays):
+            printer.add(res)
+            if stats is not None: stats.add(res)
+        start = writer.done
+
+    sweepargs = {'masterseed': settings['masterseed'],
+                 'numworkers': settings['numworkers'],
+                 'checkpointspacing': settings['checkpointspacing'],
+                 'forkruns': settings['forkruns'],
+                 'fastpath': settings['usefastpath'],
+                 'fastbatch': settings['fastbatch'],
+                 'commonrandom': settings['commonrandom']}
+    if coordinator is not None:
+        sweepargs['coordinator'] = coordinator
+        sweepargs['chunksize'] = settings['distchunk']
+    counts = None
+    if settings['cachedir'] is not None:
+        import resultcache
+        cache = resultcache.ResultCache(settings['cachedir'], settings['cachesize'],
+                                        settings['chunkruns'])
+        sweep = resultcache.cachedsweep(sim, iterlist, cache, start=start, **sweepargs)
+    elif settings['ciwidth'] is None:
+        sweep = runsweep(sim, iterlist, start=start, **sweepargs)
     else:
-        for i in range(0,numqueues):
-            trueUtilAvg[i] += trueUtilization[i]
-            adjUtilAvg[i] += adjustedUtilization[i]
-        numutils += 1
-
-    # Record entry and leaving times of the packets in this iteration (i.e. of
-    # this particular run) 
-
-    pktenter.append(pktecur)
-    pktleave.append(pktlcur)
-    pktqempty.append(pktqey)
-    pktqprobe.append(pktqprb)
-    pktqgap.append(pktqg)
-    #print pktqgap
-    # Calculate utilization
-
-    # Flush stdout, so that all pending debug messages will be printed
-    sys.stdout.flush()
-
-
-# AT THIS POINT, _ALL_  RUNS HAVE ENDED
-
-# packet record = { probe/nonprobe, location, size, time it leaves location }
-
-
-# Count number of packet records
-pktarrlen = len(pktenter)
-
-# Print them out in one of two styles:
-# If outputstyle is set to 1, print out packet times in 
-# (entering time, leaving time) format
-# If outputstyle is set otherwise, print out packet times in
-# (initial dispersion, final dispersion) format
-# (note: the latter assumes packet pairs right now...please fix)
-
-for i in range(0,pktarrlen):
-    if(outputstyle==1):
-        print pktenter[i][0],pktleave[i][0]
-        print pktenter[i][1],pktleave[i][1]
-    elif(outputstyle==0):
-       print "%0.10f %0.10f" % ((pktenter[i][1] - pktenter[i][0]), (pktleave[i][1] - pktleave[i][0])),
-       print " ",pktqprobe[i][0][1][1]," ",pktqprobe[i][1][1][1], " -"+`pktqgap[i][1][1]`
-
-
-# Calculate average of utilizations over all runs
+        counts = []
+        stored = ()
+        if writer is not None: stored = resultstore.readresults(resultdir)
+        sweep = adaptivesweep(sim, dispersionvalues(settings),
+                              settings['ciwidth'], settings['ciutilwidth'],
+                              settings['cilevel'], settings['cibatch'],
+                              settings['numrepeats'], counts, stored,
+                              **sweepargs)
+
+    # Iterate over all runs, printing (and storing) each as it finishes
+    for res in sweep:
+        printer.add(res)
+        if stats is not None: stats.add(res)
+        if writer is not None: writer.add(res)
+
+    # AT THIS POINT, _ALL_  RUNS HAVE ENDED
+
+    if coordinator is not None: coordinator.close()
+    if writer is not None: writer.close()
+    printer.finish()
+    if out is not None: out.close()
+    if counts is not None:
+        fmt = lambda hw: hw is None and "-" or "%.3g" % hw
+        lines = ["RUNS dispersion %s n=%d disphalfwidth=%s utilhalfwidth=%s" % (dispersion, runs, fmt(disphw), fmt(utilhw))
+                 for dispersion, runs, disphw, utilhw in counts]
+        sys.stderr.write("".join([line + "\n" for line in lines]))
+    if stats is not None:
+        f = open(settings['statsfile'], 'w')
+        stats.report(f)
+        if counts is not None:
+            f.write("".join([line + "\n" for line in lines]))
+        f.close()
+    if sim.tracer is not None: sim.tracer.close()
+    if sim.profiler is not None:
+        if settings['profilefile'] is not None:
+            sim.profiler.writesummary(settings['profilefile'])
+        else:
+            sim.profiler.report()
+
+
+# Attach a tracer to sim if the settings ask for one (see tracefile)
+
+def starttrace(sim, settings):
+    if settings['tracefile'] is None:
+        return
+    if settings['numworkers'] > 1 or settings['coordinator'] is not None:
+        raise ValueError('tracefile needs the runs made in one process (numworkers = 1, no coordinator)')
+    import tracer
+    sim.tracer = tracer.Tracer(sim, settings['tracerecords'], settings['tracefile'],
+                               settings['tracecomponents'], settings['tracetypes'])
+
+
+# Simulate one long run of sim in windows, with the given settings (see
+# longrun), writing the measurements of each window as it ends. The run is
+# seeded with the master seed, if there is one
+
+def runlong(sim, settings):
+    if settings['profile']:
+        import instrument
+        sim.profiler = instrument.Profiler(settings['profileinterval'])
+    starttrace(sim, settings)
+    out = None
+    if settings['outputfile'] is not None:
+        out = open(settings['outputfile'], 'w')
+    writewindows(sim.windows(settings['longrun'], settings['window'],
+                             settings['masterseed'], settings['statquantiles']), out)
+    if out is not None: out.close()
+    if sim.tracer is not None: sim.tracer.close()
+    if sim.profiler is not None:
+        if settings['profilefile'] is not None:
+            sim.profiler.writesummary(settings['profilefile'])
+        else:
+            sim.profiler.report()
+
+
+# Run sim with the given settings: in one long run if longrun is set,
+# otherwise as a sweep
+
+def runsettings(sim, settings):
+    if settings['longrun'] is not None:
+        runlong(sim, settings)
+    else:
+        runscript(sim, builditerlist(settings), settings)
 
-for i in range(0,numqueues):
-    trueUtilAvg[i] = trueUtilAvg[i]/numutils
-    adjUtilAvg[i] = adjUtilAvg[i]/numutils
 
-print "TRUE UTILIZATION (incl. probe packets): ",trueUtilAvg
-print "ADJUSTED UTILIZATION: ",adjUtilAvg
-print "TIMECLOCK: ",TIMECLOCK
+# Run the script: with no arguments, sweep the topology of buildsimulator
+# with the script settings above. Otherwise every argument is a config file
+# (see simconfig.py), and each is loaded and swept in turn, in this process
 
-# If the user wanted all delays to be recorded (by setting recdelays to 1)
-#  display them
+def main(args=[]):
+    if not args:
+        runsettings(buildsimulator(), scriptsettings())
+        return
 
-if recdelays == 1:
+    import simconfig
+    for path in args:
+        sim, settings = simconfig.load(path)
+        runsettings(sim, settings)
 
-    numdelays = 0
-    sumdelays = 0
-    
-    for i in alldelays:
-        if(i[0] == 'NONPROBE'):
-           subarr = i[1:]
-           for j in subarr:
-               numdelays = numdelays + 1
-               print j[1] # j[0][0], j[1]
-               sumdelays = sumdelays + j[1]
-     
-    sys.stderr.write("((("+`sumdelays/(numdelays*1.0)`+")))\n")
-    sys.stderr.write("Total number of packets: "+`numdelays`)
 
+# Run through the importable module rather than __main__, so that the other
+# modules of the simulator (which import multiqueue) see the same classes
+# and functions as the script
 
+if __name__ == '__main__':
+    import multiqueue
+    multiqueue.main(sys.argv[1:])
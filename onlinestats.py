@@ -0,0 +1,274 @@
+# Online statistics, kept up to date one observation at a time so that the
+# observations themselves never have to be stored:
+#
+#   Moments:    count, mean and variance (Welford's method), min and max
+#   P2Quantile: an estimate of one quantile, by the P-square algorithm of
+#               Jain and Chlamtac (CACM, 1985), which keeps just five markers
+#   Histogram:  counts in fixed-width bins, plus those below and above them
+#   Summary:    all of the above, for one quantity
+#   StatTable:  a Summary per key (e.g. per queue, or per dispersion)
+#
+# Moments and Histograms can also be merged, e.g. to combine the statistics
+# of several sweeps. Moments also give a confidence interval on the mean
+
+import math
+
+
+# Count, mean, variance, min and max
+
+class Moments(object):
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(x - self.mean)
+        if self.min is None or x < self.min: self.min = x
+        if self.max is None or x > self.max: self.max = x
+
+    # Fold the observations of another Moments into this one (Chan et al.)
+    def merge(self, other):
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta*other.count/count
+        self.m2 += other.m2 + delta*delta*self.count*other.count/count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    # The sample variance (0 for fewer than two observations)
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return self.m2/(self.count - 1)
+
+    def stddev(self):
+        return self.variance()**0.5
+
+    # The half-width of the confidence interval on the mean at the given
+    # level, by the normal approximation (so only for a fair number of
+    # independent observations). None for fewer than two observations
+    def halfwidth(self, level=0.95):
+        if self.count < 2:
+            return None
+        return normalquantile(0.5 + level/2.0)*self.stddev()/self.count**0.5
+
+
+# The p-quantile of the standard normal distribution (0 < p < 1), by the
+# rational approximation of P. J. Acklam (relative error below 1.2e-9)
+
+NORMALA = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+           1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+NORMALB = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+           6.680131188771972e+01, -1.328068155288572e+01)
+NORMALC = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+           -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+NORMALD = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+           3.754408661907416e+00)
+
+def normalquantile(p):
+    if not 0.0 < p < 1.0:
+        raise ValueError('a quantile is only defined for 0 < p < 1, not %r' % p)
+    a, b, c, d = NORMALA, NORMALB, NORMALC, NORMALD
+    if p < 0.02425:
+        q = (-2*math.log(p))**0.5
+        return (((((c[0]*q+c[1])*q+c[2])*q+c[3])*q+c[4])*q+c[5]) / \
+               ((((d[0]*q+d[1])*q+d[2])*q+d[3])*q+1)
+    if p > 1 - 0.02425:
+        return -normalquantile(1 - p)
+    q = p - 0.5
+    r = q*q
+    return (((((a[0]*r+a[1])*r+a[2])*r+a[3])*r+a[4])*r+a[5])*q / \
+           (((((b[0]*r+b[1])*r+b[2])*r+b[3])*r+b[4])*r+1)
+
+
+# An estimate of the p-quantile (0 < p < 1). Five markers track the minimum,
+# the p/2, p and (1+p)/2 quantiles and the maximum; the middle three are
+# moved towards their desired positions with a piecewise-parabolic fit as
+# observations come in. Until five observations have been seen, the exact
+# quantile is given
+
+class P2Quantile(object):
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.pos = [1, 2, 3, 4, 5]
+        self.desired = [1.0, 1.0+2*p, 1.0+4*p, 3.0+2*p, 5.0]
+        self.incr = [0.0, p/2.0, p, (1.0+p)/2.0, 1.0]
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        # Find the cell the observation falls in, widening the extreme
+        # markers if it falls outside them
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x < q[1]: k = 0
+        elif x < q[2]: k = 1
+        elif x < q[3]: k = 2
+        elif x <= q[4]: k = 3
+        else:
+            q[4] = x
+            k = 3
+
+        n = self.pos
+        for i in range(k+1,5):
+            n[i] += 1
+        desired = self.desired
+        incr = self.incr
+        for i in range(0,5):
+            desired[i] += incr[i]
+
+        # Move the middle markers that are a position or more off, if that
+        # doesn't make them collide with their neighbours
+        for i in (1, 2, 3):
+            d = desired[i] - n[i]
+            if (d >= 1.0 and n[i+1] - n[i] > 1) or (d <= -1.0 and n[i-1] - n[i] < -1):
+                if d > 0: d = 1
+                else: d = -1
+                qi = q[i] + float(d)/(n[i+1] - n[i-1]) * \
+                     ((n[i] - n[i-1] + d)*(q[i+1] - q[i])/(n[i+1] - n[i]) +
+                      (n[i+1] - n[i] - d)*(q[i] - q[i-1])/(n[i] - n[i-1]))
+                if not q[i-1] < qi < q[i+1]:
+                    qi = q[i] + float(d)*(q[i+d] - q[i])/(n[i+d] - n[i])
+                q[i] = qi
+                n[i] += d
+
+    # The current estimate (None before the first observation)
+    def value(self):
+        q = self.heights
+        if not q:
+            return None
+        if self.pos[4] == 5:
+            return q[min(len(q)-1, int(self.p*len(q)))]
+        return q[2]
+
+
+# Counts of observations in numbins equal bins spanning [low, high), with
+# those below low and at or above high counted separately
+
+class Histogram(object):
+
+    def __init__(self, low, high, numbins):
+        self.low = float(low)
+        self.high = float(high)
+        self.numbins = numbins
+        self.width = (self.high - self.low)/numbins
+        self.counts = [0]*numbins
+        self.below = 0
+        self.above = 0
+
+    def add(self, x):
+        if x < self.low:
+            self.below += 1
+        elif x >= self.high:
+            self.above += 1
+        else:
+            i = int((x - self.low)/self.width)
+            if i >= self.numbins: i = self.numbins - 1
+            self.counts[i] += 1
+
+    def merge(self, other):
+        if (other.low, other.high, other.numbins) != (self.low, self.high, self.numbins):
+            raise ValueError('histograms with different bins cannot be merged')
+        for i in range(0,self.numbins):
+            self.counts[i] += other.counts[i]
+        self.below += other.below
+        self.above += other.above
+
+    # The p-quantile, interpolated within its bin. None if it falls below
+    # or above the bins
+    def quantile(self, p):
+        total = self.below + sum(self.counts) + self.above
+        target = p*total
+        if target < self.below or total == 0:
+            return None
+        seen = self.below
+        for i in range(0,self.numbins):
+            if seen + self.counts[i] >= target and self.counts[i] > 0:
+                return self.low + (i + (target - seen)/float(self.counts[i]))*self.width
+            seen += self.counts[i]
+        return None
+
+
+# The statistics of one quantity: its Moments, a P2Quantile for each of
+# quantiles, and, if hist is given as (low, high, numbins), a Histogram
+
+class Summary(object):
+
+    def __init__(self, quantiles=(0.5, 0.9, 0.99), hist=None):
+        self.moments = Moments()
+        self.quantiles = [P2Quantile(p) for p in quantiles]
+        if hist is None:
+            self.hist = None
+        else:
+            self.hist = apply(Histogram, hist)
+
+    def add(self, x):
+        self.moments.add(x)
+        for est in self.quantiles:
+            est.add(x)
+        if self.hist is not None:
+            self.hist.add(x)
+
+    # One line of text giving the statistics (without the histogram)
+    def report(self):
+        m = self.moments
+        if m.count == 0:
+            return "n=0"
+        line = "n=%d mean=%.10g sd=%.10g min=%.10g max=%.10g" % (m.count, m.mean, m.stddev(), m.min, m.max)
+        for est in self.quantiles:
+            line += " p%g=%.10g" % (est.p*100, est.value())
+        return line
+
+    # The histogram as one line of text: low, high, below, the bin counts
+    # and above. None if there is no histogram
+    def histreport(self):
+        h = self.hist
+        if h is None:
+            return None
+        return "%.10g %.10g %d %s %d" % (h.low, h.high, h.below, " ".join(map(str, h.counts)), h.above)
+
+
+# A Summary for each key, created the first time the key is seen
+
+class StatTable(object):
+
+    def __init__(self, quantiles=(0.5, 0.9, 0.99), hist=None):
+        self.quantiles = quantiles
+        self.hist = hist
+        self.stats = {}
+
+    def add(self, key, x):
+        try:
+            summary = self.stats[key]
+        except KeyError:
+            summary = self.stats[key] = Summary(self.quantiles, self.hist)
+        summary.add(x)
+
+    def keys(self):
+        keys = self.stats.keys()
+        keys.sort()
+        return keys
+
+    def __getitem__(self, key):
+        return self.stats[key]
@@ -0,0 +1,337 @@
+# On-disk cache of the results of a sweep, a dispersion value at a time, so
+# that sweeping again after changing part of the settings only makes the
+# runs that are missing
+#
+# The runs a sweep makes at one dispersion value are a point of the sweep.
+# A point is cached under a key hashed from everything its results depend
+# on: the topology (the parameters of every component, its PDFs included,
+# and the settings of the simulator), the master seed and the settings of
+# the sweep that change its draws, the number of runs, and the dispersion.
+# To make a point's results depend on nothing else, the runs of a cached
+# sweep are numbered (for seeding) by point rather than by their place in
+# the sweep (see pointbase): a point stays the same when the points around
+# it change, which is what lets it be found again, but a cached sweep gives
+# different runs from the same sweep uncached.
+#
+# The cache is a directory holding an entry for each point: a directory
+# named after the key, laid out as a result store (see resultstore.py), with
+# point.json summarizing the point (its dispersion, runs, mean output
+# dispersions and utilizations). The cache is kept under a size limit by
+# evicting the least recently used entries, an entry's use being the
+# modification time of its directory.
+# Any number of sweeps can share a cache, without locks: an entry is built
+# in a directory of its own and renamed into place once complete, is never
+# changed after that, and is evicted by renaming it out of place before it
+# is removed. A sweep reading an entry first hard-links its files into a
+# directory of its own, so that the entry can be evicted in the meantime.
+# These working directories are named tmp-, read- and evict- followed by
+# the key, the host name and the process ID (see workdir), and are cleared
+# away by the sweeps on the same host if their process dies; those of
+# other hosts sharing the cache are left to them. Anything else in the
+# cache directory is left alone.
+#
+#   python resultcache.py cachedir
+#
+# lists the entries of a cache, the most recently used first
+
+import errno
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import sys
+import time
+import types
+
+import multiqueue
+import onlinestats
+import resultstore
+import simconfig
+import traces
+
+
+# Size the cache is kept under, in bytes, by default
+
+MAXSIZE = 2**30
+
+# Part of every key: bump it whenever the simulator changes the runs it
+# makes for the same settings, so that stale entries are no longer found
+
+CACHEVERSION = 1
+
+# The keyword arguments of runsweep that change the runs of a sweep (given
+# a master seed, its number of workers does not)
+
+SWEEPSETTINGS = ('masterseed', 'commonrandom', 'checkpointspacing',
+                 'forkruns', 'fastpath', 'fastbatch')
+
+# The names of the entries, and of the working directories
+# (prefix-key-host-pid, with a read number after read- ones)
+
+ENTRYNAME = re.compile(r'^[0-9a-f]{40}$')
+WORKNAME = re.compile(r'^(tmp|read|evict)-[0-9a-f]{40}-([^-]+)-([0-9]+)(-[0-9]+)?$')
+
+# This host's name, as it goes into the names of working directories
+
+HOSTNAME = re.sub(r'[^A-Za-z0-9.]', '_', socket.gethostname())
+
+
+# A value of a component's parameters, as plain values for a key: numbers
+# and strings as they are, functions by name, trace files by path, size and
+# modification time, and other objects (such as the samplers of
+# sampling.py) by their class and public attributes
+
+def describevalue(value):
+    if value is None or isinstance(value, (bool, int, long, float, basestring)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [describevalue(item) for item in value]
+    if isinstance(value, (traces.BinaryTrace, traces.PcapTrace)):
+        st = os.stat(value.path)
+        return ['trace', os.path.abspath(value.path), st.st_size, st.st_mtime]
+    if isinstance(value, types.MethodType):
+        if getattr(random, value.__name__, None) == value:
+            return 'random.' + value.__name__
+        return [type(value.im_self).__name__, value.__name__]
+    if isinstance(value, (types.FunctionType, types.BuiltinFunctionType)):
+        return '%s.%s' % (value.__module__, value.__name__)
+    attrs = sorted([(name, attr) for name, attr in vars(value).items()
+                    if not name.startswith('_') and name != 'rng'])
+    return [type(value).__name__] + [[name, describevalue(attr)] for name, attr in attrs]
+
+
+# The topology of sim, as plain values: the constructor parameters of each
+# of its components (as named in simconfig), and its settings
+
+def describe(sim):
+    desc = []
+    for kind in ('queues', 'pktgens', 'probegens', 'wires'):
+        comps = []
+        for comp in getattr(sim, kind):
+            params = simconfig.PARAMS[kind]
+            if isinstance(comp, traces.TraceGenerator):
+                params = simconfig.TRACEPARAMS
+            comps.append([type(comp).__name__] + [describevalue(getattr(comp, name)) for name, required, default in params])
+        desc.append([kind, comps])
+    desc.append(['simulator', [[name, getattr(sim, name)] for name in simconfig.SIMPARAMS]])
+    return desc
+
+
+# The key of the point of numruns runs at the given dispersion, for a
+# topology described by describe() and the runsweep settings of
+# SWEEPSETTINGS, given as a dictionary
+
+def pointkey(topology, settings, dispersion, numruns):
+    sweep = [[name, settings.get(name)] for name in SWEEPSETTINGS]
+    text = json.dumps([CACHEVERSION, topology, sweep, repr(float(dispersion)), numruns], sort_keys=True)
+    return hashlib.sha1(text).hexdigest()
+
+
+# The number of the first run of the point at the given dispersion. The runs
+# of different points are numbered 2**32 apart (with a chance of overlap of
+# about one in 2**48 for any two points)
+
+def pointbase(dispersion):
+    return int(hashlib.sha1(repr(float(dispersion))).hexdigest()[:12], 16) << 32
+
+
+# The host name and process ID in the name of a working directory, or None
+# if the name is not one of those
+
+def workdir(name):
+    match = WORKNAME.match(name)
+    if match is None or (match.group(1) == 'read') != (match.group(4) is not None):
+        return None
+    return match.group(2), int(match.group(3))
+
+
+# Whether the process with the given ID is still running (on this machine)
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return 1
+
+
+# A cache in the directory "path", kept under maxsize bytes. Its entries are
+# written chunkruns runs at a time
+
+class ResultCache(object):
+
+    def __init__(self, path, maxsize=MAXSIZE, chunkruns=resultstore.CHUNKRUNS):
+        self.path = path
+        self.maxsize = maxsize
+        self.chunkruns = chunkruns
+        self._reads = itertools.count()
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+
+    # The results stored under key, in the order they were made, or None if
+    # there are none. If withdelays is set, their delays are filled in too
+    def get(self, key, withdelays=0):
+        entry = os.path.join(self.path, key)
+        snapshot = os.path.join(self.path, 'read-%s-%s-%d-%d' % (key, HOSTNAME, os.getpid(), self._reads.next()))
+        os.mkdir(snapshot)
+        try:
+            for name in os.listdir(entry):
+                os.link(os.path.join(entry, name), os.path.join(snapshot, name))
+            os.utime(entry, None)
+        except OSError:
+            # Missing, or evicted while being linked
+            shutil.rmtree(snapshot, True)
+            return None
+        return self._read(snapshot, withdelays)
+
+    def _read(self, snapshot, withdelays):
+        try:
+            for res in resultstore.readresults(snapshot, withdelays):
+                yield res
+        finally:
+            shutil.rmtree(snapshot, True)
+
+    # A ResultWriter for the results of a point, to be added to the cache
+    # under key by store()
+    def writer(self, key):
+        return resultstore.ResultWriter(os.path.join(self.path, 'tmp-%s-%s-%d' % (key, HOSTNAME, os.getpid())),
+                                        self.chunkruns, resume=0)
+
+    # Add the results written by writer to the cache under key, along with
+    # point (written to point.json), then evict what no longer fits
+    def store(self, key, writer, point):
+        writer.close()
+        f = open(os.path.join(writer.path, 'point.json'), 'w')
+        json.dump(point, f)
+        f.close()
+        try:
+            os.rename(writer.path, os.path.join(self.path, key))
+        except OSError:
+            # Another sweep has stored the same point in the meantime
+            shutil.rmtree(writer.path, True)
+        self.evict()
+
+    # The entries of the cache, as (time last used, size in bytes, key),
+    # from the least recently used. The working directories of processes
+    # on this host that have died are removed along the way
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if not ENTRYNAME.match(name):
+                owner = workdir(name)
+                if owner is not None and owner[0] == HOSTNAME and not alive(owner[1]):
+                    shutil.rmtree(path, True)
+                continue
+            try:
+                size = sum([os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)])
+                entries.append((os.path.getmtime(path), size, name))
+            except OSError:
+                # Evicted while being looked at
+                continue
+        entries.sort()
+        return entries
+
+    # Remove the least recently used entries until the cache fits maxsize
+    def evict(self):
+        entries = self.entries()
+        total = sum([size for used, size, key in entries])
+        for used, size, key in entries:
+            if total <= self.maxsize:
+                break
+            trash = os.path.join(self.path, 'evict-%s-%s-%d' % (key, HOSTNAME, os.getpid()))
+            try:
+                os.rename(os.path.join(self.path, key), trash)
+            except OSError:
+                continue
+            shutil.rmtree(trash, True)
+            total -= size
+
+
+# Sweep sim over the dispersions of iterlist as runsweep does (with the same
+# keyword arguments, which must include a master seed), but a point at a
+# time, taking the points stored in cache from there and storing the rest
+# as they are made. The RunResults are yielded a point at a time, in the
+# order the dispersions first appear in iterlist, rather than in the order
+# of iterlist; if start is given, the first start of them are left out
+
+def cachedsweep(sim, iterlist, cache, start=0, **kwargs):
+    if kwargs.get('masterseed') is None:
+        raise ValueError('a cached sweep needs a master seed')
+    points = []
+    counts = {}
+    for dispersion in iterlist:
+        if dispersion not in counts:
+            points.append(dispersion)
+            counts[dispersion] = 0
+        counts[dispersion] += 1
+    topology = describe(sim)
+    sweep = _cachedsweep(sim, [(dispersion, counts[dispersion]) for dispersion in points],
+                         cache, topology, kwargs)
+    return itertools.islice(sweep, start, None)
+
+def _cachedsweep(sim, points, cache, topology, kwargs):
+    for dispersion, numruns in points:
+        key = pointkey(topology, kwargs, dispersion, numruns)
+        stored = cache.get(key, sim.recdelays)
+        if stored is not None:
+            for res in stored:
+                yield res
+            continue
+
+        writer = cache.writer(key)
+        dispstats = {}
+        utilstats = [onlinestats.Moments() for queue in sim.queues]
+        for res in multiqueue.runsweep(sim, [dispersion]*numruns, runbase=pointbase(dispersion), **kwargs):
+            writer.add(res)
+            first = 0
+            for train in range(0,len(res.trains)):
+                for gap in range(1,res.trains[train]):
+                    k = first + gap
+                    if res.pktleave[k] is not None and res.pktleave[k-1] is not None:
+                        if (train, gap) not in dispstats:
+                            dispstats[(train, gap)] = onlinestats.Moments()
+                        dispstats[(train, gap)].add(res.pktleave[k] - res.pktleave[k-1])
+                first += res.trains[train]
+            for q in range(0,len(utilstats)):
+                utilstats[q].add(res.trueUtilization[q])
+            yield res
+
+        point = {'dispersion': dispersion, 'runs': numruns,
+                 'outdisp': [[train, gap, m.mean, m.stddev()] for (train, gap), m in sorted(dispstats.items())],
+                 'utilization': [m.mean for m in utilstats]}
+        cache.store(key, writer, point)
+
+
+# List the entries of the cache in "path", the most recently used first
+
+def main(args):
+    if len(args) != 1:
+        print >>sys.stderr, "usage: python resultcache.py cachedir"
+        return 1
+    cache = ResultCache(args[0])
+    entries = cache.entries()
+    entries.reverse()
+    for used, size, key in entries:
+        try:
+            point = json.load(open(os.path.join(args[0], key, 'point.json')))
+        except (IOError, ValueError):
+            continue
+        print "%s dispersion %s runs %d size %dKB used %s" % (key[:12], point['dispersion'], point['runs'],
+                                                             (size + 1023)/1024, time.strftime('%Y-%m-%d %H:%M', time.localtime(used)))
+        for train, gap, mean, sd in point['outdisp']:
+            print "    train %d gap %d outdisp mean=%.10g sd=%.3g" % (train, gap, mean, sd)
+        print "    utilization", " ".join(["%.4f" % util for util in point['utilization']])
+    print "%d entries, %dKB" % (len(entries), (sum([size for used, size, key in entries]) + 1023)/1024)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,260 @@
+# On-disk store for the results of a sweep, written as the runs finish
+#
+# A store is a directory holding:
+#   meta.json:          the layout of the rows (see ResultWriter)
+#   runs-NNNNNNNN.npy:  one row of float64s per run, for the runs starting
+#                       at run number NNNNNNNN
+#   delays-NNNNNNNN.npy: if delays are recorded, one row per delay of those
+#                       runs: (run number, packet, probe?, queue, delay)
+#   progress:           the resume marker, holding the number of runs that
+#                       are safely on disk
+# Runs are buffered and written a chunk at a time; the marker is only moved
+# on (atomically, by renaming) once a chunk is complete, so an interrupted
+# sweep loses at most the chunk in progress and can carry on from the
+# marker. The chunks are in NumPy's .npy format, so numpy.load reads them,
+# but they are written and read here without needing NumPy
+
+import array
+import ast
+import json
+import os
+import struct
+import sys
+
+import multiqueue
+
+
+# Number of runs written at a time
+
+CHUNKRUNS = 10000
+
+
+# Write a 2-D array of float64s, given as a flat array.array('d') of
+# numcols columns, as a .npy file (format version 1.0)
+
+def writenpy(path, data, numcols):
+    if sys.byteorder != 'little':
+        data = array.array('d', data)
+        data.byteswap()
+    header = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d, %d), }" % (len(data)/max(numcols, 1), numcols)
+    header += ' '*(15 - (len(header) + 10) % 16) + '\n'
+    f = open(path + '.tmp', 'wb')
+    f.write('\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header)
+    data.tofile(f)
+    f.close()
+    os.rename(path + '.tmp', path)
+
+
+# Read a .npy file written by writenpy, returning the list of its rows
+
+def readnpy(path):
+    f = open(path, 'rb')
+    if f.read(8) != '\x93NUMPY\x01\x00':
+        raise ValueError('%s is not a version 1.0 .npy file' % path)
+    headerlen, = struct.unpack('<H', f.read(2))
+    header = ast.literal_eval(f.read(headerlen))
+    if header['descr'] != '<f8' or header['fortran_order']:
+        raise ValueError('%s does not hold little-endian float64s' % path)
+    numrows, numcols = header['shape']
+    data = array.array('d')
+    data.fromfile(f, numrows*numcols)
+    f.close()
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return [data[i*numcols:(i+1)*numcols].tolist() for i in range(0,numrows)]
+
+
+# The layout of a run's row, taken from its RunResult: the number of probe
+# packets, the length of each probe train, the queues visited by each probe,
+# the number of queues, and whether there are queue statistics. Every run of
+# a sweep has the same layout
+
+def layout(res):
+    return {'numprobes': len(res.pktenter),
+            'trains': res.trains,
+            'visits': [[queueidx for queueidx, flag in rec[1:]] for rec in res.pktqempty],
+            'numqueues': len(res.trueUtilization),
+            'queuestats': len(res.meanQueueLength) > 0}
+
+
+# The row of a run:
+#   dispersion, timeclock,
+#   enter time of each probe, leave time of each probe,
+#   for each probe and queue visited: found it empty, found it without
+#   probes, saw a gap,
+#   true and adjusted utilization of each queue,
+#   mean queue length and backlog of each queue (if measured)
+
+def torow(res):
+    row = [float(res.dispersion), res.timeclock]
+    row.extend(res.pktenter)
+    row.extend(res.pktleave)
+    for recs in (res.pktqempty, res.pktqprobe):
+        for rec in recs:
+            row.extend([flag for queueidx, flag in rec[1:]])
+    for rec in res.pktqgap:
+        row.extend(rec[1:])
+    row.extend(res.trueUtilization)
+    row.extend(res.adjustedUtilization)
+    row.extend(res.meanQueueLength)
+    row.extend(res.meanBacklog)
+    return row
+
+
+# Rebuild a RunResult from its row (without its delays)
+
+def fromrow(row, meta):
+    numprobes = meta['numprobes']
+    visits = meta['visits']
+    numqueues = meta['numqueues']
+    # Stores written before probe trains had one list of visits, shared by
+    # the probes of their one pair
+    if visits and not isinstance(visits[0], list):
+        visits = [visits]*numprobes
+
+    res = multiqueue.RunResult(row[0])
+    res.trains = meta.get('trains', [numprobes])
+    res.timeclock = row[1]
+    res.pktenter = row[2:2+numprobes]
+    res.pktleave = row[2+numprobes:2+2*numprobes]
+    col = 2+2*numprobes
+    for recs in (res.pktqempty, res.pktqprobe):
+        for k in range(0,numprobes):
+            flags = row[col:col+len(visits[k])]
+            recs.append([multiqueue.PROBE] + [(visits[k][i], int(flags[i])) for i in range(0,len(visits[k]))])
+            col += len(visits[k])
+    for k in range(0,numprobes):
+        res.pktqgap.append([multiqueue.PROBE] + [int(flag) for flag in row[col:col+len(visits[k])]])
+        col += len(visits[k])
+    res.trueUtilization = row[col:col+numqueues]
+    res.adjustedUtilization = row[col+numqueues:col+2*numqueues]
+    if meta.get('queuestats'):
+        res.meanQueueLength = row[col+2*numqueues:col+3*numqueues]
+        res.meanBacklog = row[col+3*numqueues:col+4*numqueues]
+    return res
+
+
+# Writes the results of a sweep to the store in the directory "path".
+# If resume is set and the store already holds runs, the writer carries on
+# after them (the sweep should then start at run number writer.done);
+# otherwise the store is emptied first
+
+class ResultWriter(object):
+
+    def __init__(self, path, chunkruns=CHUNKRUNS, resume=1):
+        self.path = path
+        self.chunkruns = chunkruns
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.meta = None
+        self.done = 0
+        if resume:
+            self.done = progress(path)
+            if self.done > 0:
+                self.meta = json.load(open(os.path.join(path, 'meta.json')))
+        else:
+            for name in os.listdir(path):
+                if name.endswith('.npy') or name in ('meta.json', 'progress'):
+                    os.remove(os.path.join(path, name))
+
+        self.rows = array.array('d')
+        self.delays = array.array('d')
+        self.numrows = 0
+
+    # Add the result of the next run. Every probe must have left the system
+    # (so no run stopped by ENDTIME with probes still in it)
+    def add(self, res):
+        for k in range(0,len(res.pktleave)):
+            if res.pktleave[k] is None:
+                raise ValueError('run %d ended before probe %d left the system, so it cannot be stored'
+                                 % (self.done + self.numrows, k))
+        if self.meta is None:
+            self.meta = layout(res)
+            self.meta['numcols'] = len(torow(res))
+            f = open(os.path.join(self.path, 'meta.json'), 'w')
+            json.dump(self.meta, f)
+            f.close()
+        row = torow(res)
+        if len(row) != self.meta['numcols']:
+            raise ValueError('run %d does not fit the layout of the store' % (self.done + self.numrows))
+
+        runnum = self.done + self.numrows
+        self.rows.extend(row)
+        for pktnum in range(0,len(res.delays)):
+            rec = res.delays[pktnum]
+            isprobe = float(rec[0] == multiqueue.PROBE)
+            for queuerec, delay in rec[1:]:
+                self.delays.extend((runnum, pktnum, isprobe, queuerec[0], delay))
+        self.numrows += 1
+
+        if self.numrows >= self.chunkruns:
+            self.flush()
+
+    # Write out the buffered runs, and move the resume marker past them
+    def flush(self):
+        if self.numrows == 0:
+            return
+        writenpy(os.path.join(self.path, 'runs-%08d.npy' % self.done), self.rows, self.meta['numcols'])
+        if self.delays:
+            writenpy(os.path.join(self.path, 'delays-%08d.npy' % self.done), self.delays, 5)
+        self.done += self.numrows
+
+        f = open(os.path.join(self.path, 'progress.tmp'), 'w')
+        f.write('%d\n' % self.done)
+        f.close()
+        os.rename(os.path.join(self.path, 'progress.tmp'), os.path.join(self.path, 'progress'))
+
+        self.rows = array.array('d')
+        self.delays = array.array('d')
+        self.numrows = 0
+
+    def close(self):
+        self.flush()
+
+
+# The number of runs safely stored in the directory "path"
+
+def progress(path):
+    try:
+        return int(open(os.path.join(path, 'progress')).read())
+    except (IOError, ValueError):
+        return 0
+
+
+# The chunk files of a store, as (first run number, file name), in order,
+# covering only the runs behind the resume marker
+
+def _chunks(path, prefix):
+    done = progress(path)
+    chunks = []
+    for name in os.listdir(path):
+        if name.startswith(prefix + '-') and name.endswith('.npy'):
+            first = int(name[len(prefix)+1:-4])
+            if first < done:
+                chunks.append((first, name))
+    chunks.sort()
+    return chunks
+
+
+# Yield the RunResults held in the store in "path", in run order, a chunk at
+# a time. If withdelays is set, their delay records are filled in too
+
+def readresults(path, withdelays=0):
+    if progress(path) == 0:
+        return
+    meta = json.load(open(os.path.join(path, 'meta.json')))
+    delaychunks = dict(_chunks(path, 'delays'))
+
+    for first, name in _chunks(path, 'runs'):
+        results = [fromrow(row, meta) for row in readnpy(os.path.join(path, name))]
+        if withdelays and first in delaychunks:
+            lastpkt = None
+            for runnum, pktnum, isprobe, queueidx, delay in readnpy(os.path.join(path, delaychunks[first])):
+                res = results[int(runnum) - first]
+                if (runnum, pktnum) != lastpkt:
+                    res.delays.append([isprobe and multiqueue.PROBE or multiqueue.NONPROBE])
+                    lastpkt = (runnum, pktnum)
+                res.delays[-1].append([(int(queueidx),), delay])
+        for res in results:
+            yield res
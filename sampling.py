@@ -0,0 +1,248 @@
+# Table-driven samplers for packet-size distributions
+#
+# A size distribution is compiled into a table once, and sizes are then
+# drawn from it a block at a time, so that a packet generator pulls its next
+# size from a buffer instead of making several Python-level calls per
+# packet. Two kinds of table are provided:
+#
+#   PiecewiseCDF: an inverse-CDF lookup over segments, each either a single
+#                 value (an atom) or spread uniformly over a range of
+#                 values. This covers internetmix and CDF tables such as
+#                 those published for measured traffic
+#   AliasTable:   Walker's alias method over a discrete histogram, such as
+#                 the packet sizes counted in a trace
+#
+# Samplers are used like the other PDFs, with no arguments: the sizepdf
+# (INTERNETMIX, ()) draws the same distribution as (internetmix, ()).
+# They draw their uniforms from the random module, so seeding it still makes
+# a run reproducible (or, once bound to one, from a random stream of a
+# component: see streams.py). NumPy, if available, is used to turn a block of
+# uniforms into sizes; without it the lookup is done in pure Python
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import bisect
+import copy
+import random
+
+
+# Number of values drawn at a time, and by a sampler in its first block
+# after being reset (its blocks then double up to BLOCKSIZE, so that a
+# short run doesn't draw thousands of sizes it never uses)
+
+BLOCKSIZE = 4096
+FIRSTBLOCK = 64
+
+
+# The buffering shared by all samplers. Subclasses provide lookup(), which
+# turns a list of uniforms on [0,1) into values, and sample(), which draws
+# a NumPy array of the given shape from a NumPy RandomState
+
+class BlockSampler(object):
+
+    def __init__(self, blocksize=BLOCKSIZE):
+        self.blocksize = blocksize
+        self.rng = random
+        self._buf = []
+        self._nextblock = blocksize
+
+    # Draw the next value
+    def __call__(self):
+        try:
+            return self._buf.pop()
+        except IndexError:
+            n = self._nextblock
+            self._nextblock = min(2*n, self.blocksize)
+            self._buf = self.block(n)
+            self._buf.reverse()
+            return self._buf.pop()
+
+    # Throw away the buffered values, so that the next value is drawn from
+    # the random numbers as they are now (i.e. after they have been seeded)
+    def reset(self):
+        self._buf = []
+        self._nextblock = min(FIRSTBLOCK, self.blocksize)
+
+    # A copy of the sampler, with a buffer of its own, that draws its
+    # uniforms from rng (a streams.Stream, or the random module)
+    def bind(self, rng):
+        sampler = copy.copy(self)
+        sampler.rng = rng
+        sampler.reset()
+        return sampler
+
+    # Draw a list of n values
+    def block(self, n):
+        if self.rng is not random:
+            return self.lookup(self.rng.uniforms(n))
+        rand = random.random
+        return self.lookup([rand() for i in xrange(n)])
+
+
+# An inverse-CDF lookup table. segments is a list of (cumprob, lo, hi)
+# tuples, in increasing order of cumprob, the last of which must be 1.0.
+# A uniform u with cumprob[i-1] < u <= cumprob[i] maps to lo[i] if lo[i] ==
+# hi[i], and otherwise to the point a fraction of the way from lo[i] to
+# hi[i] given by where u falls between the two cumprobs. If rounded is set,
+# the latter values are rounded to whole numbers (e.g. bytes)
+
+class PiecewiseCDF(BlockSampler):
+
+    def __init__(self, segments, rounded=0, blocksize=BLOCKSIZE):
+        BlockSampler.__init__(self, blocksize)
+        if not segments or segments[-1][0] != 1.0:
+            raise ValueError('the last segment must end at a cumulative probability of 1.0')
+        self.segments = list(segments)
+        self.rounded = rounded
+        self.cumprobs = [seg[0] for seg in segments]
+        self.lows = [float(seg[1]) for seg in segments]
+        self.highs = [float(seg[2]) for seg in segments]
+        self.starts = [0.0] + self.cumprobs[:-1]
+        self.widths = [self.cumprobs[i] - self.starts[i] for i in range(0,len(segments))]
+        if numpy is not None:
+            self._cumprobs = numpy.array(self.cumprobs)
+            self._lows = numpy.array(self.lows, dtype=float)
+            self._highs = numpy.array(self.highs, dtype=float)
+            self._starts = numpy.array(self.starts)
+            self._widths = numpy.array(self.widths)
+
+    # Build the table from an empirical CDF, given as a list of
+    # (value, cumprob) points in increasing order. The CDF is taken to rise
+    # linearly between points; a point whose value equals the previous one
+    # is a jump, i.e. an atom at that value. The first point may have a
+    # non-zero cumprob, which is then an atom at the first value
+    def fromcdf(cls, points, rounded=0, blocksize=BLOCKSIZE):
+        segments = []
+        prevval, prevprob = points[0][0], 0.0
+        for val, prob in points:
+            if prob > prevprob:
+                segments.append((prob, prevval, val))
+            prevval, prevprob = val, prob
+        return cls(segments, rounded, blocksize)
+    fromcdf = classmethod(fromcdf)
+
+    def lookup(self, us):
+        if numpy is not None:
+            return self._lookup(numpy.array(us)).tolist()
+        cumprobs = self.cumprobs
+        values = []
+        for u in us:
+            i = bisect.bisect_left(cumprobs, u)
+            lo = self.lows[i]
+            hi = self.highs[i]
+            if lo == hi:
+                values.append(lo)
+            else:
+                val = ((u-self.starts[i])/self.widths[i])*(hi-lo)+lo
+                if self.rounded: val = round(val)
+                values.append(val)
+        return values
+
+    def sample(self, rs, shape):
+        return self._lookup(rs.uniform(0, 1, shape))
+
+    # The lookup, on an array of uniforms. round() is written as
+    # floor(x+0.5), since NumPy rounds halves to even but Python 2 rounds
+    # them away from zero (sizes are never negative)
+    def _lookup(self, us):
+        i = numpy.searchsorted(self._cumprobs, us, side='left')
+        lo = self._lows[i]
+        hi = self._highs[i]
+        val = ((us-self._starts[i])/self._widths[i])*(hi-lo)+lo
+        if self.rounded: val = numpy.floor(val+0.5)
+        return numpy.where(lo == hi, lo, val)
+
+
+# Walker's alias method over a discrete distribution, given as a list of
+# (value, weight) pairs; the weights needn't sum to 1. Every draw costs one
+# uniform and one comparison, however many distinct values there are
+
+class AliasTable(BlockSampler):
+
+    def __init__(self, histogram, blocksize=BLOCKSIZE):
+        BlockSampler.__init__(self, blocksize)
+        if not histogram:
+            raise ValueError('the histogram is empty')
+        n = len(histogram)
+        total = float(sum([weight for value, weight in histogram]))
+        self.values = [float(value) for value, weight in histogram]
+        self.probs = [1.0]*n
+        self.aliases = range(0,n)
+
+        # Split the columns into those below and above the average height,
+        # and top each short column up with part of a tall one
+        scaled = [weight*n/total for value, weight in histogram]
+        small = [i for i in range(0,n) if scaled[i] < 1.0]
+        large = [i for i in range(0,n) if scaled[i] >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.probs[s] = scaled[s]
+            self.aliases[s] = l
+            scaled[l] = scaled[l] - (1.0 - scaled[s])
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+        if numpy is not None:
+            self._values = numpy.array(self.values)
+            self._probs = numpy.array(self.probs)
+            self._aliases = numpy.array(self.aliases)
+
+    # Build the table from a list of observed values (e.g. the packet sizes
+    # of a trace), weighting each distinct value by how often it occurs
+    def fromvalues(cls, values, blocksize=BLOCKSIZE):
+        counts = {}
+        for value in values:
+            counts[value] = counts.get(value, 0) + 1
+        return cls(sorted(counts.items()), blocksize)
+    fromvalues = classmethod(fromvalues)
+
+    # Build the table from a histogram file, with one "value weight" pair
+    # per line. Blank lines and lines starting with # are skipped
+    def fromfile(cls, path, blocksize=BLOCKSIZE):
+        histogram = []
+        for line in open(path):
+            line = line.strip()
+            if not line or line.startswith('#'): continue
+            value, weight = line.split()
+            histogram.append((float(value), float(weight)))
+        return cls(histogram, blocksize)
+    fromfile = classmethod(fromfile)
+
+    def lookup(self, us):
+        if numpy is not None:
+            return self._lookup(numpy.array(us)).tolist()
+        n = len(self.values)
+        values = []
+        for u in us:
+            x = u*n
+            i = int(x)
+            if x - i < self.probs[i]:
+                values.append(self.values[i])
+            else:
+                values.append(self.values[self.aliases[i]])
+        return values
+
+    def sample(self, rs, shape):
+        return self._lookup(rs.uniform(0, 1, shape))
+
+    def _lookup(self, us):
+        x = us*len(self.values)
+        i = x.astype(int)
+        return numpy.where(x - i < self._probs[i], self._values[i],
+                           self._values[self._aliases[i]])
+
+
+# The internet mix of multiqueue.internetmix(), as a table. Given the same
+# uniform, it gives the same size (the average is about 438.5 bytes)
+
+INTERNETMIX = PiecewiseCDF([(0.50, 40.0, 40.0),
+                            (0.63, 40.0, 575.0),
+                            (0.80, 576.0, 576.0),
+                            (0.83, 576.0, 1499.0),
+                            (1.00, 1500.0, 1500.0)], rounded=1)
@@ -0,0 +1,299 @@
+# Topology config files, so that a topology and its sweep can be described
+# in a file instead of by editing multiqueue.buildsimulator.
+#
+# A config file is a JSON object:
+#
+#   {
+#     "queues":    [{"procrate": 1250000.0}],
+#     "pktgens":   [{"sizepdf": ["INTERNETMIX"],
+#                    "arrivpdf": ["expovariate", 855.1881],
+#                    "outputdest": ["QUEUE", 0]}],
+#     "probegens": [{"sizepdf": ["determ", 1500.0],
+#                    "outputdest": ["QUEUE", 0]}],
+#     "wires":     [],
+#     "simulator": {"offsettime": 0.10},
+#     "sweep":     {"iterations": 10, "iterstep": 5, "numrepeats": 1000}
+#   }
+#
+# Each component list holds objects with the parameters of the component's
+# constructor (see multiqueue.py); a component's index is its position in
+# its list. A packet generator given a "trace" (the path of a trace file,
+# relative to the config file) replays the trace instead of drawing from
+# PDFs, and takes the parameters of traces.TraceGenerator:
+#
+#     {"trace": "capture.pcap", "randomstart": 1, "outputdest": ["QUEUE", 0]}
+#
+# An outputdest is a [type, index] pair, or null for a queue whose
+# packets leave the system. A PDF is a list of a name followed by its
+# arguments:
+#   ["determ", value]
+#   ["internetmix"]                 multiqueue.internetmix
+#   ["INTERNETMIX"]                 the same mix, drawn in blocks (sampling.py)
+#   ["aliasfile", path]             a size histogram file (path relative to
+#                                   the config file)
+#   ["cdf", [[value, cumprob], ...], rounded]
+#                                   an empirical CDF (rounded is optional)
+#   ["expovariate", rate], ["uniform", a, b], ... any of the distributions
+#                                   of the random module named in RANDOMPDFS
+# The "simulator" section holds recdelays, queuestats, rngstreams, endtime
+# and offsettime, and the "sweep" section any of the script settings named
+# in multiqueue.SETTINGS; those not given take the values set in
+# multiqueue.py.
+#
+# The file is checked as it is loaded, and a ValueError names the first
+# problem found
+
+import inspect
+import json
+import os
+import random
+
+import multiqueue
+import sampling
+import traces
+
+
+# The distributions of the random module a config file can use
+
+RANDOMPDFS = ('expovariate', 'uniform', 'gauss', 'normalvariate',
+              'lognormvariate', 'paretovariate', 'weibullvariate',
+              'gammavariate', 'betavariate', 'triangular')
+
+
+# The parameters of each type of component, as (name, required, default),
+# in the order its constructor takes them (after the index)
+
+PARAMS = {
+    'queues': [('procrate', 1, None), ('outputdest', 0, None),
+               ('dropprob', 0, 0.0), ('debug', 0, 0)],
+    'pktgens': [('sizepdf', 1, None), ('arrivpdf', 1, None),
+                ('outputdest', 1, None), ('debug', 0, 0)],
+    'probegens': [('sizepdf', 1, None), ('outputdest', 1, None),
+                  ('numpkts', 0, 2), ('arrivpdf', 0, None), ('debug', 0, 0),
+                  ('gaps', 0, None), ('chirp', 0, None)],
+    'wires': [('propdelay', 1, None), ('outputdest', 1, None),
+              ('debug', 0, 0)],
+}
+
+# The parameters of a packet generator replaying a trace
+
+TRACEPARAMS = [('trace', 1, None), ('outputdest', 1, None), ('offset', 0, 0),
+               ('randomstart', 0, 0), ('loop', 0, 1), ('timescale', 0, 1.0),
+               ('debug', 0, 0)]
+
+CONSTRUCTORS = {'queues': multiqueue.Queue,
+                'pktgens': multiqueue.PacketGenerator,
+                'probegens': multiqueue.ProbeGenerator,
+                'wires': multiqueue.Wire}
+
+SIMPARAMS = ('recdelays', 'queuestats', 'rngstreams', 'endtime', 'offsettime')
+
+# What the sweep settings that default to None take when they are set (they
+# can also be null); the others take values of the type of their default,
+# a float setting any number and a tuple a list of numbers
+
+SWEEPKINDS = {
+    'dispersions': 'numbers', 'ciwidth': 'number', 'ciutilwidth': 'number',
+    'coordinator': 'string', 'authkey': 'string', 'masterseed': 'integer',
+    'checkpointspacing': 'number', 'resultdir': 'string',
+    'cachedir': 'string', 'statsfile': 'string', 'delayhist': 'numbers',
+    'disphist': 'numbers', 'profilefile': 'string', 'tracefile': 'string',
+    'tracecomponents': 'dests', 'tracetypes': 'strings',
+    'outputfile': 'string', 'longrun': 'number',
+}
+
+KINDNAMES = {'integer': 'an integer', 'number': 'a number',
+             'string': 'a string', 'numbers': 'a list of numbers',
+             'strings': 'a list of strings',
+             'dests': 'a list of [type, index] pairs'}
+
+
+# Turn a PDF of a config file into a (function, args) PDF. where says where
+# it is, for error messages; basedir is the directory of the config file
+
+def buildpdf(spec, where, basedir):
+    if not isinstance(spec, list) or not spec or not isinstance(spec[0], basestring):
+        raise ValueError('%s: a PDF must be a list of a name and its arguments, not %r' % (where, spec))
+    name, args = spec[0], spec[1:]
+    if name not in ('aliasfile', 'cdf'):
+        for arg in args:
+            if not isinstance(arg, (int, long, float)):
+                raise ValueError('%s: the arguments of %s must be numbers' % (where, name))
+
+    if name == 'determ':
+        pdf = (multiqueue.determ, tuple(args))
+    elif name == 'internetmix':
+        pdf = (multiqueue.internetmix, ())
+    elif name == 'INTERNETMIX':
+        pdf = (sampling.INTERNETMIX, ())
+    elif name == 'aliasfile':
+        if len(args) != 1 or not isinstance(args[0], basestring):
+            raise ValueError('%s: aliasfile takes the path of a histogram file' % where)
+        pdf = (sampling.AliasTable.fromfile(os.path.join(basedir, args[0])), ())
+    elif name == 'cdf':
+        if len(args) not in (1, 2) or not isinstance(args[0], list):
+            raise ValueError('%s: cdf takes a list of [value, cumprob] points, and optionally rounded' % where)
+        pdf = (sampling.PiecewiseCDF.fromcdf([tuple(point) for point in args[0]], *args[1:]), ())
+    elif name in RANDOMPDFS:
+        pdf = (getattr(random, name), tuple(args))
+    else:
+        raise ValueError('%s: unknown PDF "%s"' % (where, name))
+
+    # Check the number of arguments, so that a wrong one shows up now
+    # rather than in the middle of a sweep (without drawing, which would
+    # move on the random numbers of the runs to come)
+    low, high = numargs(pdf[0])
+    if not low <= len(pdf[1]) <= high:
+        if low == high:
+            expected = '%d' % low
+        elif high == float('inf'):
+            expected = 'at least %d' % low
+        else:
+            expected = '%d to %d' % (low, high)
+        raise ValueError('%s: %s takes %s arguments, not %d' % (where, name, expected, len(pdf[1])))
+    return pdf
+
+
+# The fewest and most arguments the function of a PDF (a function, bound
+# method or callable object) can be called with
+
+def numargs(func):
+    if not inspect.isfunction(func) and not inspect.ismethod(func):
+        func = func.__call__
+    spec = inspect.getargspec(func)
+    names = spec.args
+    if inspect.ismethod(func):
+        names = names[1:]
+    high = len(names)
+    if spec.varargs is not None:
+        high = float('inf')
+    return len(names) - len(spec.defaults or ()), high
+
+
+# Turn an outputdest of a config file into the (type, index) form
+
+def builddest(spec, where):
+    if spec is None:
+        return -1
+    if (not isinstance(spec, list) or len(spec) != 2 or
+        spec[0] not in ('QUEUE', 'WIRE') or not isinstance(spec[1], (int, long))):
+        raise ValueError('%s: an outputdest must be ["QUEUE", index], ["WIRE", index] or null, not %r' % (where, spec))
+    return (str(spec[0]), spec[1])
+
+
+# Check the value of the sweep setting "key", whose default is default
+
+def checksetting(key, value, default, where):
+    if value is None and default is None:
+        return
+    kind = SWEEPKINDS.get(key)
+    if kind is None:
+        if isinstance(default, tuple): kind = 'numbers'
+        elif isinstance(default, float): kind = 'number'
+        else: kind = 'integer'
+    number = (int, long, float)
+    if kind in ('numbers', 'strings', 'dests'):
+        if not isinstance(value, (list, tuple)):
+            bad = [value]
+        elif kind == 'numbers':
+            bad = [item for item in value if not isinstance(item, number)]
+        elif kind == 'strings':
+            bad = [item for item in value if not isinstance(item, basestring)]
+        else:
+            bad = [item for item in value
+                   if not isinstance(item, (list, tuple)) or len(item) != 2 or
+                   not isinstance(item[0], basestring) or not isinstance(item[1], (int, long))]
+    elif kind == 'integer':
+        bad = not isinstance(value, (int, long))
+    elif kind == 'number':
+        bad = not isinstance(value, number)
+    else:
+        bad = not isinstance(value, basestring)
+    if bad:
+        raise ValueError('%s: %s must be %s%s, not %r' % (where, key, KINDNAMES[kind],
+                                                        default is None and ' or null' or '', value))
+
+
+# Check the keys of a section of the file against those allowed
+
+def checkkeys(section, allowed, where):
+    if not isinstance(section, dict):
+        raise ValueError('%s must be an object' % where)
+    unknown = [key for key in section if key not in allowed]
+    if unknown:
+        raise ValueError('%s: unknown settings %s' % (where, ', '.join(sorted(unknown))))
+
+
+# Load the config file "path", returning the compiled Simulator and the
+# sweep settings (a dictionary like multiqueue.scriptsettings())
+
+def load(path):
+    try:
+        config = json.load(open(path))
+    except ValueError, e:
+        raise ValueError('%s: not valid JSON: %s' % (path, e))
+    return build(config, os.path.dirname(os.path.abspath(path)), path)
+
+
+# Build the Simulator and sweep settings from a config, already parsed.
+# Relative paths in it are taken from basedir
+
+def build(config, basedir='.', name='config'):
+    checkkeys(config, list(PARAMS) + ['simulator', 'sweep'], name)
+
+    comps = {}
+    for kind in PARAMS:
+        comps[kind] = []
+        specs = config.get(kind, [])
+        if not isinstance(specs, list):
+            raise ValueError('%s: %s must be a list' % (name, kind))
+        for i in range(0,len(specs)):
+            where = '%s: %s[%d]' % (name, kind, i)
+            params, constructor = PARAMS[kind], CONSTRUCTORS[kind]
+            if kind == 'pktgens' and isinstance(specs[i], dict) and 'trace' in specs[i]:
+                params, constructor = TRACEPARAMS, traces.TraceGenerator
+            checkkeys(specs[i], [param for param, required, default in params], where)
+            args = [i]
+            for param, required, default in params:
+                if param not in specs[i]:
+                    if required:
+                        raise ValueError('%s: %s is missing' % (where, param))
+                    value = default
+                else:
+                    value = specs[i][param]
+                if param.endswith('pdf') and value is not None:
+                    value = buildpdf(value, '%s.%s' % (where, param), basedir)
+                elif param == 'outputdest':
+                    value = builddest(value, '%s.outputdest' % where)
+                elif param == 'trace':
+                    value = os.path.join(basedir, value)
+                args.append(value)
+            try:
+                comps[kind].append(apply(constructor, args))
+            except (ValueError, IOError), e:
+                raise ValueError('%s: %s' % (where, e))
+
+    simparams = config.get('simulator', {})
+    checkkeys(simparams, SIMPARAMS, '%s: simulator' % name)
+    kwargs = dict([(str(key), value) for key, value in simparams.items()])
+    try:
+        sim = multiqueue.Simulator(comps['queues'], comps['pktgens'],
+                                   comps['probegens'], comps['wires'], **kwargs)
+    except ValueError, e:
+        raise ValueError('%s: %s' % (name, e))
+
+    sweep = config.get('sweep', {})
+    checkkeys(sweep, multiqueue.SETTINGS, '%s: sweep' % name)
+    settings = multiqueue.scriptsettings()
+    for key, value in sweep.items():
+        checksetting(key, value, settings[key], '%s: sweep' % name)
+        if isinstance(value, list): value = tuple(value)
+        settings[str(key)] = value
+    for key in ('resultdir', 'cachedir', 'statsfile', 'profilefile', 'tracefile', 'outputfile'):
+        if settings[key] is not None and key in sweep:
+            settings[key] = os.path.join(basedir, settings[key])
+    try:
+        multiqueue.checksettings(sim, settings)
+    except ValueError, e:
+        raise ValueError('%s: sweep: %s' % (name, e))
+    return sim, settings
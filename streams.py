@@ -0,0 +1,104 @@
+# Random streams of their own for the components of a simulator
+#
+# By default every random draw of a simulation comes from the random module:
+# the sizes and gaps of the cross traffic, the drop decisions of the queues
+# and the sizes of the probes all take turns on its one stream, so anything
+# that changes the draws of one component (such as a probe delaying a
+# cross-traffic packet past a drop decision) shifts those of all the others.
+# With Simulator(..., rngstreams=1), every component draws from a Stream of
+# its own instead, seeded from the seed of the run and the component's ID
+# (see Simulator.seed). What a component draws then depends on its own seed
+# alone, which is what makes common random numbers possible: runs at
+# different dispersions can be given the same cross traffic, so that the
+# difference between them is measured without the noise of the cross
+# traffic.
+#
+# A Stream is a random.Random, so the PDFs can use any of its distributions.
+# Its uniforms and exponentials are drawn a block at a time by NumPy (a
+# RandomState, the Generator API being out of reach of Python 2), and handed
+# out from a buffer, so that a draw costs a list pop rather than a call into
+# the generator and the arithmetic around it. Without NumPy the blocks are
+# drawn by the Mersenne Twister of the random.Random itself
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import math
+import random
+
+
+# Number of values drawn at a time, and in the first block after the
+# stream is seeded (its blocks then double up to BLOCKSIZE, so that a stream
+# seeded afresh for every short run draws little more than it uses)
+
+BLOCKSIZE = 4096
+FIRSTBLOCK = 64
+
+
+# A random stream. Seeding it (with any hashable value, as for random.seed)
+# seeds the random.Random, and NumPy's generator from that, and throws away
+# the values drawn in advance; getstate() and setstate() take them in too,
+# so a stream can be checkpointed part way through a block
+
+class Stream(random.Random):
+
+    blocksize = BLOCKSIZE
+
+    def seed(self, a=None):
+        random.Random.seed(self, a)
+        if numpy is not None:
+            seed = random.Random.getrandbits(self, 64)
+            self._rs = numpy.random.RandomState([seed & 0xffffffff, (seed >> 32) & 0xffffffff])
+        self._uniforms = []
+        self._exponentials = []
+        self._nextblocks = [min(FIRSTBLOCK, self.blocksize)]*2
+
+    def random(self):
+        try:
+            return self._uniforms.pop()
+        except IndexError:
+            self._uniforms = self.uniforms(self._nextblock(0))
+            return self._uniforms.pop()
+
+    def expovariate(self, lambd):
+        try:
+            return self._exponentials.pop()/lambd
+        except IndexError:
+            self._exponentials = self.exponentials(self._nextblock(1))
+            return self._exponentials.pop()/lambd
+
+    # The size of the next block of uniforms (which=0) or exponentials (1)
+    def _nextblock(self, which):
+        n = self._nextblocks[which]
+        self._nextblocks[which] = min(2*n, self.blocksize)
+        return n
+
+    # Draw lists of n uniforms on [0,1), and of n exponentials of mean 1
+    def uniforms(self, n):
+        if numpy is not None:
+            return self._rs.random_sample(n).tolist()
+        rand = random.Random.random
+        return [rand(self) for i in xrange(n)]
+
+    def exponentials(self, n):
+        if numpy is not None:
+            return self._rs.standard_exponential(n).tolist()
+        rand = random.Random.random
+        log = math.log
+        return [-log(1.0 - rand(self)) for i in xrange(n)]
+
+    def getstate(self):
+        rsstate = None
+        if numpy is not None: rsstate = self._rs.get_state()
+        return (random.Random.getstate(self), rsstate, self._uniforms[:],
+                self._exponentials[:], self._nextblocks[:])
+
+    def setstate(self, state):
+        basestate, rsstate, uniforms, exponentials, nextblocks = state
+        random.Random.setstate(self, basestate)
+        if numpy is not None: self._rs.set_state(rsstate)
+        self._uniforms = uniforms[:]
+        self._exponentials = exponentials[:]
+        self._nextblocks = nextblocks[:]
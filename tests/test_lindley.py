@@ -0,0 +1,57 @@
+# Tests of the vectorized fast path (lindley.py)
+
+import random
+import unittest
+
+import lindley
+import multiqueue
+
+
+def buildsimulator():
+    queues = [multiqueue.Queue(0, 10000000.0/8.0, outputdest=-1)]
+    pktgens = [multiqueue.PacketGenerator(0, (random.expovariate, (1/400.0,)),
+                                          (random.expovariate, (855.1881,)), ('QUEUE', 0))]
+    probegens = [multiqueue.ProbeGenerator(0, (multiqueue.determ, (1500.0,)), ('QUEUE', 0), numpkts=2)]
+    return multiqueue.Simulator(queues, pktgens, probegens)
+
+
+class ChunkTest(unittest.TestCase):
+
+    def setUp(self):
+        if lindley.numpy is None:
+            self.skipTest('the fast path needs NumPy')
+        self.maxcells = lindley.MAXCELLS
+        self.solve = lindley._solve
+        lindley.MAXCELLS = 200000
+        self.cells = []
+        def solve(sim, rs, dispersions, results, rates):
+            cols = self.solve(sim, rs, dispersions, results, rates)
+            self.cells.append(len(dispersions)*cols)
+            return cols
+        lindley._solve = solve
+
+    def tearDown(self):
+        lindley.MAXCELLS = self.maxcells
+        lindley._solve = self.solve
+
+    # Every chunk stays under MAXCELLS, over dispersions from 0 to 50s
+    # (the longest run needing some 40000 cross-traffic packets)
+    def testcellsbounded(self):
+        dispersions = [0.0]*300 + [i*0.5 for i in range(0,101)] + [0.001]*300
+        random.Random(1).shuffle(dispersions)
+        results = lindley.runbatch(buildsimulator(), dispersions, 7)
+        self.assertEqual([res.dispersion for res in results], dispersions)
+        self.assertTrue(len(self.cells) > 1)
+        self.assertTrue(max(self.cells) <= lindley.MAXCELLS, max(self.cells))
+
+    # The short runs of a batch are not padded to the length of the long
+    # ones: they are all solved in one chunk
+    def testshortrunstogether(self):
+        dispersions = [50.0] + [0.001]*500
+        lindley.runbatch(buildsimulator(), dispersions, 7)
+        self.assertEqual(len(self.cells), 2)
+        self.assertTrue(self.cells[0] < 500*200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# Tests of the result cache (resultcache.py)
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import resultcache
+
+
+class EntriesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = resultcache.ResultCache(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def makedir(self, name):
+        os.mkdir(os.path.join(self.path, name))
+        open(os.path.join(self.path, name, 'point.json'), 'w').close()
+
+    # The process ID of a process that has exited
+    def deadpid(self):
+        child = subprocess.Popen([sys.executable, '-c', 'pass'])
+        child.wait()
+        return child.pid
+
+    # Only directories named like entries are entries; stray files and
+    # directories are left alone
+    def teststraynames(self):
+        key = 'a'*40
+        self.makedir(key)
+        open(os.path.join(self.path, 'notes-old'), 'w').close()
+        self.makedir('tmp-x')
+        self.makedir('read-%s-%s-12' % (key, resultcache.HOSTNAME))
+        self.assertEqual([entry[2] for entry in self.cache.entries()], [key])
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         sorted([key, 'notes-old', 'tmp-x', 'read-%s-%s-12' % (key, resultcache.HOSTNAME)]))
+
+    # The working directories of dead processes on this host are removed,
+    # but not those of other hosts, nor of live processes
+    def testworkdirs(self):
+        key = 'b'*40
+        dead = self.deadpid()
+        mine = ['tmp-%s-%s-%d' % (key, resultcache.HOSTNAME, dead),
+                'read-%s-%s-%d-3' % (key, resultcache.HOSTNAME, dead),
+                'evict-%s-%s-%d' % (key, resultcache.HOSTNAME, dead)]
+        kept = ['tmp-%s-otherhost-%d' % (key, dead),
+                'read-%s-otherhost-%d-0' % (key, dead),
+                'tmp-%s-%s-%d' % (key, resultcache.HOSTNAME, os.getpid())]
+        for name in mine + kept:
+            self.makedir(name)
+        self.assertEqual(self.cache.entries(), [])
+        self.assertEqual(sorted(os.listdir(self.path)), sorted(kept))
+
+    def testworkdir(self):
+        key = 'c'*40
+        self.assertEqual(resultcache.workdir('read-%s-host-12-0' % key), ('host', 12))
+        self.assertEqual(resultcache.workdir('tmp-%s-host-12' % key), ('host', 12))
+        self.assertEqual(resultcache.workdir('read-%s-host-12' % key), None)
+        self.assertEqual(resultcache.workdir('tmp-%s-host-12-0' % key), None)
+        self.assertEqual(resultcache.workdir('notes-old'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# Tests of the on-disk result store (resultstore.py)
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import multiqueue
+import resultstore
+import simconfig
+
+
+def buildsimulator(endtime=-1):
+    queues = [multiqueue.Queue(0, 10000000.0/8.0, outputdest=-1)]
+    pktgens = [multiqueue.PacketGenerator(0, (multiqueue.internetmix, ()),
+                                          (random.expovariate, (855.1881,)), ('QUEUE', 0))]
+    probegens = [multiqueue.ProbeGenerator(0, (multiqueue.determ, (1500.0,)), ('QUEUE', 0), numpkts=2)]
+    return multiqueue.Simulator(queues, pktgens, probegens, endtime=endtime)
+
+
+CONFIG = {'queues': [{'procrate': 1250000.0}],
+          'pktgens': [{'sizepdf': ['internetmix'], 'arrivpdf': ['expovariate', 855.1881],
+                       'outputdest': ['QUEUE', 0]}],
+          'probegens': [{'sizepdf': ['determ', 1500.0], 'outputdest': ['QUEUE', 0]}]}
+
+
+class StoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def testroundtrip(self):
+        sim = buildsimulator()
+        runs = [sim.run(0.001*i, seed=i) for i in range(0,5)]
+        writer = resultstore.ResultWriter(self.path, chunkruns=2)
+        for res in runs:
+            writer.add(res)
+        writer.close()
+        stored = list(resultstore.readresults(self.path))
+        self.assertEqual([res.pktleave for res in stored], [res.pktleave for res in runs])
+        self.assertEqual([res.pktqgap for res in stored], [res.pktqgap for res in runs])
+
+    # A run stopped by endtime before its probes left is refused, and
+    # nothing is written
+    def testunfinishedrun(self):
+        res = buildsimulator(endtime=0.05).run(0.001, seed=1)
+        self.assertEqual(res.pktleave, [None, None])
+        writer = resultstore.ResultWriter(self.path)
+        self.assertRaises(ValueError, writer.add, res)
+        writer.close()
+        self.assertEqual(list(resultstore.readresults(self.path)), [])
+
+    # So is a config asking for a store along with an endtime
+    def testendtimeconfig(self):
+        for key in ('resultdir', 'cachedir'):
+            config = dict(CONFIG, simulator={'endtime': 0.05},
+                          sweep={key: 'results', 'masterseed': 1})
+            self.assertRaises(ValueError, simconfig.build, config, self.path)
+        config = dict(CONFIG, sweep={'resultdir': 'results'})
+        simconfig.build(config, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# Tests of the checks made as a simulator is built, from its components or
+# from a configuration file (simconfig.py)
+
+import copy
+import unittest
+
+import multiqueue
+import simconfig
+
+
+CONFIG = {'queues': [{'procrate': 1250000.0}],
+          'pktgens': [{'sizepdf': ['internetmix'], 'arrivpdf': ['expovariate', 855.1881],
+                       'outputdest': ['QUEUE', 0]}],
+          'probegens': [{'sizepdf': ['determ', 1500.0], 'outputdest': ['QUEUE', 0]}]}
+
+
+class CompileTest(unittest.TestCase):
+
+    def testloop(self):
+        queues = [multiqueue.Queue(0, 1250000.0, outputdest=('QUEUE', 0))]
+        pktgens = [multiqueue.PacketGenerator(0, (multiqueue.determ, (1500.0,)),
+                                              (multiqueue.determ, (0.01,)), ('QUEUE', 0))]
+        try:
+            multiqueue.Simulator(queues, pktgens, [])
+        except ValueError, e:
+            self.assertEqual(str(e), 'the path of PKTGEN 0 loops back to QUEUE 0')
+        else:
+            self.fail('a looping path was accepted')
+
+    def testloopconfig(self):
+        config = copy.deepcopy(CONFIG)
+        config['queues'] = [{'procrate': 1250000.0, 'outputdest': ['QUEUE', 1]},
+                            {'procrate': 1250000.0, 'outputdest': ['QUEUE', 0]}]
+        self.assertRaises(ValueError, simconfig.build, config)
+
+
+class RangeTest(unittest.TestCase):
+
+    def check(self, section, key, value, message):
+        config = copy.deepcopy(CONFIG)
+        config.setdefault(section, [{'propdelay': 0.01, 'outputdest': ['QUEUE', 0]}])
+        config[section][0][key] = value
+        try:
+            simconfig.build(config)
+        except ValueError, e:
+            self.assertEqual(str(e), 'config: %s[0]: %s' % (section, message))
+        else:
+            self.fail('%s %r was accepted' % (key, value))
+
+    def testqueue(self):
+        self.check('queues', 'procrate', 0, 'the procrate of a queue must be positive, not 0')
+        self.check('queues', 'procrate', -1250000.0,
+                   'the procrate of a queue must be positive, not -1250000.0')
+        self.check('queues', 'dropprob', 1.5,
+                   'the dropprob of a queue must be between 0 and 1, not 1.5')
+        self.check('queues', 'dropprob', -0.1,
+                   'the dropprob of a queue must be between 0 and 1, not -0.1')
+
+    def testwire(self):
+        self.check('wires', 'propdelay', -0.01, 'the propdelay of a wire cannot be negative (-0.01)')
+
+
+class SweepTest(unittest.TestCase):
+
+    def build(self, **sweep):
+        config = copy.deepcopy(CONFIG)
+        config['sweep'] = sweep
+        return simconfig.build(config)[1]
+
+    def check(self, key, value, message):
+        try:
+            self.build(**{key: value})
+        except ValueError, e:
+            self.assertEqual(str(e), 'config: sweep: %s' % message)
+        else:
+            self.fail('%s %r was accepted' % (key, value))
+
+    def testtypes(self):
+        self.check('numrepeats', 'lots', "numrepeats must be an integer, not 'lots'")
+        self.check('numrepeats', 2.5, 'numrepeats must be an integer, not 2.5')
+        self.check('window', '1', "window must be a number, not '1'")
+        self.check('statquantiles', 0.5, 'statquantiles must be a list of numbers, not 0.5')
+        self.check('dispersions', [0.001, 'x'],
+                   "dispersions must be a list of numbers or null, not [0.001, 'x']")
+        self.check('masterseed', 1.5, 'masterseed must be an integer or null, not 1.5')
+        self.check('outputfile', 1, 'outputfile must be a string or null, not 1')
+        self.check('tracecomponents', [['QUEUE']],
+                   "tracecomponents must be a list of [type, index] pairs or null, not [['QUEUE']]")
+
+    def testvalues(self):
+        settings = self.build(numrepeats=10, window=2, dispersions=[0.001, 0.002],
+                              masterseed=None, tracecomponents=[['QUEUE', 0]],
+                              tracetypes=['PROBE'])
+        self.assertEqual(settings['numrepeats'], 10)
+        self.assertEqual(settings['dispersions'], (0.001, 0.002))
+        self.assertEqual(settings['masterseed'], None)
+
+
+if __name__ == '__main__':
+    unittest.main()
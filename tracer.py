@@ -0,0 +1,338 @@
+# Event tracing: a fixed-size binary record of every event of the runs, kept
+# in a preallocated ring buffer, for looking into what the simulator did
+# without the cost of the debug output (which formats and prints a line per
+# event, and is too slow to leave on for a whole sweep)
+#
+# A Tracer is attached to a simulator with sim.tracer = Tracer(sim, ...).
+# The event loop then wraps the handlers of the traced components (see
+# Simulator._handlers) so that each event is packed into the next record of
+# the ring with struct; components that are not traced keep their handlers
+# as they are, and with no tracer attached (the default) nothing changes at
+# all. Once the ring is full, the oldest records are overwritten, so that a
+# trace always holds the last numrecords events.
+# The ring is a bytearray, or, if a path is given, a file mapped into memory
+# with mmap, which is filled in as the runs go (and so survives the process
+# being killed part way through).
+#
+# The events recorded, by kind:
+#   ARRIVE:  a packet joins a queue, or gets onto a wire
+#   DEPART:  a packet leaves a component for the next one (or, for a
+#            generator, enters the network)
+#   DROP:    a packet that left a queue was dropped (following its DEPART)
+#   LEAVE:   a packet leaves the system from a queue
+#   RUN:     a run starts; events from then on belong to it
+# Every record is RECORD: a little-endian uint64 sequence number (counting
+# from 1, and 0 for a record not yet written), float64 time, int64 packet
+# serial, uint16 component ID (its position in sim.components()), uint8
+# kind, uint8 set for a probe packet, and uint32 queue length (the number of
+# packets at the queue once the event is over; 0 for other components).
+# A RUN record holds the run's number in place of the serial and its
+# dispersion in place of the time (NaN for a trajectory segment of
+# checkpoints or a long run), with component RUNCOMPONENT.
+# A trace file is the 8-byte magic TRACEMAGIC, a HEADER of the record size,
+# the number of records and the length of a JSON object naming the
+# components, that JSON, padded to a whole number of records, then the ring.
+#
+#   python tracer.py trace.bin
+#   python tracer.py --packet serial trace.bin
+#   python tracer.py --summary trace.bin
+#
+# lists the events of a trace in order (or those of one packet), or sums
+# them up by component: the events of each kind, the longest queue and the
+# time packets spent at each component
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import itertools
+import json
+import mmap
+import struct
+import sys
+
+import multiqueue
+import onlinestats
+
+
+# Number of records kept by default
+
+NUMRECORDS = 1000000
+
+TRACEMAGIC = 'MQEVENT1'
+HEADER = struct.Struct('<III')
+RECORD = struct.Struct('<QdqHBBI')
+
+ARRIVE, DEPART, DROP, LEAVE, RUN = range(0,5)
+KINDNAMES = ('ARRIVE', 'DEPART', 'DROP', 'LEAVE', 'RUN')
+
+RUNCOMPONENT = 0xffff
+
+
+# The offset of the first record of a trace whose JSON is metalen bytes long
+
+def headersize(metalen):
+    size = len(TRACEMAGIC) + HEADER.size + metalen
+    return (size + RECORD.size - 1)//RECORD.size*RECORD.size
+
+
+# A ring of numrecords events of the runs of sim, in memory or, if path is
+# given, in that file.
+# components: if given, only the components listed (as (type, index) pairs,
+#             like an outputdest) are traced
+# types: if given, only the packets of the types listed (PROBE, NONPROBE)
+#        are traced
+
+class Tracer(object):
+
+    def __init__(self, sim, numrecords=NUMRECORDS, path=None, components=None, types=None):
+        if numrecords < 1:
+            raise ValueError('a trace needs room for at least one record')
+        if len(sim.components()) >= RUNCOMPONENT:
+            raise ValueError('too many components to trace')
+        self.numrecords = numrecords
+        self.path = path
+        self.components = None
+        if components is not None:
+            self.components = set([tuple(comp) for comp in components])
+        self.types = None
+        if types is not None:
+            self.types = tuple(types)
+        self.runs = 0
+
+        names = ['%s %d' % (comp.type, comp.index) for comp in sim.components()]
+        meta = json.dumps({'components': names})
+        self.header = headersize(len(meta))
+        size = self.header + numrecords*RECORD.size
+        if path is None:
+            self._file = None
+            self.buf = bytearray(size)
+        else:
+            self._file = open(path, 'w+b')
+            self._file.truncate(size)
+            self.buf = mmap.mmap(self._file.fileno(), size)
+        head = TRACEMAGIC + HEADER.pack(RECORD.size, numrecords, len(meta)) + meta
+        self.buf[:len(head)] = head
+        self._nextseq = itertools.count(1).next
+
+    # Pack an event into the next record of the ring. The handlers built by
+    # arrival and departure do the same inline, saving a call per event
+    def record(self, time, serial, component, kind, probe, length):
+        seq = self._nextseq()
+        RECORD.pack_into(self.buf, self.header + (seq - 1) % self.numrecords*RECORD.size,
+                         seq, time, serial, component, kind, probe, length)
+
+    # Whether the events of the component of the given type and index are
+    # traced
+    def traces(self, type, index):
+        return self.components is None or (type, index) in self.components
+
+    # Note the start of a run at the given dispersion (None for a trajectory
+    # segment or a long run)
+    def startrun(self, dispersion=None):
+        if dispersion is None:
+            dispersion = float('nan')
+        self.record(float(dispersion), self.runs, RUNCOMPONENT, RUN, 0, 0)
+        self.runs += 1
+
+    # Wrap the handler of the arrival of a packet at component id (a queue,
+    # or a wire if queue is None) so that the arrival is recorded once the
+    # packet has joined the queue
+    def arrival(self, id, arrive, queue=None):
+        pack, buf, header, numrecords, size = RECORD.pack_into, self.buf, self.header, self.numrecords, RECORD.size
+        nextseq = self._nextseq
+        types = self.types
+        PROBE = multiqueue.PROBE
+
+        def traced(pkt, now):
+            arrive(pkt, now)
+            if types is None or pkt.type in types:
+                seq = nextseq()
+                pack(buf, header + (seq - 1) % numrecords*size, seq, now, pkt.serial, id,
+                     ARRIVE, pkt.type == PROBE, queue._numinqueue_)
+
+        def tracedwire(pkt, now):
+            arrive(pkt, now)
+            if types is None or pkt.type in types:
+                seq = nextseq()
+                pack(buf, header + (seq - 1) % numrecords*size, seq, now, pkt.serial, id,
+                     ARRIVE, pkt.type == PROBE, 0)
+
+        if queue is None:
+            return tracedwire
+        return traced
+
+    # Wrap the handler of a packet leaving component id so that the
+    # departure is recorded before the packet moves on (and so before its
+    # arrival at the next component), as LEAVE if it leaves the system. If
+    # the component is a queue that drops packets, a packet still there
+    # after the handler has been dropped
+    def departure(self, id, depart, queue=None, leaves=0, drops=0):
+        pack, buf, header, numrecords, size = RECORD.pack_into, self.buf, self.header, self.numrecords, RECORD.size
+        nextseq = self._nextseq
+        record = self.record
+        types = self.types
+        kind = leaves and LEAVE or DEPART
+        PROBE = multiqueue.PROBE
+
+        def traced(pkt, now):
+            if types is None or pkt.type in types:
+                length = 0
+                if queue is not None: length = queue._numinqueue_ - 1
+                seq = nextseq()
+                pack(buf, header + (seq - 1) % numrecords*size, seq, now, pkt.serial, id,
+                     kind, pkt.type == PROBE, length)
+                depart(pkt, now)
+                if drops and pkt.location == id:
+                    record(now, pkt.serial, id, DROP, pkt.type == PROBE, length)
+            else:
+                depart(pkt, now)
+
+        return traced
+
+    # The component names and records of the trace so far (see decode)
+    def decode(self):
+        return decode(self.buf)
+
+    # Write the trace so far to "path", as a trace file
+    def save(self, path):
+        f = open(path, 'wb')
+        f.write(self.buf)
+        f.close()
+
+    def close(self):
+        if self._file is not None:
+            self.buf.flush()
+            self.buf.close()
+            self._file.close()
+            self._file = None
+
+
+# The component names and the records of a trace held in buf (a string,
+# bytearray or mmap), the records as tuples of the fields of RECORD, from
+# the oldest event on
+
+def decode(buf):
+    if str(buf[:len(TRACEMAGIC)]) != TRACEMAGIC:
+        raise ValueError('not an event trace')
+    recsize, numrecords, metalen = HEADER.unpack_from(buf, len(TRACEMAGIC))
+    if recsize != RECORD.size:
+        raise ValueError('the records of the trace are %d bytes, not %d' % (recsize, RECORD.size))
+    start = len(TRACEMAGIC) + HEADER.size
+    names = json.loads(str(buf[start:start+metalen]))['components']
+    header = headersize(metalen)
+    numrecords = min(numrecords, (len(buf) - header)//RECORD.size)
+
+    if numpy is not None:
+        view = numpy.frombuffer(buf, dtype=[('seq', '<u8'), ('time', '<f8'), ('serial', '<i8'),
+                                            ('component', '<u2'), ('kind', 'u1'), ('probe', 'u1'),
+                                            ('length', '<u4')],
+                                count=numrecords, offset=header)
+        view = view[view['seq'] != 0]
+        records = view[numpy.argsort(view['seq'], kind='mergesort')].tolist()
+    else:
+        unpack = RECORD.unpack_from
+        records = [unpack(buf, header + k*RECORD.size) for k in range(0,numrecords)]
+        records = [rec for rec in records if rec[0]]
+        records.sort()
+    return names, records
+
+
+# The component names and records of the trace file "path"
+
+def read(path):
+    f = open(path, 'rb')
+    try:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+    try:
+        return decode(buf)
+    finally:
+        buf.close()
+
+
+# Write the records to out, a line per event (only those of the packet with
+# the given serial, and the runs, if serial is given)
+
+def listevents(names, records, out, serial=None):
+    for seq, time, pktserial, component, kind, probe, length in records:
+        if kind == RUN:
+            if time != time:
+                out.write("RUN %d\n" % pktserial)
+            else:
+                out.write("RUN %d dispersion %.10g\n" % (pktserial, time))
+        elif serial is None or pktserial == serial:
+            out.write("%.10f %s %s %s packet %d length %d\n"
+                      % (time, names[component], KINDNAMES[kind],
+                         probe and multiqueue.PROBE or multiqueue.NONPROBE, pktserial, length))
+
+
+# Write a summary of the records to out: for every component traced, the
+# number of events of each kind, the longest the queue got, and the time
+# probes and other packets spent there (from arrival to departure, for
+# those whose arrival is in the trace)
+
+def summarize(names, records, out):
+    counts = {}
+    maxlength = {}
+    stays = {}
+    arrived = {}
+    runs = 0
+    for seq, time, serial, component, kind, probe, length in records:
+        if kind == RUN:
+            runs += 1
+            arrived.clear()
+            continue
+        if component not in counts:
+            counts[component] = [0]*len(KINDNAMES)
+            maxlength[component] = 0
+            stays[component] = (onlinestats.Moments(), onlinestats.Moments())
+        counts[component][kind] += 1
+        if length > maxlength[component]: maxlength[component] = length
+        if kind == ARRIVE:
+            arrived[(component, serial)] = time
+        elif kind != DROP:
+            since = arrived.pop((component, serial), None)
+            if since is not None:
+                stays[component][probe].add(time - since)
+
+    if records:
+        out.write("TRACE %d events (%d to %d), %d runs\n" % (len(records) - runs, records[0][0], records[-1][0], runs))
+        if records[0][0] > 1:
+            out.write("    the first %d events were overwritten\n" % (records[0][0] - 1))
+    else:
+        out.write("TRACE empty\n")
+    for component in sorted(counts):
+        out.write("%s: %s maxlength %d\n" % (names[component],
+                                             " ".join(["%s %d" % (KINDNAMES[kind].lower(), counts[component][kind])
+                                                       for kind in (ARRIVE, DEPART, DROP, LEAVE)]),
+                                             maxlength[component]))
+        for probe in (0, 1):
+            m = stays[component][probe]
+            if m.count:
+                out.write("    stay (%s) n=%d mean=%.6g sd=%.3g max=%.6g\n"
+                          % (probe and multiqueue.PROBE or multiqueue.NONPROBE, m.count, m.mean, m.stddev(), m.max))
+
+
+def main(args):
+    summary = args[:1] == ['--summary']
+    if summary: args = args[1:]
+    serial = None
+    if args[:1] == ['--packet'] and len(args) == 3:
+        serial = int(args[1])
+        args = args[2:]
+    if len(args) != 1:
+        print >>sys.stderr, "usage: python tracer.py [--summary | --packet serial] trace.bin"
+        return 1
+    names, records = read(args[0])
+    if summary:
+        summarize(names, records, sys.stdout)
+    else:
+        listevents(names, records, sys.stdout, serial)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,321 @@
+# Trace-driven cross traffic: packet arrival times and sizes replayed from a
+# capture, rather than drawn from PDFs
+#
+# Two formats of trace file are read, told apart by their first bytes:
+#
+#   pcap:    a libpcap capture (microsecond or nanosecond timestamps, either
+#            byte order). A packet's size is its length on the wire, as
+#            recorded in its header, whatever was captured of it
+#   binary:  the compact format written by writetrace: the 8-byte magic
+#            BINARYMAGIC, 8 reserved bytes, then a little-endian float64
+#            time (in seconds) and uint32 size (in bytes) for every packet
+#
+# A trace is mapped into memory with mmap and decoded a block of BLOCKSIZE
+# packets at a time, so that only the blocks in use are ever read in,
+# however large the file. Binary traces are decoded through a NumPy view of
+# the mapping, if NumPy is available (and with struct otherwise); a pcap
+# trace is walked record by record, keeping the file offset of every
+# BLOCKSIZE-th packet so that it can be entered again part way through.
+#
+# A TraceGenerator is a packet generator that replays a trace: each packet
+# it makes has the size of the next packet of the trace, and follows the
+# previous one by the time between them in the trace. Every run starts at
+# packet "offset" of the trace, or, with randomstart, at a packet drawn
+# from the generator's source of random numbers (so that the replications
+# of a sweep see different stretches of the trace, and a seeded run is
+# still reproducible). At the end of the trace, replay wraps around to the
+# start if loop is set, and otherwise the generator falls silent.
+#
+#   python traces.py capture.pcap trace.bin
+#
+# converts a capture to the binary format, which is smaller and quicker to
+# decode
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import mmap
+import os
+import struct
+import sys
+
+import multiqueue
+
+
+# Number of packets decoded at a time
+
+BLOCKSIZE = 4096
+
+BINARYMAGIC = 'MQTRACE1'
+BINARYHEADER = 16
+BINARYRECORD = struct.Struct('<dI')
+
+# The first four bytes of a pcap file, as written on little- and big-endian
+# machines, and whether the timestamps are in nanoseconds
+
+PCAPMAGICS = {'\xd4\xc3\xb2\xa1': ('<', 0), '\xa1\xb2\xc3\xd4': ('>', 0),
+              '\x4d\x3c\xb2\xa1': ('<', 1), '\xa1\xb2\x3c\x4d': ('>', 1)}
+PCAPHEADER = 24
+
+
+# Map the file "path" into memory, read-only
+
+def mapfile(path):
+    f = open(path, 'rb')
+    try:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError('%s is empty' % path)
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+
+
+# A trace in the binary format. block(k) gives the times and sizes of the
+# packets of block k, as two lists
+
+class BinaryTrace(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.map = mapfile(path)
+        if self.map[:8] != BINARYMAGIC:
+            raise ValueError('%s is not a binary trace' % path)
+        self.numpkts = (len(self.map) - BINARYHEADER)/BINARYRECORD.size
+        if numpy is not None:
+            self._view = numpy.frombuffer(self.map, dtype=[('time', '<f8'), ('size', '<u4')],
+                                          count=self.numpkts, offset=BINARYHEADER)
+
+    def block(self, k):
+        first = k*BLOCKSIZE
+        count = min(BLOCKSIZE, self.numpkts - first)
+        if count <= 0:
+            return [], []
+        if numpy is not None:
+            records = self._view[first:first+count]
+            return records['time'].tolist(), records['size'].astype(float).tolist()
+        fields = struct.unpack_from('<' + 'dI'*count, self.map, BINARYHEADER + first*BINARYRECORD.size)
+        return list(fields[0::2]), [float(size) for size in fields[1::2]]
+
+    def close(self):
+        self._view = None
+        self.map.close()
+
+
+# A trace in pcap format. The number of packets is only known once the whole
+# file has been walked, so numpkts is None until then (see count())
+
+class PcapTrace(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.map = mapfile(path)
+        try:
+            order, nanosecs = PCAPMAGICS[self.map[:4]]
+        except KeyError:
+            raise ValueError('%s is not a pcap file (pcapng is not supported)' % path)
+        if len(self.map) < PCAPHEADER:
+            raise ValueError('%s is truncated' % path)
+        self.header = struct.Struct(order + 'IIII')
+        self.fraction = nanosecs and 1e-9 or 1e-6
+        self.offsets = [PCAPHEADER]     # file offset of every block
+        self.numpkts = None
+
+    def block(self, k):
+        while k >= len(self.offsets) and self.numpkts is None:
+            self._walk(len(self.offsets) - 1)
+        if k >= len(self.offsets):
+            return [], []
+        return self._walk(k)
+
+    # Decode block k, whose file offset is known, noting the offset of the
+    # next block (or the number of packets, at the end of the file)
+    def _walk(self, k):
+        data = self.map
+        unpack = self.header.unpack_from
+        fraction = self.fraction
+        end = len(data)
+        pos = self.offsets[k]
+        times = []
+        sizes = []
+        while len(times) < BLOCKSIZE and pos + 16 <= end:
+            secs, frac, caplen, wirelen = unpack(data, pos)
+            times.append(secs + frac*fraction)
+            sizes.append(float(wirelen))
+            pos += 16 + caplen
+        if len(times) == BLOCKSIZE and pos + 16 <= end:
+            if k + 1 == len(self.offsets):
+                self.offsets.append(pos)
+        elif self.numpkts is None:
+            self.numpkts = k*BLOCKSIZE + len(times)
+        return times, sizes
+
+    # The number of packets, walking the rest of the file if need be
+    def count(self):
+        while self.numpkts is None:
+            self._walk(len(self.offsets) - 1)
+        return self.numpkts
+
+    def close(self):
+        self.map.close()
+
+
+# Open the trace file "path", in whichever format it is
+
+def opentrace(path):
+    f = open(path, 'rb')
+    magic = f.read(8)
+    f.close()
+    if magic == BINARYMAGIC:
+        return BinaryTrace(path)
+    return PcapTrace(path)
+
+
+# The number of packets of a trace, of either kind
+
+def numpackets(trace):
+    if trace.numpkts is None:
+        return trace.count()
+    return trace.numpkts
+
+
+# Write the packets given as (time, size) pairs to "path" in the binary
+# format, a block at a time
+
+def writetrace(path, packets):
+    f = open(path + '.tmp', 'wb')
+    f.write(BINARYMAGIC + '\0'*(BINARYHEADER - len(BINARYMAGIC)))
+    buf = []
+    for time, size in packets:
+        buf.append(BINARYRECORD.pack(time, int(size)))
+        if len(buf) == BLOCKSIZE:
+            f.write(''.join(buf))
+            buf = []
+    f.write(''.join(buf))
+    f.close()
+    os.rename(path + '.tmp', path)
+
+
+# Every packet of a trace, as (time, size) pairs
+
+def packets(trace):
+    k = 0
+    while 1:
+        times, sizes = trace.block(k)
+        if not times:
+            return
+        for i in range(0,len(times)):
+            yield times[i], sizes[i]
+        k += 1
+
+
+# PKTGEN parameters, besides those of a PacketGenerator:
+# trace: the trace file to replay (or a trace opened with opentrace)
+# offset: the packet of the trace each run starts at
+# randomstart: if set, each run starts at a packet drawn uniformly from the
+#              whole trace instead
+# loop: if set, wrap around to the start of the trace at its end; otherwise
+#       the generator makes no more packets
+# timescale: the times between packets are multiplied by this (e.g. 0.5
+#            to replay the trace at twice the rate)
+# The sizepdf and arrivpdf of the generator read the trace, each keeping
+# its own place in it, so that they stay in step whatever order they are
+# called in. The time before the first packet of the trace is the mean time
+# between the packets of its first block; times that go backwards in the
+# trace count as 0
+
+class TraceGenerator(multiqueue.PacketGenerator):
+
+    def __init__(self, index, trace, outputdest, offset=0, randomstart=0,
+                 loop=1, timescale=1.0, debug=0):
+        if isinstance(trace, basestring):
+            trace = opentrace(trace)
+        self.trace = trace
+        self.offset = offset
+        self.randomstart = randomstart
+        self.loop = loop
+        self.timescale = timescale
+        if offset and offset >= numpackets(trace):
+            raise ValueError('%s has only %d packets, so it cannot start at packet %d' % (trace.path, numpackets(trace), offset))
+        times = trace.block(0)[0]
+        if len(times) < 2:
+            raise ValueError('%s has fewer than two packets' % trace.path)
+        self.meangap = max(times[-1] - times[0], 0.0)/(len(times) - 1)
+        self._blocks = {}
+        multiqueue.PacketGenerator.__init__(self, index, (self.nextsize, ()),
+                                            (self.nextgap, ()), outputdest,
+                                            debug)
+
+    def reset(self):
+        self._emitted_ = 0
+        if self.randomstart:
+            start = self.rng.randrange(numpackets(self.trace))
+        else:
+            start = self.offset
+        self._sizepos = start
+        self._gappos = start
+
+    def getstate(self):
+        return (self._emitted_, self._sizepos, self._gappos)
+
+    def setstate(self, state):
+        self._emitted_, self._sizepos, self._gappos = state
+
+    # The times, sizes and times since the previous packet of block k of
+    # the trace, keeping the last few blocks decoded
+    def _block(self, k):
+        try:
+            return self._blocks[k]
+        except KeyError:
+            pass
+        times, sizes = self.trace.block(k)
+        if times:
+            if k == 0:
+                prev = times[0] - self.meangap
+            elif k-1 in self._blocks:
+                prev = self._blocks[k-1][0][-1]
+            else:
+                prev = self.trace.block(k-1)[0][-1]
+            scale = self.timescale
+            gaps = [max(t - p, 0.0)*scale for p, t in zip([prev] + times[:-1], times)]
+        else:
+            gaps = []
+        if len(self._blocks) >= 4:
+            self._blocks.clear()
+        self._blocks[k] = (times, sizes, gaps)
+        return self._blocks[k]
+
+    # The packet at position pos, as (block, index in block, position),
+    # wrapping around to position 0 at the end of the trace, or giving a
+    # block of None there if the trace isn't looped
+    def _find(self, pos):
+        k, i = divmod(pos, BLOCKSIZE)
+        block = self._block(k)
+        if i < len(block[0]):
+            return block, i, pos
+        if not self.loop:
+            return None, 0, pos
+        block = self._block(0)
+        return block, 0, 0
+
+    def nextsize(self):
+        block, i, pos = self._find(self._sizepos)
+        if block is None:
+            return 0.0
+        self._sizepos = pos + 1
+        return block[1][i]
+
+    def nextgap(self):
+        block, i, pos = self._find(self._gappos)
+        if block is None:
+            return float('inf')
+        self._gappos = pos + 1
+        return block[2][i]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print >>sys.stderr, "usage: python traces.py capture.pcap trace.bin"
+        sys.exit(1)
+    writetrace(sys.argv[2], packets(opentrace(sys.argv[1])))